@@ -1,52 +1,281 @@
 # === web handler ===
 # utilities for the web handler
-from fastapi import FastAPI # for web requests
+from fastapi import FastAPI, Request, HTTPException # for web requests
 from pydantic import BaseModel # for data validation
-from fastapi.responses import FileResponse # for file responses
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, JSONResponse, Response # for file, streamed, text and status responses
+from contextlib import asynccontextmanager # for the startup of the app
 import os # for file handling
+import json # for the streamed events
+import time # for request timing
+import uuid # for trace ids
+import hashlib # for the etag of the pdfs
+import shutil # for discarding failed uploads
+import anyio # for writing the uploads without blocking the event loop
+from fastapi.concurrency import run_in_threadpool # for the blocking filesystem calls of async handlers
 
 # === agent ===
 # custom agent class
-from utils.agent import dummy_agent #agent class
+from utils.agent import dummy_agent, get_rag, use_rag, rag_is_ready, rag_status, warm_up_rag_in_background #agent class and its lazy RAG
+from utils.agent import collections # named document collections
+from utils.collection_registry import DEFAULT_COLLECTION, validate_name
 
-# agent initialization
+# === instrumentation ===
+from utils import metrics # span histograms and prometheus rendering
+
+# === ingestion jobs ===
+from utils.jobs import IngestionJobs # background queue of uploaded pdfs
+
+# agent initialization (the RAG is not built here: it is warmed up in background or on first use)
 agent = dummy_agent()
 
+# uploaded pdfs are indexed one at a time in a background thread (parsing in a worker process)
+MAX_UPLOAD_BYTES = int(float(os.getenv("AGENT_MAX_UPLOAD_MB", "200")) * 2**20)
+def _ingest(path, progress, collection=DEFAULT_COLLECTION):
+    """indexes an uploaded pdf, keeping its collection loaded for the whole job"""
+    with use_rag(collection) as rag:
+        return rag.add_new_pdf(path, progress=progress, isolate_parsing=True)
+
+ingestion_jobs = IngestionJobs(ingest=_ingest, upload_folder=os.path.join("local_rag", "uploads"))
+
+# 'background' warms the RAG at startup, 'lazy' builds it on the first request that needs it
+WARMUP = os.getenv("AGENT_WARMUP", "background")
+PROCESS_START = metrics.process_start_time()
+STARTUP = metrics.REGISTRY.gauge("agent_startup_seconds", "Seconds from process start until the service was healthy/ready")
+startup_times = {"time_to_healthy_s": None, "time_to_ready_s": None}
+
+def _mark(phase):
+    """records the seconds since the process started until a startup phase"""
+    seconds = time.time() - PROCESS_START
+    startup_times[f"time_to_{phase}_s"] = seconds
+    STARTUP.set(seconds, phase=phase)
+    print(f"Agente {phase} en {seconds:.2f} s")
+
+@asynccontextmanager
+async def lifespan(app):
+    _mark("healthy")
+    if WARMUP == "background":
+        warm_up_rag_in_background(on_ready=lambda: _mark("ready"))
+    yield
+
 # web handler initialization
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+if metrics.ENABLED:
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        """times every request and returns its trace id and span breakdown in the headers"""
+        trace_id = request.headers.get("X-Trace-Id") or uuid.uuid4().hex
+        trace = []
+        token = metrics.current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            metrics.current_trace.reset(token)
+        # La plantilla de la ruta (/jobs/{job_id}), no la url: una serie por endpoint y no por id o 404
+        route = request.scope.get("route")
+        metrics.observe_span("http", time.perf_counter() - start, path=route.path if route is not None else "unmatched")
+        response.headers["X-Trace-Id"] = trace_id
+        if trace:
+            response.headers["Server-Timing"] = metrics.server_timing(trace)
+        return response
 
 # Define the shape of the data we expect
 class Query(BaseModel):
     text: str
     User_id: str = "default_user"
+    collection: str = DEFAULT_COLLECTION # collection the searches run on
+    files: list[str] | None = None # optional pdfs of the collection the searches are restricted to
+
+class NewCollection(BaseModel):
+    name: str
+    hnsw: dict | None = None # optional HNSW parameters of its vectors (space, M, construction_ef, search_ef)
+
+def _check_collection(name):
+    """raises a 404 if a collection does not exist"""
+    if not collections.exists(name):
+        raise HTTPException(status_code=404, detail=f"collection {name!r} not found")
+
+def _scope_of(query):
+    """returns the scope of a query for the agent (None when it searches the whole default collection)"""
+    _check_collection(query.collection)
+    if query.collection == DEFAULT_COLLECTION and query.files is None:
+        return None
+    return {"collection": query.collection, "files": query.files}
 
 @app.get("/")
 def read_root():
     return {"status": "Online", "message": "FastAPI is running correctly inside Docker "}
 
+@app.get("/ready")
+def read_ready():
+    """readiness probe: 503 until the embedding model, vector store and page store are warm"""
+    ready = rag_is_ready() or WARMUP == "lazy"
+    body = {"ready": ready, "warmup": WARMUP, "rag": dict(rag_status), **startup_times}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.post("/search")
-def run_search(query: Query):
+async def run_search(query: Query):
 
-    # Here you would call your LocalRAGAgent
-    agent_message = agent.run_chat(
+    # async path: the event loop keeps serving other users while this one waits on Gemini/tools
+    agent_message = await agent.arun_chat(
         user_input= query.text, 
-        user_name= query.User_id
+        user_name= query.User_id,
+        scope= _scope_of(query)
         )
 
     return {
         "message": agent_message
     }
 
+@app.post("/search/stream")
+async def run_search_stream(query: Query):
+    """streams the answer as server-sent events (tokens, tool progress and the final answer)"""
+    scope = _scope_of(query)
+
+    async def event_stream():
+        try:
+            async for event in agent.astream_chat(user_input= query.text, user_name= query.User_id, scope= scope):
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'content': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/documents", status_code=202)
+async def upload_document(filename: str, request: Request, collection: str = DEFAULT_COLLECTION):
+    """uploads a pdf (raw body) to a collection and queues its ingestion
+
+    The body is streamed to disk, the job is queued and the answer returns at
+    once: poll /jobs/{id} for its progress. Searches keep serving the previous
+    index until the job commits.
+    """
+    filename = os.path.basename(filename).replace(' ', '_')
+    if not filename.lower().endswith(".pdf") or filename.startswith("."):
+        raise HTTPException(status_code=400, detail="filename must be the name of a .pdf file")
+    _check_collection(collection)
+
+    job_id = ingestion_jobs.new_id()
+    # El disco se toca desde hilos del pool: un disco lento no frena al resto de peticiones
+    path = await run_in_threadpool(ingestion_jobs.staging_path, job_id, filename)
+    size = 0
+    try:
+        async with await anyio.open_file(path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"the pdf is larger than {MAX_UPLOAD_BYTES // 2**20} MiB")
+                await f.write(chunk)
+        async with await anyio.open_file(path, "rb") as f:
+            if await f.read(5) != b"%PDF-":
+                raise HTTPException(status_code=415, detail="the body is not a pdf")
+    except BaseException:
+        # Protegido: si el cliente se desconecta (cancelación) el borrado debe terminar igual
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        raise
+
+    job = ingestion_jobs.submit(job_id, path, collection=collection)
+    return JSONResponse(job, status_code=202, headers={"Location": f"/jobs/{job_id}"})
+
+@app.get("/jobs")
+def list_jobs():
+    """returns the latest ingestion jobs, newest first"""
+    return {"jobs": ingestion_jobs.list(), "pending": ingestion_jobs.pending()}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """returns the state and progress of an ingestion job"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+@app.get("/collections")
+def list_collections():
+    """returns every collection, the ones loaded in memory and the load/unload counters"""
+    return collections.stats()
+
+@app.post("/collections", status_code=201)
+def create_collection(body: NewCollection):
+    """creates an empty collection (upload its pdfs with POST /documents?collection=<name>)"""
+    try:
+        validate_name(body.name)
+        config = collections.create(body.name, body.hnsw)
+    except FileExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"name": body.name, **config}
+
+@app.get("/metrics")
+def get_metrics():
+    """prometheus metrics of the hot paths (embedding, chroma, llm, tools and handlers)"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+def get_stats():
+    """returns the hit rate and saved time of the retrieval and answer caches and the latency of each search mode"""
+    answer_cache = agent.answer_cache.stats() if agent.answer_cache is not None else None
+    if not rag_is_ready():
+        return {"caches": {}, "search": {}, "rag": dict(rag_status), "collections": collections.stats(),
+                "answer_cache": answer_cache}
+    rag = get_rag()
+    return {
+        "caches": rag.cache_stats(),
+        "search": rag.search_stats(),
+        "collections": collections.stats(),
+        "answer_cache": answer_cache,
+        "failed_files": dict(rag.failed_files),
+    }
+
+PDF_CACHE_CONTROL = "no-cache" # the browser may keep the pdf but must revalidate it (a 304 when unchanged)
+
+def _pdf_etag(stat):
+    """strong etag of a pdf from its size and modification time"""
+    return '"' + hashlib.sha256(f"{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest()[:32] + '"'
+
+def _etag_matches(if_none_match, etag):
+    """checks an If-None-Match header against an etag (weak comparison, as RFC 9110 asks for)"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
 @app.get("/get-pdf")
-async def get_pdf(file_name: str):
-    pdf_path = "local_rag/pdf_files/" + file_name # Ruta al PDF en el contenedor del agente
-    
-    if os.path.exists(pdf_path):
-        # Retorna el archivo con el tipo de contenido correcto
-        return FileResponse(
-            path= pdf_path, 
-            media_type= 'application/pdf', 
-            filename= file_name + ".pdf"
-        )
-    return {"error": "Archivo no encontrado"}
+async def get_pdf(file_name: str, request: Request, collection: str = DEFAULT_COLLECTION):
+    """serves a pdf of the library (of the default collection unless another one is given)
+
+    Supports Range requests (206, so viewers can fetch only the pages they show)
+    and ETag/If-None-Match revalidation (304 when the file did not change).
+    """
+    # Solo el nombre: nunca se sale de la carpeta de pdfs
+    file_name = os.path.basename(file_name.split("#")[0])
+    if not file_name.lower().endswith(".pdf"):
+        file_name += ".pdf"
+    if not collections.exists(collection):
+        return JSONResponse({"error": "Colección no encontrada"}, status_code=404)
+    pdf_path = os.path.join(collections.pdf_folder(collection), file_name) # Ruta al PDF en el contenedor del agente
+
+    if not os.path.isfile(pdf_path):
+        return JSONResponse({"error": "Archivo no encontrado"}, status_code=404)
+
+    stat = os.stat(pdf_path)
+    etag = _pdf_etag(stat)
+    headers = {"ETag": etag, "Cache-Control": PDF_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
 
+    # FileResponse lee el archivo por bloques y responde a Range/If-Range con 206
+    return FileResponse(
+        path= pdf_path,
+        media_type= 'application/pdf',
+        filename= file_name,
+        headers= headers,
+        content_disposition_type= "inline",
+        stat_result= stat
+    )
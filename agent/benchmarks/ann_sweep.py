@@ -0,0 +1,210 @@
+"""
+Recall, latency and memory of the HNSW parameters against exact search.
+
+For every corpus size it builds the exact NumPy index (utils.exact_index, the
+ground truth) and one Chroma collection per (M, construction_ef) pair, then
+queries each collection with every search_ef. For each configuration it
+reports:
+    recall@k     overlap between its top-k and the exact top-k
+    p50/p95 ms   latency of a single query
+    build s      time to insert the vectors
+    index MB     size of the HNSW files of the collection (what Chroma loads in memory)
+
+Chroma keeps the search_ef an index was loaded with for the life of the
+process, so each search_ef is measured in a new worker process.
+
+Exact search is timed on the same queries (its memory is the float32
+matrix), so the output shows up to which size brute force is faster than
+HNSW at the target recall: use it to set AGENT_EXACT_MAX_CHUNKS, and the
+search_ef it reports to set AGENT_HNSW_SEARCH_EF.
+
+Vectors are synthetic (normalized and clustered, like text embeddings)
+unless --store points to a local_rag folder: then the vectors of its Chroma
+collection are used and the queries are stored vectors with some noise.
+
+Usage (from the agent/ folder):
+    python -m benchmarks.ann_sweep --sizes 2000 10000 50000
+    python -m benchmarks.ann_sweep --store local_rag --M 8 16 32 --search-ef 10 20 50 100 200
+"""
+
+# === SYSTEM ===
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# === VECTORS ===
+import numpy as np
+import chromadb
+
+# === INDEX UNDER TEST ===
+from utils.exact_index import ExactIndex, normalize
+from utils.RAG import DEFAULT_COLLECTION_NAME
+
+
+def percentile(samples_ms, p):
+    return float(np.percentile(np.asarray(samples_ms), p))
+
+
+def synthetic_corpus(size, dim, queries, rng, clusters=64, spread=0.35):
+    """returns normalized clustered vectors and queries drawn from the same clusters"""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+
+    def sample(n):
+        points = centers[rng.integers(0, clusters, n)] + spread * rng.standard_normal((n, dim)).astype(np.float32)
+        return normalize(points)
+
+    return sample(size), sample(queries)
+
+
+def store_corpus(folder, collection_name, queries, rng, noise=0.05):
+    """returns the vectors of a local_rag vector store and noisy copies of some of them as queries"""
+    client = chromadb.PersistentClient(path=os.path.join(folder, "vector_store"))
+    exact = ExactIndex.from_collection(client.get_collection(collection_name))
+    vectors = exact.vectors
+    if len(vectors) == 0:
+        sys.exit(f"the collection {collection_name!r} of {folder} is empty")
+    picks = vectors[rng.integers(0, len(vectors), queries)]
+    return vectors, normalize(picks + noise * rng.standard_normal(picks.shape).astype(np.float32))
+
+
+def folder_mb(folder, skip=("chroma.sqlite3",)):
+    """size in MiB of the files of a folder (the HNSW segment files of a Chroma store)"""
+    total = 0
+    for root, _, files in os.walk(folder):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files if name not in skip)
+    return total / 2**20
+
+
+def time_queries(search, queries):
+    """runs every query and returns the results and the latency of each one in milliseconds"""
+    results, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        samples.append((time.perf_counter() - start) * 1000)
+    return results, samples
+
+
+def query_collection(folder, search_ef, queries, k):
+    """queries the collection of a store with one search_ef (runs in a fresh worker process)
+
+    Returns:
+        tuple: (ids found for each query, latency of each query in milliseconds)
+    """
+    collection = chromadb.PersistentClient(path=folder).get_collection("ann_sweep")
+    # Antes de la primera query: el índice se carga con este ef
+    collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    return time_queries(
+        lambda q: collection.query(query_embeddings=[q], n_results=k, include=[])["ids"][0], queries
+    )
+
+
+def recall(found, truth):
+    """average overlap of each result list with its ground truth"""
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def sweep(vectors, queries, args):
+    """measures exact search and every HNSW configuration on one corpus
+
+    Returns:
+        list: one row (dict) per configuration, the exact one first
+    """
+    ids = [str(i) for i in range(len(vectors))]
+    exact = ExactIndex(ids, vectors)
+    truth, samples = time_queries(lambda q: [cid for cid, _ in exact.search(q, args.k)], queries)
+    rows = [{
+        "size": len(vectors), "index": "exact", "M": None, "construction_ef": None, "search_ef": None,
+        "recall": 1.0, "p50_ms": percentile(samples, 50), "p95_ms": percentile(samples, 95),
+        "build_s": 0.0, "index_mb": exact.nbytes / 2**20,
+    }]
+    print_row(rows[-1])
+
+    for m in args.M:
+        for construction_ef in args.construction_ef:
+            with tempfile.TemporaryDirectory() as folder:
+                client = chromadb.PersistentClient(path=folder)
+                collection = client.create_collection("ann_sweep", metadata={
+                    "hnsw:space": "cosine", "hnsw:M": m, "hnsw:construction_ef": construction_ef,
+                })
+                batch = client.get_max_batch_size()
+                start = time.perf_counter()
+                for offset in range(0, len(vectors), batch):
+                    collection.add(ids=ids[offset:offset + batch], embeddings=vectors[offset:offset + batch])
+                build_s = time.perf_counter() - start
+                index_mb = folder_mb(folder)
+
+                for search_ef in args.search_ef:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as worker:
+                        found, samples = worker.submit(query_collection, folder, search_ef, queries, args.k).result()
+                    rows.append({
+                        "size": len(vectors), "index": "hnsw", "M": m, "construction_ef": construction_ef,
+                        "search_ef": search_ef, "recall": recall(found, truth),
+                        "p50_ms": percentile(samples, 50), "p95_ms": percentile(samples, 95),
+                        "build_s": build_s, "index_mb": index_mb,
+                    })
+                    print_row(rows[-1])
+    return rows
+
+
+def print_row(row):
+    params = "-" if row["index"] == "exact" else f"{row['M']}/{row['construction_ef']}/{row['search_ef']}"
+    print(f"  {row['size']:>8} {row['index']:<6} {params:<14} {row['recall']:>8.3f} "
+          f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['build_s']:>8.2f} {row['index_mb']:>9.1f}")
+
+
+def recommend(rows, target):
+    """prints, per size, the fastest HNSW configuration reaching the target recall against exact search"""
+    print(f"\nFastest configuration with recall >= {target}:")
+    for size in sorted({row["size"] for row in rows}):
+        exact = next(row for row in rows if row["size"] == size and row["index"] == "exact")
+        good = [row for row in rows if row["size"] == size and row["index"] == "hnsw" and row["recall"] >= target]
+        if not good:
+            print(f"  {size:>8}: no HNSW configuration reaches it, use exact search ({exact['p50_ms']:.2f} ms)")
+            continue
+        best = min(good, key=lambda row: row["p50_ms"])
+        winner = "exact" if exact["p50_ms"] <= best["p50_ms"] else "hnsw"
+        print(f"  {size:>8}: M={best['M']} construction_ef={best['construction_ef']} search_ef={best['search_ef']} "
+              f"({best['p50_ms']:.2f} ms, recall {best['recall']:.3f}) vs exact {exact['p50_ms']:.2f} ms -> {winner}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 10000, 50000], help="synthetic corpus sizes")
+    parser.add_argument("--dim", type=int, default=1024, help="dimension of the synthetic vectors (bge-m3: 1024)")
+    parser.add_argument("--store", default=None, help="local_rag folder whose vectors are used instead of synthetic ones")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION_NAME, help="Chroma collection of --store")
+    parser.add_argument("--M", type=int, nargs="+", default=[16], help="HNSW M values")
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100], help="HNSW construction_ef values")
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 20, 50, 100, 200], help="HNSW search_ef values")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--output", default=None, help="write the rows as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"  {'size':>8} {'index':<6} {'M/cef/ef':<14} {'recall@' + str(args.k):>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'build s':>8} {'index MB':>9}")
+    rows = []
+    if args.store:
+        vectors, queries = store_corpus(args.store, args.collection, args.queries, rng)
+        rows.extend(sweep(vectors, queries, args))
+    else:
+        for size in args.sizes:
+            vectors, queries = synthetic_corpus(size, args.dim, args.queries, rng)
+            rows.extend(sweep(vectors, queries, args))
+    recommend(rows, args.target_recall)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
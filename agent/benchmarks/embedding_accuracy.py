@@ -0,0 +1,138 @@
+"""
+Accuracy and throughput of the embedding engines against the fp32 baseline.
+
+Chunks the PDFs of the folder exactly like ingestion does, embeds them with
+every engine and builds a set of queries from the chunks themselves (a
+sentence taken from the middle of a sample of chunks). For each engine it
+reports:
+    recall@k     overlap between its top-k chunks and the top-k of fp32 torch
+    top1         how often its best chunk is the chunk the query came from
+    chunks/s     document embedding throughput
+    query ms     median latency of a single query embedding
+
+Usage (from the agent/ folder):
+    python -m benchmarks.embedding_accuracy --engines torch torch-int8 onnx
+    python -m benchmarks.embedding_accuracy --max-chunks 1000 --queries 100 --k 5
+"""
+
+# === SYSTEM ===
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import statistics
+
+# === VECTORS ===
+import numpy as np
+
+# === ENGINES UNDER TEST ===
+from utils.ingestion import load_and_split
+from utils.embedding_engines import EMBEDDING_ENGINES, build_embeddings
+
+
+def load_chunks(folder, max_chunks):
+    """returns the text of the chunks of the pdfs of the folder"""
+    texts = []
+    for pdf in sorted(glob.glob(os.path.join(folder, "*.pdf"))):
+        _, _, chunks = load_and_split(pdf)
+        texts.extend(chunk.page_content for chunk in chunks)
+    return texts[:max_chunks]
+
+
+def make_queries(texts, n, rng):
+    """picks a sentence from the middle of n random chunks as queries
+
+    Returns:
+        list: (query, index of the chunk it comes from)
+    """
+    queries = []
+    for index in rng.sample(range(len(texts)), min(n, len(texts))):
+        words = texts[index].split()
+        if len(words) < 8:
+            continue
+        start = len(words) // 3
+        queries.append((" ".join(words[start:start + 12]), index))
+    return queries
+
+
+def top_k(doc_vectors, query_vectors, k):
+    """returns the indices of the k most similar chunks of each query (vectors are normalized)"""
+    scores = query_vectors @ doc_vectors.T
+    best = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, best, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(best, order, axis=1)
+
+
+def evaluate(engine, args, texts, queries):
+    """embeds the corpus and the queries with one engine"""
+    model = build_embeddings(args.model, engine=engine, batch_size=args.batch_size, threads=args.threads)
+    model.embed_documents(texts[:4]) # warm-up
+
+    start = time.perf_counter()
+    doc_vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    chunks_per_s = len(texts) / (time.perf_counter() - start)
+
+    latencies = []
+    query_vectors = []
+    for query, _ in queries:
+        start = time.perf_counter()
+        query_vectors.append(model.embed_query(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return doc_vectors, np.asarray(query_vectors, dtype=np.float32), chunks_per_s, statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=EMBEDDING_ENGINES, default=list(EMBEDDING_ENGINES))
+    parser.add_argument("--pdf-folder", default="local_rag/pdf_files")
+    parser.add_argument("--model", default=os.getenv("AGENT_EMBEDDING_MODEL_PATH") or "BAAI/bge-m3")
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="defaults to the CPU quota")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="exit with code 1 below this recall@k")
+    parser.add_argument("--output", default=None, help="optional JSON file with the results")
+    args = parser.parse_args()
+
+    texts = load_chunks(args.pdf_folder, args.max_chunks)
+    if not texts:
+        print(f"No hay PDFs en {args.pdf_folder}.")
+        return 1
+    queries = make_queries(texts, args.queries, random.Random(0))
+    sources = np.asarray([index for _, index in queries])
+    print(f"{len(texts)} chunks, {len(queries)} queries, k={args.k}")
+
+    engines = ["torch"] + [engine for engine in args.engines if engine != "torch"]
+    baseline = None
+    results = {}
+    for engine in engines:
+        doc_vectors, query_vectors, chunks_per_s, query_ms = evaluate(engine, args, texts, queries)
+        ranking = top_k(doc_vectors, query_vectors, args.k)
+        if baseline is None:
+            baseline = ranking
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ranking, baseline)])
+        results[engine] = {
+            "recall_at_k": float(recall),
+            "top1": float(np.mean(ranking[:, 0] == sources)),
+            "chunks_per_s": chunks_per_s,
+            "query_ms_p50": query_ms,
+        }
+        print(f"{engine:<11} recall@{args.k} {recall:6.3f} | top1 {results[engine]['top1']:6.3f} | "
+              f"{chunks_per_s:8.1f} chunks/s | query {query_ms:7.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"k": args.k, "chunks": len(texts), "queries": len(queries), "engines": results}, f, indent=2)
+
+    below = [engine for engine, r in results.items() if r["recall_at_k"] < args.min_recall]
+    for engine in below:
+        print(f"LOW RECALL {engine}: {results[engine]['recall_at_k']:.3f} < {args.min_recall}")
+    return 1 if below else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
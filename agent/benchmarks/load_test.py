@@ -0,0 +1,78 @@
+"""
+Load test of the agent service with a stubbed LLM.
+
+Simulates N concurrent users chatting with /search through the real FastAPI
+app (in-process ASGI transport) using the 'fake' LLM backend (a scripted
+stand-in with a fixed latency), so the numbers measure the service, the
+graph and the retrieval, not the network.
+
+Usage (from the agent/ folder):
+    python -m benchmarks.load_test --users 32 --messages 5 --llm-latency-ms 200
+"""
+
+# === SYSTEM ===
+import os
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+
+# === HTTP CLIENT ===
+import httpx
+
+# === SERVICE UNDER TEST ===
+# Sin caché de respuestas: todos los usuarios empiezan con las mismas preguntas y se mediría la caché, no el grafo
+os.environ.setdefault("AGENT_ANSWER_CACHE", "0")
+import agent_app
+from utils import agent as agent_module
+from utils.llm_backends import ScriptedChatModel
+
+
+async def simulate_user(client, user_id, messages, latencies):
+    """sends the messages of one user one after the other"""
+    for i in range(messages):
+        start = time.perf_counter()
+        response = await client.post("/search", json={"text": f"pregunta {i} sobre SVM", "User_id": user_id})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run_scenario(client, users, messages):
+    """runs `users` concurrent users and returns throughput and latency percentiles"""
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        simulate_user(client, f"load-{users}-{u}-{uuid.uuid4().hex[:6]}", messages, latencies)
+        for u in range(users)
+    ])
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "seconds": seconds,
+        "throughput_rps": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+async def main(args):
+    agent_module.set_chat_model(ScriptedChatModel(latency_ms=args.llm_latency_ms))
+    agent_module.get_rag() # the in-process transport skips the startup warm-up: the model loads here, not in the first request
+    transport = httpx.ASGITransport(app=agent_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent", timeout=None) as client:
+        for users in (1, args.users):
+            result = await run_scenario(client, users, args.messages)
+            print(f"{result['users']:>4} usuarios | {result['requests']:>5} requests | "
+                  f"{result['throughput_rps']:8.1f} req/s | p50 {result['p50_ms']:8.1f} ms | "
+                  f"p95 {result['p95_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=32, help="concurrent simulated users")
+    parser.add_argument("--messages", type=int, default=5, help="messages sent by each user")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="latency of each stubbed LLM call")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,345 @@
+"""
+End-to-end benchmark suite of the agent service.
+
+Sections (select with --only, skip with --skip):
+    parse      PDF parse/split throughput, sequential (load_and_split) and page-parallel (parse_pdfs)
+    embedding  embedding throughput of the model vs batch size and thread count
+    search     LocalRAGAgent.search p50/p95/p99 latency per mode vs store size (synthetic corpora,
+               real query embedding, BM25, fusion, reranker and exact/HNSW index)
+    pages      LocalRAGAgent.return_by_page latency on a synthetic page store
+    service    full /search request latency with the 'fake' LLM backend
+    startup    time-to-healthy (/) and time-to-ready (/ready) of a fresh uvicorn process
+
+Results are written as JSON (--output) and compared with a stored baseline
+(--baseline): any metric worse than the baseline by more than --tolerance
+makes the run exit with code 1, and a run without a baseline exits with
+code 2. Baselines depend on the machine, so none is committed: store one on
+the machine that runs the suite with --update-baseline.
+
+Usage (from the agent/ folder):
+    python -m benchmarks.run_benchmarks --output bench_results.json
+    python -m benchmarks.run_benchmarks --only search --sizes 10000 100000
+"""
+
+# === SYSTEM ===
+import os
+import sys
+import glob
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+# === VECTORS ===
+import numpy as np
+
+SECTIONS = ("parse", "embedding", "search", "pages", "service", "startup")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+WORDS = [f"w{i}" for i in range(5000)] # vocabulario sintético: BM25 tiene postings de tamaños variados
+
+_embeddings = {}
+
+
+def percentiles(samples_ms):
+    """returns p50/p95/p99 of a list of latencies in milliseconds"""
+    values = np.asarray(samples_ms)
+    return {f"p{p}": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def metric(results, name, value, unit, better):
+    """records a metric
+
+    Args:
+        results: dict where the metric is stored
+        name: name of the metric
+        value: measured value
+        unit: unit of the value
+        better: 'lower' or 'higher', used by the baseline comparison
+    """
+    results[name] = {"value": float(value), "unit": unit, "better": better}
+    print(f"  {name:<45} {value:>12.2f} {unit}")
+
+
+# --- sections ---
+
+def bench_parse(args, results):
+    """parse/split throughput over the pdfs of the folder, in this process and page-parallel"""
+    from utils.extraction import load_and_split, parse_pdfs, resolve_backend
+
+    pdfs = sorted(glob.glob(os.path.join(args.pdf_folder, "*.pdf")))
+    if not pdfs:
+        print(f"  no pdfs in {args.pdf_folder}, skipped")
+        return []
+    pages = chunks = 0
+    all_chunks = []
+    start = time.perf_counter()
+    for pdf in pdfs:
+        _, docs, pdf_chunks = load_and_split(pdf)
+        pages += len(docs)
+        chunks += len(pdf_chunks)
+        all_chunks.extend(chunk.page_content for chunk in pdf_chunks)
+    seconds = time.perf_counter() - start
+    metric(results, "parse.pages_per_s", pages / seconds, "pages/s", "higher")
+    metric(results, "parse.chunks_per_s", chunks / seconds, "chunks/s", "higher")
+
+    workers = os.cpu_count() or 1
+    if workers > 1:
+        start = time.perf_counter()
+        for _ in parse_pdfs(pdfs, workers=workers, isolate=True):
+            pass
+        seconds = time.perf_counter() - start
+        metric(results, f"parse.parallel_{resolve_backend()}.pages_per_s", pages / seconds, "pages/s", "higher")
+    return all_chunks
+
+
+def bench_embedding(args, results, texts):
+    """embedding throughput vs batch size and thread count"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if not texts:
+        texts = [f"synthetic chunk {i} " + "lorem ipsum dolor sit amet " * 30 for i in range(args.embed_texts)]
+    texts = texts[:args.embed_texts]
+    model = SentenceTransformer(args.model, device="cpu")
+    model.encode(texts[:4]) # warm-up
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+            seconds = time.perf_counter() - start
+            metric(results, f"embedding.t{threads}.b{batch_size}.chunks_per_s",
+                   len(texts) / seconds, "chunks/s", "higher")
+
+
+def synthetic_rag(folder, size, args, rng):
+    """returns a LocalRAGAgent whose collection holds `size` synthetic chunks
+
+    The chunks get random normalized vectors (embedding them would take longer
+    than the benchmark) and random texts over WORDS, so the search under test
+    runs every stage: query embedding, BM25, fusion, reranker and exact/HNSW.
+    """
+    from utils.RAG import LocalRAGAgent, build_cached_embeddings, _INDEX_VERSIONS
+
+    if args.model not in _embeddings:
+        # el modelo se carga una vez para search y pages, fuera de las medidas
+        _embeddings[args.model] = build_cached_embeddings(tempfile.mkdtemp(prefix="bench_cache_"), args.model)
+    embeddings = _embeddings[args.model]
+    rag = LocalRAGAgent(base_folder=folder, model_name=args.model, embeddings=embeddings)
+    collection = rag._open_vector_store()._collection
+    dim = len(embeddings.embeddings.embed_query("dim"))
+    ids = []
+    batch = 5000
+    for offset in range(0, size, batch):
+        n = min(batch, size - offset)
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        batch_ids = [f"synthetic.pdf::{offset + i}" for i in range(n)]
+        texts = [" ".join(rng.choice(WORDS, 80)) for _ in range(n)]
+        metadatas = [{"source": "synthetic.pdf", "filename": "synthetic.pdf", "page": (offset + i) // 4} for i in range(n)]
+        collection.add(ids=batch_ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        for cid, text, metadata in zip(batch_ids, texts, metadatas):
+            rag.lexical.add(cid, text, metadata)
+        ids.extend(batch_ids)
+    rag.manifest.record("synthetic.pdf", "synthetic", ids)
+    rag.index_version = next(_INDEX_VERSIONS) # como tras un commit
+    return rag
+
+
+def bench_search(args, results):
+    """LocalRAGAgent.search latency per mode vs store size on synthetic corpora"""
+    from utils.RAG import SEARCH_MODES
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            rag = synthetic_rag(folder, size, args, rng)
+            rag.search("warm up", k=args.k, mode="hybrid") # carga el índice exacto si corresponde
+            for mode in SEARCH_MODES:
+                samples = []
+                for i in range(args.queries):
+                    # Queries distintas: ni la caché de resultados ni la de embeddings acierta
+                    words = 2 if i % 2 else 8
+                    query = " ".join(rng.choice(WORDS, words))
+                    start = time.perf_counter()
+                    rag.search(query, k=args.k, mode=mode)
+                    samples.append((time.perf_counter() - start) * 1000)
+                for name, value in percentiles(samples).items():
+                    metric(results, f"search.n{size}.{mode}.{name}_ms", value, "ms", "lower")
+            rag.close()
+
+
+def bench_pages(args, results):
+    """LocalRAGAgent.return_by_page latency on a synthetic page store"""
+    with tempfile.TemporaryDirectory() as folder:
+        rag = synthetic_rag(folder, 0, args, np.random.default_rng(0))
+        pages = [f"page {p} " + "x" * 3000 for p in range(args.pages)]
+        rag.page_store.write("synthetic.pdf", pages)
+        rag.return_by_page([0], "synthetic.pdf") # opens the memory map
+        samples = []
+        for _ in range(args.queries):
+            page = random.randrange(args.pages)
+            start = time.perf_counter()
+            rag.return_by_page([page], "synthetic.pdf")
+            samples.append((time.perf_counter() - start) * 1000)
+        for name, value in percentiles(samples).items():
+            metric(results, f"pages.{name}_ms", value, "ms", "lower")
+        rag.close()
+
+
+def bench_service(args, results):
+    """full /search latency through the FastAPI app with the 'fake' LLM backend"""
+    os.environ["AGENT_LLM_BACKEND"] = "fake"
+    os.environ["AGENT_FAKE_LLM_LATENCY_MS"] = "0"
+    os.environ["AGENT_ANSWER_CACHE"] = "0" # every request must run the graph
+    import httpx
+    import agent_app
+
+    agent_app.get_rag() # the in-process transport skips the startup warm-up
+
+    async def run():
+        transport = httpx.ASGITransport(app=agent_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent", timeout=None) as client:
+            samples = []
+            for i in range(args.requests):
+                start = time.perf_counter()
+                response = await client.post("/search", json={"text": f"bench question {i}", "User_id": f"bench-{i}"})
+                response.raise_for_status()
+                samples.append((time.perf_counter() - start) * 1000)
+            return samples
+
+    for name, value in percentiles(asyncio.run(run())).items():
+        metric(results, f"service.search.{name}_ms", value, "ms", "lower")
+
+
+def bench_startup(args, results):
+    """seconds until a fresh server answers / (healthy) and /ready (ready)"""
+    import httpx
+
+    env = dict(os.environ, AGENT_LLM_BACKEND="fake", AGENT_WARMUP="background")
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "agent_app:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env,
+    )
+    times = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=1.0) as client:
+            for phase, path in (("healthy", "/"), ("ready", "/ready")):
+                while True:
+                    if server.poll() is not None:
+                        raise RuntimeError(f"the server exited with code {server.returncode}")
+                    if time.perf_counter() - start > args.startup_timeout:
+                        raise TimeoutError(f"{path} did not answer in {args.startup_timeout} s")
+                    try:
+                        if client.get(path).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    time.sleep(0.05)
+                times[phase] = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    metric(results, "startup.time_to_healthy_s", times["healthy"], "s", "lower")
+    metric(results, "startup.time_to_ready_s", times["ready"], "s", "lower")
+
+
+# --- baseline ---
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """returns the metrics that are worse than the baseline by more than the tolerance
+
+    Latencies that moved less than min_delta_ms are ignored, so sub-millisecond
+    metrics do not fail on timer noise.
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None or reference["value"] == 0:
+            continue
+        if current["unit"] == "ms" and abs(current["value"] - reference["value"]) < min_delta_ms:
+            continue
+        change = (current["value"] - reference["value"]) / reference["value"]
+        worse = change > tolerance if current["better"] == "lower" else change < -tolerance
+        if worse:
+            regressions.append((name, reference["value"], current["value"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, help="run only these sections")
+    parser.add_argument("--skip", nargs="+", choices=SECTIONS, default=[], help="skip these sections")
+    parser.add_argument("--pdf-folder", default="local_rag/pdf_files")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--embed-texts", type=int, default=256, help="chunks embedded per configuration")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64, 128])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="synthetic store sizes")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200, help="queries per latency measurement")
+    parser.add_argument("--pages", type=int, default=500, help="pages of the synthetic document")
+    parser.add_argument("--requests", type=int, default=50, help="/search requests")
+    parser.add_argument("--port", type=int, default=8765, help="port of the startup server")
+    parser.add_argument("--startup-timeout", type=float, default=600, help="seconds to wait for /ready")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1, help="ignore latency changes below this")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args()
+
+    sections = [s for s in (args.only or SECTIONS) if s not in args.skip]
+    results = {}
+    texts = []
+    for section in sections:
+        print(f"[{section}]")
+        if section == "parse":
+            texts = bench_parse(args, results)
+        elif section == "embedding":
+            bench_embedding(args, results, texts)
+        elif section == "search":
+            bench_search(args, results)
+        elif section == "pages":
+            bench_pages(args, results)
+        elif section == "service":
+            bench_service(args, results)
+        elif section == "startup":
+            bench_startup(args, results)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados guardados en {args.output}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline actualizado: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        # Sin baseline no se puede detectar ninguna regresión: no es un éxito
+        print(f"Sin baseline en {args.baseline}: ejecuta con --update-baseline en esta máquina para crearlo.")
+        return 2
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    for name, before, after, change in regressions:
+        print(f"REGRESSION {name}: {before:.2f} -> {after:.2f} ({change:+.0%})")
+    if regressions:
+        return 1
+    print(f"Sin regresiones frente al baseline (tolerancia {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Soak test of the conversation checkpointer.
+
+Runs thousands of short conversations (each with a new thread_id) through the
+real graph with the 'fake' LLM backend answering without tools, and prints
+the RSS of the process and the size of the checkpoint database every
+--report-every sessions. With the bounded sqlite checkpointer the RSS must
+stay flat once the caches are warm; with 'memory' it grows with every session.
+
+Usage (from the agent/ folder):
+    python -m benchmarks.soak_checkpointer --sessions 20000
+    python -m benchmarks.soak_checkpointer --checkpointer memory --sessions 5000
+"""
+
+# === SYSTEM ===
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+
+
+def rss_mb():
+    """returns the resident memory of this process in MiB"""
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpointer", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--turns", type=int, default=3, help="messages per session")
+    parser.add_argument("--max-threads", type=int, default=1000, help="threads kept by the sqlite checkpointer")
+    parser.add_argument("--report-every", type=int, default=1000)
+    parser.add_argument("--warm-up", type=int, default=2000, help="sessions before the RSS reference is taken")
+    parser.add_argument("--max-growth-mb", type=float, default=20.0,
+                        help="sqlite only: exit with code 1 if RSS grows more than this after the warm-up")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="soak_")
+    os.environ["AGENT_CHECKPOINTER"] = args.checkpointer
+    os.environ["AGENT_CHECKPOINT_PATH"] = os.path.join(folder, "checkpoints.sqlite")
+    os.environ["AGENT_CHECKPOINT_MAX_THREADS"] = str(args.max_threads)
+    os.environ["AGENT_ANSWER_CACHE"] = "0" # la caché de respuestas embebería cada primera pregunta con el modelo
+
+    from utils import agent as agent_module
+    from utils.llm_backends import ScriptedChatModel
+
+    # sin herramientas: se mide el checkpointer y el grafo, no el RAG
+    agent_module.set_chat_model(ScriptedChatModel(tool_rounds=0))
+    agent = agent_module.dummy_agent()
+
+    reference = None
+    start = time.perf_counter()
+    for session in range(1, args.sessions + 1):
+        user = f"soak-{uuid.uuid4().hex}"
+        for turn in range(args.turns):
+            agent.run_chat(f"mensaje {turn} de la sesión {session} " + "texto de relleno " * 20, user)
+        if session == args.warm_up:
+            reference = rss_mb()
+        if session % args.report_every == 0:
+            line = f"{session:>7} sesiones | RSS {rss_mb():8.1f} MiB | {time.perf_counter() - start:7.1f} s"
+            if hasattr(agent.memory, "stats"):
+                stats = agent.memory.stats()
+                line += f" | {stats['threads']} hilos, {stats['checkpoints']} checkpoints, {stats['bytes'] / 2**20:.1f} MiB en disco"
+            print(line, flush=True)
+
+    if reference is None:
+        return 0
+    growth = rss_mb() - reference
+    print(f"Crecimiento de RSS tras el calentamiento: {growth:+.1f} MiB")
+    if args.checkpointer == "sqlite" and growth > args.max_growth_mb:
+        print(f"RSS GROWTH {growth:.1f} MiB > {args.max_growth_mb} MiB")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Shared fixtures of the agent tests.
+
+The RAG is built with deterministic hash embeddings (no model is downloaded)
+and the pdfs are written by `make_pdf`, a minimal generator readable by pypdf.
+"""
+
+# === SYSTEM ===
+import os
+import sys
+import hashlib
+
+# === TESTING ===
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+# Los tests importan los módulos del agente como lo hace el servicio (utils.*)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("AGENT_PDF_BACKEND", "pypdf")
+
+from utils.embedding_cache import CachedEmbeddings
+from utils.RAG import LocalRAGAgent
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic embeddings: a random unit vector seeded by the md5 of the text."""
+
+    def __init__(self, dim=32):
+        self.dim = dim
+        self.embedded = 0 # textos que pasaron por el "modelo"
+
+    def _vector(self, text):
+        rng = np.random.default_rng(int(hashlib.md5(text.encode()).hexdigest()[:8], 16))
+        vector = rng.normal(size=self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.embedded += 1
+        return self._vector(text)
+
+
+def make_pdf(path, pages):
+    """writes a pdf with one page per text (Helvetica, one line per '\\n')
+
+    Args:
+        path: path of the pdf
+        pages: list of texts, one per page
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        lines = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in text.split("\n"))
+        body = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def page_text(topic, lines=30):
+    """returns a page of text about a topic (several chunks once split)"""
+    return "\n".join(f"{topic} linea {n}: el {topic} se estudia con ejemplos y ejercicios resueltos." for n in range(lines))
+
+
+@pytest.fixture
+def hash_embeddings():
+    return HashEmbeddings()
+
+
+@pytest.fixture
+def make_rag(tmp_path, hash_embeddings):
+    """factory of LocalRAGAgents on tmp_path sharing the hash embeddings
+
+    make_rag(folder="rag", cache="embedding_cache", **options) -> LocalRAGAgent
+    """
+    rags = []
+
+    def factory(folder="rag", cache="embedding_cache", **options):
+        embeddings = CachedEmbeddings(hash_embeddings, str(tmp_path / cache), max_entries=10_000)
+        options.setdefault("reranker", "none")
+        options.setdefault("ingest_workers", 1)
+        rag = LocalRAGAgent(base_folder=str(tmp_path / folder), embeddings=embeddings, **options)
+        rags.append(rag)
+        return rag
+
+    yield factory
+    for rag in rags:
+        rag.close()
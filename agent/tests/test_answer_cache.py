@@ -0,0 +1,123 @@
+"""Semantic answer cache: similarity, scope and index version keys."""
+
+# === SYSTEM ===
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+
+from conftest import make_pdf, page_text
+from utils.answer_cache import SemanticAnswerCache, build_answer_cache
+
+
+def _unit(seed, dim=8):
+    vector = np.random.default_rng(seed).normal(size=dim)
+    return vector / np.linalg.norm(vector)
+
+
+def test_similar_questions_of_the_same_scope_and_version_hit():
+    cache = SemanticAnswerCache(threshold=0.95)
+    question = _unit(1)
+    cache.store(question, "¿qué es?", "respuesta", scope=("default", None), version=1, llm_calls=2, cost_ms=100.0)
+
+    close = question + 0.01 * _unit(2)
+    hit = cache.lookup(close, ("default", None), 1)
+    assert hit["answer"] == "respuesta" and hit["similarity"] > 0.95
+    assert cache.lookup(_unit(3), ("default", None), 1) is None # otra pregunta
+    assert cache.lookup(question, ("default", ("a.pdf",)), 1) is None # otro alcance
+    assert cache.lookup(question, ("proj-a", None), 1) is None # otra colección
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["llm_calls_avoided"], stats["saved_ms"]) == (1, 3, 2, 100.0)
+
+
+def test_new_index_version_drops_old_answers():
+    cache = SemanticAnswerCache()
+    cache.store(_unit(1), "q", "vieja", scope=("default", None), version=1)
+    assert cache.lookup(_unit(1), ("default", None), 2) is None
+    assert len(cache) == 0
+    assert cache.lookup(_unit(1), ("default", None), 1) is None
+
+
+def test_ttl_and_lru(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(maxsize=2, ttl=10)
+    for seed in (1, 2, 3):
+        cache.store(_unit(seed), str(seed), str(seed), scope="s", version=1)
+    assert len(cache) == 2 and cache.lookup(_unit(1), "s", 1) is None
+    assert cache.lookup(_unit(2), "s", 1)["answer"] == "2"
+    now[0] = 11
+    assert cache.lookup(_unit(2), "s", 1) is None
+
+
+def test_build_from_environment(monkeypatch):
+    monkeypatch.setenv("AGENT_ANSWER_CACHE", "0")
+    assert build_answer_cache() is None
+    monkeypatch.setenv("AGENT_ANSWER_CACHE", "1")
+    monkeypatch.setenv("AGENT_ANSWER_CACHE_THRESHOLD", "0.9")
+    monkeypatch.setenv("AGENT_ANSWER_CACHE_TTL_S", "0")
+    cache = build_answer_cache()
+    assert cache.threshold == 0.9 and cache.ttl is None
+
+
+class ScriptedModel(FakeMessagesListChatModel):
+    """fake chat model that ignores the tools (it never calls them)"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+@pytest.fixture
+def chat(make_rag, monkeypatch):
+    """a dummy_agent on a real RAG (hash embeddings) and a scripted LLM; returns (agent, rag, model)"""
+    from utils import agent
+
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    rag.load_or_build_from_folder()
+    model = ScriptedModel(responses=[AIMessage(content="Es un tema [[1]](a.pdf#page=1).")] * 10) # i cuenta las llamadas
+    monkeypatch.setenv("AGENT_ANSWER_CACHE", "1")
+    monkeypatch.setenv("AGENT_CHECKPOINTER", "memory")
+    monkeypatch.setattr(agent, "rag_is_ready", lambda: True)
+    monkeypatch.setattr(agent, "use_rag", contextmanager(lambda collection: (yield rag)))
+    monkeypatch.setattr(agent.collections, "loaded", lambda: ["default", "proj-a"])
+    monkeypatch.setattr(agent, "model_with_tools", model) # como set_chat_model, pero se deshace al terminar
+    return agent.dummy_agent(), rag, model
+
+
+def test_first_question_is_answered_once_per_scope_and_version(chat):
+    assistant, rag, model = chat
+    answer = assistant.run_chat("¿Qué es el algebra?", user_name="u1")
+    assert model.i == 1
+    assert assistant.run_chat("¿Qué es el algebra?", user_name="u2") == answer
+    assert model.i == 1 and assistant.answer_cache.stats()["hits"] == 1
+    # La respuesta cacheada queda en el hilo como un turno normal
+    messages = assistant.agent.get_state({"configurable": {"thread_id": "u2"}}).values["messages"]
+    assert [m.content for m in messages] == ["¿Qué es el algebra?", answer]
+
+    # Un turno posterior depende del historial: nunca sale de la caché
+    assistant.run_chat("¿Qué es el algebra?", user_name="u1")
+    assert model.i == 2
+
+    # Otro alcance (archivos o colección) u otra versión del índice no comparten respuesta
+    assistant.run_chat("¿Qué es el algebra?", user_name="u3", scope={"collection": "default", "files": ["a.pdf"]})
+    assert model.i == 3
+    linked = assistant.run_chat("¿Qué es el algebra?", user_name="u4", scope={"collection": "proj-a", "files": None})
+    assert model.i == 4 and "(a.pdf?collection=proj-a#page=1)" in linked
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text("historia")])
+    rag.load_or_build_from_folder()
+    assistant.run_chat("¿Qué es el algebra?", user_name="u5")
+    assert model.i == 5
+
+
+def test_no_lookup_while_the_rag_is_cold(chat, monkeypatch):
+    from utils import agent
+
+    assistant, _, model = chat
+    monkeypatch.setattr(agent, "rag_is_ready", lambda: False)
+    assistant.run_chat("¿Qué es el algebra?", user_name="u1")
+    assert assistant.answer_cache.stats()["misses"] == 0 and len(assistant.answer_cache) == 0
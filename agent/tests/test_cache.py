@@ -0,0 +1,62 @@
+"""TTL/LRU caches of query embeddings and search results."""
+
+# === SYSTEM ===
+import os
+import time
+
+from conftest import make_pdf, page_text
+from utils.cache import TTLCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1 # 'a' pasa a ser la más reciente
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.put("q", [0.1], cost_ms=5.0)
+    now[0] += 59
+    assert cache.get("q") == [0.1]
+    now[0] += 2
+    assert cache.get("q") is None
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_ms"]) == (1, 1, 5.0)
+
+
+def test_results_are_cached_per_index_version(make_rag, hash_embeddings):
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    rag.load_or_build_from_folder()
+
+    first = rag.search("algebra lineal", k=2, mode="hybrid")
+    embedded = hash_embeddings.embedded
+    assert rag.search("algebra lineal", k=2, mode="hybrid") == first
+    assert rag.result_cache.stats()["hits"] == 1
+    assert hash_embeddings.embedded == embedded # ni el embedding de la query se recalcula
+
+    # Un commit cambia la versión: la entrada anterior ya no se usa
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text("algebra lineal")])
+    rag.load_or_build_from_folder()
+    after = rag.search("algebra lineal", k=2, mode="hybrid")
+    assert rag.result_cache.stats()["hits"] == 1
+    assert any(result["archivo"] == "b.pdf" for result in after)
+    # La query sigue en su caché: el modelo no se vuelve a llamar para ella
+    assert hash_embeddings.embedded == embedded + len(rag.manifest.chunk_ids("b.pdf"))
+
+
+def test_result_copies_cannot_corrupt_the_cache(make_rag):
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    rag.load_or_build_from_folder()
+    results = rag.search("algebra", k=1, mode="lexical")
+    results[0]["texto"] = "cambiado"
+    assert rag.search("algebra", k=1, mode="lexical")[0]["texto"] != "cambiado"
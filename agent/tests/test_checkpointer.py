@@ -0,0 +1,86 @@
+"""Bounded SQLite checkpointer: compaction per thread and eviction of threads."""
+
+# === TYPING ===
+import operator
+from typing import Annotated
+from typing_extensions import TypedDict
+
+# === LANGGRAPH ===
+from langgraph.graph import StateGraph, START, END
+
+from utils.checkpointer import BoundedSqliteSaver, build_checkpointer, clear_checkpointer
+
+
+class State(TypedDict):
+    turns: Annotated[list, operator.add]
+
+
+def _graph(saver):
+    """a one-node graph that appends the input of each turn"""
+    builder = StateGraph(State)
+    builder.add_node("echo", lambda state: {})
+    builder.add_edge(START, "echo")
+    builder.add_edge("echo", END)
+    return builder.compile(checkpointer=saver)
+
+
+def _config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_compaction_keeps_latest_checkpoints_and_state(tmp_path):
+    saver = BoundedSqliteSaver(str(tmp_path / "checkpoints.sqlite"), keep_checkpoints=2)
+    graph = _graph(saver)
+    for turn in range(10):
+        graph.invoke({"turns": [turn]}, _config("t1"))
+
+    assert saver.stats()["checkpoints"] == 2
+    assert len(list(saver.list(_config("t1")))) == 2
+    # La conversación sigue entera en el último checkpoint
+    assert graph.get_state(_config("t1")).values["turns"] == list(range(10))
+
+
+def test_least_recently_used_threads_are_evicted(tmp_path):
+    saver = BoundedSqliteSaver(str(tmp_path / "checkpoints.sqlite"), max_threads=3, keep_checkpoints=1)
+    graph = _graph(saver)
+    for n in range(5):
+        graph.invoke({"turns": [n]}, _config(f"t{n}"))
+    graph.invoke({"turns": ["again"]}, _config("t0")) # t0 vuelve a ser reciente
+
+    assert saver.evict() == 2
+    assert saver.stats()["threads"] == 3
+    assert graph.get_state(_config("t0")).values["turns"] == [0, "again"]
+    assert not graph.get_state(_config("t1")).values
+    assert not graph.get_state(_config("t2")).values
+
+
+def test_idle_threads_expire(tmp_path):
+    saver = BoundedSqliteSaver(str(tmp_path / "checkpoints.sqlite"), ttl_seconds=60)
+    graph = _graph(saver)
+    graph.invoke({"turns": [1]}, _config("old"))
+    graph.invoke({"turns": [2]}, _config("new"))
+    with saver.cursor() as cur:
+        cur.execute("UPDATE thread_access SET last_access = last_access - 120 WHERE thread_id = 'old'")
+
+    assert saver.evict() == 1
+    assert not graph.get_state(_config("old")).values
+    assert graph.get_state(_config("new")).values["turns"] == [2]
+
+
+def test_put_evicts_every_evict_every_puts(tmp_path):
+    saver = BoundedSqliteSaver(str(tmp_path / "checkpoints.sqlite"), max_threads=2, evict_every=1)
+    graph = _graph(saver)
+    for n in range(6):
+        graph.invoke({"turns": [n]}, _config(f"t{n}"))
+    assert saver.stats()["threads"] == 2
+
+
+def test_clear_and_build(tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_CHECKPOINT_PATH", str(tmp_path / "env.sqlite"))
+    monkeypatch.setenv("AGENT_CHECKPOINT_MAX_THREADS", "7")
+    saver = build_checkpointer("sqlite")
+    assert isinstance(saver, BoundedSqliteSaver) and saver.max_threads == 7
+    graph = _graph(saver)
+    graph.invoke({"turns": [1]}, _config("t"))
+    clear_checkpointer(saver)
+    assert saver.stats()["threads"] == saver.stats()["checkpoints"] == 0
@@ -0,0 +1,123 @@
+"""Named collections: isolation, LRU eviction, pinning and per-collection load locks."""
+
+# === SYSTEM ===
+import os
+import time
+import threading
+
+import chromadb
+import pytest
+
+from conftest import make_pdf, page_text
+from utils.cache import TTLCache
+from utils.embedding_cache import CachedEmbeddings
+from utils.collection_registry import CollectionRegistry, CollectionNotFound, validate_name
+
+
+class HashRegistry(CollectionRegistry):
+    """registry whose collections share the hash embeddings of the tests"""
+
+    def __init__(self, embeddings, **options):
+        super().__init__(reranker="none", ingest_workers=1, **options)
+        self.hash_embeddings = embeddings
+
+    def _build_shared(self):
+        return {
+            "embeddings": CachedEmbeddings(self.hash_embeddings, os.path.join(self.base_folder, "embedding_cache")),
+            "query_embedding_cache": TTLCache(maxsize=256, ttl=None),
+            "reranker": None,
+            "chroma_client": chromadb.PersistentClient(path=os.path.join(self.base_folder, "vector_store")),
+        }
+
+
+@pytest.fixture
+def registry(tmp_path, hash_embeddings):
+    """registry with three collections of one pdf each; make(**options) builds another one on the same folder"""
+    def make(**options):
+        return HashRegistry(hash_embeddings, base_folder=str(tmp_path / "local_rag"), **options)
+
+    registry = make(max_loaded=3)
+    for name in ("proj-a", "proj-b", "proj-c"):
+        registry.create(name)
+        make_pdf(os.path.join(registry.pdf_folder(name), f"{name}.pdf"), [page_text(name.replace("-", ""))])
+    registry.make = make
+    return registry
+
+
+def test_collections_are_isolated(registry):
+    a = registry.get("proj-a")
+    b = registry.get("proj-b")
+    assert {r["archivo"] for r in a.search("proja projb", k=5, mode="hybrid")} == {"proj-a.pdf"}
+    assert {r["archivo"] for r in b.search("proja projb", k=5, mode="hybrid")} == {"proj-b.pdf"}
+    assert a.embeddings is b.embeddings and a.chroma_client is b.chroma_client
+    with pytest.raises(CollectionNotFound):
+        registry.get("nope")
+    with pytest.raises(FileExistsError):
+        registry.create("proj-a")
+    with pytest.raises(ValueError):
+        validate_name("Bad Name")
+
+
+def test_least_recently_used_collection_is_unloaded(registry):
+    registry.get() # la colección por defecto cuenta y nunca se descarga
+    registry.get("proj-a")
+    registry.get("proj-b")
+    registry.get("proj-a")
+    registry.get("proj-c")
+    assert registry.loaded() == ["default", "proj-a", "proj-c"]
+    assert (registry.loads, registry.unloads) == (4, 1)
+
+    # Al volver se recarga desde disco, con sus chunks
+    assert registry.get("proj-b").search("projb", k=1, mode="lexical")[0]["archivo"] == "proj-b.pdf"
+    assert "proj-b" in registry.loaded()
+
+
+def test_pinned_collections_stay_loaded(registry):
+    registry.get()
+    with registry.use("proj-a") as a:
+        registry.get("proj-b")
+        registry.get("proj-c")
+        registry.get("proj-b")
+        assert "proj-a" in registry.loaded()
+        assert registry.get("proj-a") is a
+        assert a.search("proja", k=1, mode="lexical")
+    # Al soltarla vuelve a contar para el límite
+    assert len(registry.loaded()) == 3
+
+
+def test_collection_just_loaded_is_never_unloaded(registry):
+    registry.get()
+    with registry.use("proj-a"), registry.use("proj-b"):
+        c = registry.get("proj-c") # sobra una, pero las otras están en uso
+        assert "proj-c" in registry.loaded()
+        assert c.search("projc", k=1, mode="lexical")
+
+
+def test_memory_budget_unloads_cold_collections(registry):
+    small = registry.make(max_loaded=10, memory_budget_mb=1e-6)
+    small.get("proj-a")
+    small.get("proj-b")
+    assert small.loaded() == ["proj-b"]
+    assert small.unloads == 1
+
+
+def test_each_collection_loads_under_its_own_lock(registry, monkeypatch):
+    load = registry._load
+    slow_started = threading.Event()
+
+    def slow_load(name):
+        if name == "proj-b":
+            slow_started.set()
+            time.sleep(1.0)
+        return load(name)
+
+    monkeypatch.setattr(registry, "_load", slow_load)
+    loader = threading.Thread(target=registry.get, args=("proj-b",))
+    loader.start()
+    slow_started.wait(5)
+    start = time.perf_counter()
+    registry.get("proj-c")
+    elapsed = time.perf_counter() - start
+    loader.join()
+    assert elapsed < 0.5
+    assert set(registry.loaded()) == {"proj-b", "proj-c"}
@@ -0,0 +1,76 @@
+"""Token-budgeted context and the per-turn diagnostics kept in the graph state."""
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from utils.context import build_context, link_collection
+
+
+def _turn(n, chars=2000):
+    """a turn that searched once and answered citing page n of a.pdf"""
+    call = {"name": "search", "args": {"query": f"pregunta {n}"}, "id": f"call{n}"}
+    return [
+        HumanMessage(content=f"pregunta {n}"),
+        AIMessage(content="", tool_calls=[call]),
+        ToolMessage(content=str({"texto1": "x" * chars, "pagina1": n, "archivo1": "a.pdf"}), tool_call_id=f"call{n}"),
+        AIMessage(content="y" * chars + f"\n---\n**Referencias:**\n* [[1] a.pdf, page {n}](a.pdf#page={n})"),
+    ]
+
+
+def test_old_turns_are_compacted_keeping_their_sources():
+    messages = [m for n in range(1, 5) for m in _turn(n)] + [HumanMessage(content="nueva")]
+    context = build_context(messages, budget_tokens=100_000, keep_turns=2)
+    assert context["dropped_turns"] == 0 and context["compacted"] > 0
+    old_tool = context["messages"][2]
+    assert len(old_tool.content) < 1000 and "a.pdf#page=1" in old_tool.content
+    assert "(a.pdf#page=1)" in context["messages"][3].content # las referencias se conservan enteras
+    assert context["messages"][-2].content == messages[-2].content # el turno anterior va sin compactar
+
+
+def test_over_budget_turns_are_dropped_whole_into_the_summary():
+    messages = [m for n in range(1, 9) for m in _turn(n)] + [HumanMessage(content="nueva")]
+    context = build_context(messages, budget_tokens=1500, keep_turns=2)
+    assert context["dropped_turns"] > 0 and context["tokens"] <= 1500
+    assert "pregunta 1" in context["summary"] and "a.pdf#page=1" in context["summary"]
+    # Nunca queda un ToolMessage sin la llamada que lo pidió
+    first = context["messages"][0]
+    assert isinstance(first, HumanMessage)
+    assert context["messages"][-1].content == "nueva"
+
+
+def test_link_collection_only_rewrites_pdf_links():
+    text = "Ver [[1]](a_b.pdf#page=3) y [web](https://example.com#page=2)."
+    assert link_collection(text, "proj-a") == "Ver [[1]](a_b.pdf?collection=proj-a#page=3) y [web](https://example.com#page=2)."
+
+
+class ScriptedModel(FakeMessagesListChatModel):
+    """fake chat model that ignores the tools (it never calls them)"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def test_state_keeps_only_the_last_turn_diagnostics(monkeypatch):
+    from utils import agent
+
+    monkeypatch.setenv("AGENT_ANSWER_CACHE", "0")
+    monkeypatch.setenv("AGENT_CHECKPOINTER", "memory")
+    monkeypatch.setattr(agent, "model_with_tools", ScriptedModel(responses=[AIMessage(content="hola")]))
+    assistant = agent.dummy_agent()
+    for n in range(5):
+        assistant.run_chat(f"pregunta {n}", user_name="u")
+
+    state = assistant.agent.get_state({"configurable": {"thread_id": "u"}}).values
+    assert len(state["messages"]) == 10
+    assert len(state["context_usage"]) == 1 and state["context_usage"][0]["messages"] == 9
+    assert state["tool_timings"] == []
+
+
+def test_scripted_model_cites_the_sources_build_context_reads():
+    from utils.llm_backends import ScriptedChatModel
+
+    question, call, _, _ = _turn(7)
+    result = ToolMessage(content=str({"texto1": "x", "pagina1": 7, "archivo1": "a.pdf",
+                                      "texto2": "y", "pagina2": 2, "archivo2": "b.pdf"}), tool_call_id="call7")
+    reply = ScriptedChatModel()._reply([question, call, result])
+    assert "(a.pdf#page=7)" in reply.content and "(b.pdf#page=2)" in reply.content
@@ -0,0 +1,79 @@
+"""On-disk embedding cache: hits, persistence and crash-safe reuse of rows."""
+
+# === SYSTEM ===
+import json
+
+import numpy as np
+import pytest
+
+from conftest import HashEmbeddings
+from utils.embedding_cache import CachedEmbeddings
+
+
+@pytest.fixture(autouse=True)
+def fresh_files(monkeypatch):
+    """every test starts without cache files opened by the process"""
+    monkeypatch.setattr(CachedEmbeddings, "_files", {})
+
+
+def _reopen(model, folder, **options):
+    """opens the cache again from disk, as a new process would"""
+    CachedEmbeddings._files.clear()
+    return CachedEmbeddings(model, folder, **options)
+
+
+def _consistent_on_disk(folder, model, texts):
+    """checks that every key of the index on disk points to the vector of its text"""
+    with open(f"{folder}/index.json", encoding="utf-8") as f:
+        index = json.load(f)
+    vectors = np.memmap(f"{folder}/vectors.f32", dtype=np.float32, mode="r", shape=(index["capacity"], index["dim"]))
+    by_key = {CachedEmbeddings._key("d", text): text for text in texts}
+    for key, row in index["slots"]:
+        assert np.allclose(vectors[row], model._vector(by_key[key]), atol=1e-6)
+    return len(index["slots"])
+
+
+def test_hits_skip_the_model_and_survive_a_restart(tmp_path):
+    model = HashEmbeddings()
+    cache = CachedEmbeddings(model, str(tmp_path))
+    first = cache.embed_documents(["a", "b", "a"])
+    assert model.embedded == 2 and cache.stats()["entries"] == 2
+    assert np.allclose(cache.embed_documents(["b"]), [first[1]]) and model.embedded == 2 # float32 en disco
+    # Queries y documentos no comparten entradas
+    cache.embed_query("a")
+    assert model.embedded == 3
+    cache.flush()
+
+    reopened = _reopen(model, str(tmp_path))
+    assert np.allclose(reopened.embed_documents(["a", "b"]), first[:2])
+    assert model.embedded == 3
+
+
+def test_full_cache_never_reuses_a_row_still_on_disk(tmp_path):
+    model = HashEmbeddings()
+    cache = CachedEmbeddings(model, str(tmp_path), max_entries=32, flush_every=1000)
+    texts = [f"texto {n}" for n in range(100)]
+    cache.embed_documents(texts[:30])
+    cache.flush()
+    for start in range(30, len(texts), 7):
+        cache.embed_documents(texts[start:start + 7])
+        # Sin flush: lo que hay en disco es lo que vería un proceso tras una caída
+        _consistent_on_disk(str(tmp_path), model, texts)
+    assert cache.stats()["entries"] <= 32
+    cache.flush()
+    assert _consistent_on_disk(str(tmp_path), model, texts) == cache.stats()["entries"]
+
+    # Tras reabrir, las entradas recientes siguen siendo aciertos
+    reopened = _reopen(model, str(tmp_path), max_entries=32)
+    before = model.embedded
+    reopened.embed_documents(texts[-5:])
+    assert model.embedded == before
+
+
+def test_index_is_written_in_batches(tmp_path):
+    model = HashEmbeddings()
+    cache = CachedEmbeddings(model, str(tmp_path), flush_every=10)
+    cache.embed_documents([f"t{n}" for n in range(9)])
+    assert not (tmp_path / "index.json").exists()
+    cache.embed_documents(["t9"])
+    assert (tmp_path / "index.json").exists()
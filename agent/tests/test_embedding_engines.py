@@ -0,0 +1,106 @@
+"""Embedding engines: CPU quota of the container and the engine built for each AGENT_EMBEDDING_ENGINE."""
+
+# === SYSTEM ===
+import os
+import sys
+import types
+
+import pytest
+
+from utils import embedding_engines
+from utils.embedding_engines import build_embeddings, cpu_quota
+
+
+@pytest.fixture
+def cgroup(tmp_path, monkeypatch):
+    """an empty cgroup filesystem on a host with 8 usable CPUs; write(name, text) adds a file"""
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)))
+
+    def write(name, text):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+    write.root = str(tmp_path)
+    return write
+
+
+@pytest.mark.parametrize("cpu_max, cpus", [
+    ("150000 100000\n", 2), # 1.5 CPUs se redondean hacia arriba
+    ("50000 100000\n", 1),
+    ("max 100000\n", 8), # sin límite: la afinidad
+    ("1600000 100000\n", 8), # la cuota no supera la afinidad
+])
+def test_cgroup_v2_cpu_max(cgroup, cpu_max, cpus):
+    cgroup("cpu.max", cpu_max)
+    assert cpu_quota(cgroup.root) == cpus
+
+
+@pytest.mark.parametrize("quota, cpus", [("300000", 3), ("-1", 8)])
+def test_cgroup_v1_quota(cgroup, quota, cpus):
+    cgroup("cpu/cpu.cfs_quota_us", quota)
+    cgroup("cpu/cpu.cfs_period_us", "100000")
+    assert cpu_quota(cgroup.root) == cpus
+
+
+@pytest.mark.parametrize("files", [{}, {"cpu.max": "basura"}, {"cpu/cpu.cfs_quota_us": "200000"}])
+def test_missing_or_unreadable_quota_uses_the_affinity(cgroup, files):
+    for name, text in files.items():
+        cgroup(name, text)
+    assert cpu_quota(cgroup.root) == 8
+
+
+class FakeHuggingFaceEmbeddings:
+    """records the arguments instead of loading a model"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self._client = [types.SimpleNamespace(auto_model="fp32")]
+
+
+@pytest.fixture
+def built(monkeypatch):
+    monkeypatch.setattr(embedding_engines, "HuggingFaceEmbeddings", FakeHuggingFaceEmbeddings)
+    monkeypatch.setattr(embedding_engines, "configure_threads", lambda threads: threads or 2)
+    monkeypatch.delenv("AGENT_EMBEDDING_ENGINE", raising=False)
+    monkeypatch.delenv("AGENT_EMBEDDING_ONNX_FILE", raising=False)
+    return monkeypatch
+
+
+def test_torch_is_the_default_engine(built):
+    model = build_embeddings("modelo", multi_process=True)
+    assert model.kwargs["model_kwargs"] == {"device": "cpu"}
+    assert model.kwargs["multi_process"] is True
+    assert model.kwargs["encode_kwargs"] == {"batch_size": 64, "normalize_embeddings": True}
+
+
+def test_onnx_engine_gets_sized_session_options(built):
+    pytest.importorskip("onnxruntime")
+    built.setenv("AGENT_EMBEDDING_ENGINE", "onnx")
+    built.setenv("AGENT_EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx2.onnx")
+    model = build_embeddings("modelo", multi_process=True, threads=3)
+    kwargs = model.kwargs["model_kwargs"]
+    assert kwargs["backend"] == "onnx" and kwargs["model_kwargs"]["file_name"] == "onnx/model_qint8_avx2.onnx"
+    options = kwargs["model_kwargs"]["session_options"]
+    assert options.intra_op_num_threads == 3 and options.inter_op_num_threads == 1
+    assert model.kwargs["multi_process"] is False
+
+
+def test_torch_int8_quantizes_the_linear_layers(built):
+    calls = []
+    torch = types.ModuleType("torch")
+    torch.nn = types.SimpleNamespace(Linear="Linear")
+    torch.qint8 = "qint8"
+    torch.ao = types.SimpleNamespace(quantization=types.SimpleNamespace(
+        quantize_dynamic=lambda model, layers, dtype: calls.append((model, layers, dtype)) or "int8"))
+    built.setitem(sys.modules, "torch", torch)
+
+    model = build_embeddings("modelo", engine="torch-int8", multi_process=True)
+    assert calls == [("fp32", {"Linear"}, "qint8")]
+    assert model._client[0].auto_model == "int8"
+    assert model.kwargs["multi_process"] is False
+
+
+def test_unknown_engine_is_rejected(built):
+    with pytest.raises(ValueError, match="AGENT_EMBEDDING_ENGINE"):
+        build_embeddings("modelo", engine="tensorrt")
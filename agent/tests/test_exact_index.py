@@ -0,0 +1,94 @@
+"""Exact NumPy search and the switch between the exact and the HNSW index."""
+
+# === SYSTEM ===
+import os
+
+import numpy as np
+import pytest
+
+from conftest import make_pdf, page_text
+from utils.exact_index import ExactIndex
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(200, 16)).astype(np.float32)
+
+
+def _brute_force(vectors, query, k):
+    """ids of the k most similar rows by cosine similarity"""
+    matrix = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = matrix @ (query / np.linalg.norm(query))
+    return [f"v{row}" for row in np.argsort(-scores)[:k]]
+
+
+def test_exact_search_returns_true_neighbours(vectors):
+    index = ExactIndex([f"v{n}" for n in range(len(vectors))], vectors)
+    query = vectors[7] + 0.1
+    hits = index.search(query, 5)
+    assert [cid for cid, _ in hits] == _brute_force(vectors, query, 5)
+    assert all(a >= b for (_, a), (_, b) in zip(hits, hits[1:]))
+    assert index.nbytes == vectors.nbytes
+
+
+def test_allowed_and_exclude(vectors):
+    index = ExactIndex([f"v{n}" for n in range(len(vectors))], vectors)
+    allowed = {f"v{n}" for n in range(0, 200, 2)}
+    hits = index.search(vectors[3], 10, allowed=allowed)
+    assert len(hits) == 10 and all(cid in allowed for cid, _ in hits)
+
+    best = index.search(vectors[3], 1)[0][0]
+    assert best == "v3"
+    assert all(cid != "v3" for cid, _ in index.search(vectors[3], 200, exclude={"v3"}))
+    assert len(index.search(vectors[3], 200, exclude={"v3"})) == 199
+    assert index.search(vectors[3], 3, allowed={"v3"}, exclude={"v3"}) == []
+
+
+def test_update_swaps_rows(vectors):
+    index = ExactIndex([f"v{n}" for n in range(10)], vectors[:10])
+    index.update(add_ids=["new", "v1"], add_vectors=vectors[10:12], remove_ids=["v0"])
+    assert len(index) == 10
+    assert index.search(vectors[10], 1)[0][0] == "new"
+    assert index.search(vectors[11], 1)[0][0] == "v1" # reemplazado por su nuevo vector
+    assert all(cid != "v0" for cid, _ in index.search(vectors[0], 10))
+
+
+def test_auto_switches_by_collection_size(make_rag):
+    rag = make_rag(exact_max_chunks=10)
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    rag.load_or_build_from_folder()
+    assert 0 < len(rag.lexical) <= 10
+    assert rag.search("algebra linea 3", k=3, mode="vector")
+    assert rag.search_stats()["vector_index"] == {"exact": 1, "hnsw": 0}
+    assert rag.index_config()["exact"] and rag.index_config()["exact_index_mb"] > 0
+
+    # Al crecer por encima del límite pasa a HNSW
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text(f"tema{n}") for n in range(6)])
+    rag.load_or_build_from_folder()
+    assert len(rag.lexical) > 10 and not rag.index_config()["exact"]
+    rag.search("algebra linea 3", k=3, mode="vector")
+    assert rag.search_stats()["vector_index"] == {"exact": 1, "hnsw": 1}
+
+    # Forzar 'exact' da los mismos vecinos que HNSW encuentra en una colección pequeña
+    rag.set_index_config(vector_index="exact")
+    forced = rag.search("algebra linea 3", k=3, mode="vector")
+    rag.set_index_config(vector_index="hnsw")
+    assert rag.search("algebra linea 3", k=3, mode="vector") == forced
+    assert rag.search_stats()["vector_index"] == {"exact": 2, "hnsw": 2}
+
+
+def test_exact_index_follows_commits(make_rag):
+    rag = make_rag(vector_index="exact")
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    rag.load_or_build_from_folder()
+    rag.search("algebra", k=1, mode="vector") # carga la matriz
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text("historia")])
+    rag.load_or_build_from_folder()
+    assert len(rag.exact) == len(rag.lexical)
+    os.remove(os.path.join(rag.pdf_storage, "a.pdf"))
+    rag.load_or_build_from_folder()
+    assert len(rag.exact) == len(rag.lexical)
+    assert {r["archivo"] for r in rag.search("algebra", k=5, mode="vector")} == {"b.pdf"}
+    with pytest.raises(ValueError):
+        rag.set_index_config(vector_index="ivf")
@@ -0,0 +1,114 @@
+"""Document-level chunking and the parallel extraction of page ranges."""
+
+# === SYSTEM ===
+import itertools
+from concurrent.futures import Future
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from conftest import make_pdf, page_text
+from utils import extraction
+from utils.extraction import PAGE_SEPARATOR, DocumentChunker, load_and_split, parse_pdfs
+
+
+def _pages(count, lines=12):
+    """pages with paragraphs of different lengths, so chunks end anywhere in a page"""
+    pages = []
+    for n in range(count):
+        paragraphs = [" ".join(f"p{n}s{s}w{w}" for w in range(3 + (n * 7 + s * 5) % 40)) for s in range(lines)]
+        pages.append("\n\n".join(paragraphs) if n % 2 else "\n".join(paragraphs))
+    return pages
+
+
+def _chunk(pages, **options):
+    chunker = DocumentChunker("/docs/libro.pdf", **options)
+    for text in pages:
+        chunker.add_page(text)
+    return chunker.finish()
+
+
+def test_chunks_map_to_the_document_text_and_its_pages():
+    pages = _pages(10)
+    chunks = _chunk(pages, chunk_size=300, chunk_overlap=40)
+    document = PAGE_SEPARATOR.join(pages)
+    starts = list(itertools.accumulate((len(text) + len(PAGE_SEPARATOR) for text in pages[:-1]), initial=0))
+
+    def page_of(offset):
+        return max(n for n, start in enumerate(starts) if start <= offset)
+
+    for chunk in chunks:
+        meta = chunk.metadata
+        assert document[meta["start"]:meta["end"]] == chunk.page_content
+        assert meta["page"] == page_of(meta["start"]) and meta["page_end"] == page_of(meta["end"] - 1)
+        assert meta["filename"] == "libro.pdf" and meta["source"] == "/docs/libro.pdf"
+    crossing = [chunk for chunk in chunks if chunk.metadata["page_end"] > chunk.metadata["page"]]
+    assert crossing # el test solo vale si algún chunk cruza un salto de página
+    assert [chunk.metadata["start"] for chunk in chunks] == sorted(chunk.metadata["start"] for chunk in chunks)
+
+
+def test_streaming_split_matches_a_single_pass():
+    pages = _pages(40)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=40)
+    chunks = _chunk(pages, chunk_size=300, chunk_overlap=40)
+    assert [chunk.page_content for chunk in chunks] == splitter.split_text(PAGE_SEPARATOR.join(pages))
+
+
+class LifoExecutor:
+    """runs the extraction in this process; futures are handed back newest first by `_lifo_wait`"""
+
+    def __init__(self, max_workers, mp_context=None):
+        self.order = itertools.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        future.order = next(self.order)
+        return future
+
+
+def _lifo_wait(futures, return_when):
+    latest = max(futures, key=lambda future: future.order)
+    return {latest}, futures - {latest}
+
+
+def test_pool_reassembles_ranges_in_document_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction, "ProcessPoolExecutor", LifoExecutor)
+    arrivals = []
+
+    def wait(futures, return_when):
+        done, pending = _lifo_wait(futures, return_when)
+        arrivals.extend(future.result()[:2] for future in done)
+        return done, pending
+
+    monkeypatch.setattr(extraction, "wait", wait)
+    paths = []
+    for n, count in enumerate([9, 1, 14]):
+        path = str(tmp_path / f"doc{n}.pdf")
+        make_pdf(path, [page_text(f"doc{n} pagina{p}", lines=8) for p in range(count)])
+        paths.append(path)
+
+    parsed = list(parse_pdfs(paths, workers=2, isolate=True))
+    # Los rangos llegan desordenados (el más reciente primero) y aun así se ensamblan en orden
+    assert arrivals != sorted(arrivals, key=lambda item: (paths.index(item[0]), item[1]))
+    assert [path for path, _, _ in parsed] == paths
+    for (path, pages, chunks), expected in zip(parsed, map(load_and_split, paths)):
+        assert pages == expected[1]
+        assert [(c.page_content, c.metadata) for c in chunks] == [(c.page_content, c.metadata) for c in expected[2]]
+
+
+def test_worker_processes_give_the_same_chunks(tmp_path):
+    path = str(tmp_path / "largo.pdf")
+    make_pdf(path, [page_text(f"tema{p}", lines=6) for p in range(10)])
+    (_, pages, chunks), = parse_pdfs([path], workers=2, isolate=True)
+    _, expected_pages, expected = load_and_split(path)
+    assert pages == expected_pages
+    assert [c.page_content for c in chunks] == [c.page_content for c in expected]
@@ -0,0 +1,65 @@
+"""/get-pdf: full responses, ETag revalidation and Range requests."""
+
+# === SYSTEM ===
+import os
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Las rutas del servicio son relativas (local_rag/...): se resuelven en tmp_path
+    monkeypatch.chdir(tmp_path)
+    agent_app = importlib.import_module("agent_app")
+    folder = tmp_path / "local_rag" / "pdf_files"
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / "libro.pdf").write_bytes(b"%PDF-1.4 " + bytes(range(256)) * 8)
+    project = tmp_path / "local_rag" / "collections" / "proj" / "pdf_files"
+    project.mkdir(parents=True)
+    (project / "libro.pdf").write_bytes(b"%PDF-1.4 del proyecto")
+    # Sin el context manager no corre el lifespan: no se calienta ningún modelo
+    return TestClient(agent_app.app)
+
+
+def test_serves_the_whole_pdf_with_its_etag(client, tmp_path):
+    response = client.get("/get-pdf", params={"file_name": "libro.pdf#page=3"})
+    assert response.status_code == 200
+    assert response.content == (tmp_path / "local_rag" / "pdf_files" / "libro.pdf").read_bytes()
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["etag"].startswith('"') and response.headers["cache-control"] == "no-cache"
+    assert response.headers["content-disposition"].startswith("inline")
+
+    other = client.get("/get-pdf", params={"file_name": "libro", "collection": "proj"})
+    assert other.content == b"%PDF-1.4 del proyecto"
+    assert other.headers["etag"] != response.headers["etag"]
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"otro", {etag}', "*"])
+def test_matching_if_none_match_answers_304(client, if_none_match):
+    etag = client.get("/get-pdf", params={"file_name": "libro.pdf"}).headers["etag"]
+    response = client.get("/get-pdf", params={"file_name": "libro.pdf"},
+                          headers={"If-None-Match": if_none_match.format(etag=etag)})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_stale_etag_gets_the_pdf(client):
+    response = client.get("/get-pdf", params={"file_name": "libro.pdf"}, headers={"If-None-Match": '"viejo"'})
+    assert response.status_code == 200 and response.content.startswith(b"%PDF-")
+
+
+def test_range_answers_206_with_the_requested_bytes(client, tmp_path):
+    data = (tmp_path / "local_rag" / "pdf_files" / "libro.pdf").read_bytes()
+    response = client.get("/get-pdf", params={"file_name": "libro.pdf"}, headers={"Range": "bytes=9-24"})
+    assert response.status_code == 206
+    assert response.content == data[9:25]
+    assert response.headers["content-range"] == f"bytes 9-24/{len(data)}"
+    assert response.headers["etag"]
+
+
+@pytest.mark.parametrize("params", [{"file_name": "otro.pdf"}, {"file_name": "../../agent_app.py"},
+                                    {"file_name": "libro.pdf", "collection": "nadie"}])
+def test_unknown_files_and_collections_are_404(client, params):
+    assert client.get("/get-pdf", params=params).status_code == 404
@@ -0,0 +1,82 @@
+"""Incremental ingestion: only new or changed pdfs are embedded."""
+
+# === SYSTEM ===
+import os
+
+from conftest import make_pdf, page_text
+
+
+def _library(rag):
+    """returns {filename: chunk count} of the manifest"""
+    return {name: len(rag.manifest.chunk_ids(name)) for name in rag.manifest.files()}
+
+
+def test_rerun_with_manifest_embeds_nothing(make_rag, hash_embeddings, tmp_path):
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra"), page_text("calculo")])
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text("historia")])
+    rag.load_or_build_from_folder()
+    library = _library(rag)
+    assert set(library) == {"a.pdf", "b.pdf"} and all(library.values())
+    assert hash_embeddings.embedded == sum(library.values())
+
+    # Caché de embeddings vacía: si no se re-embebe nada es gracias al manifiesto
+    hash_embeddings.embedded = 0
+    reopened = make_rag(cache="empty_cache")
+    assert _library(reopened) == library
+    assert hash_embeddings.embedded == 0
+    assert reopened.search("algebra", k=2, mode="vector")
+
+
+def test_changed_pdf_only_embeds_its_new_chunks(make_rag, hash_embeddings):
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text("historia")])
+    rag.load_or_build_from_folder()
+    b_ids = set(rag.manifest.chunk_ids("b.pdf"))
+    old_a = set(rag.manifest.chunk_ids("a.pdf"))
+    version = rag.index_version
+
+    hash_embeddings.embedded = 0
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra"), page_text("geometria")])
+    rag.load_or_build_from_folder()
+
+    new_a = set(rag.manifest.chunk_ids("a.pdf"))
+    assert set(rag.manifest.chunk_ids("b.pdf")) == b_ids
+    assert hash_embeddings.embedded == len(new_a - old_a) > 0
+    assert rag.index_version != version
+    assert all(cid in rag.lexical for cid in new_a)
+
+
+def test_deleted_pdf_leaves_every_index(make_rag):
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text("historia")])
+    rag.load_or_build_from_folder()
+    b_ids = rag.manifest.chunk_ids("b.pdf")
+
+    os.remove(os.path.join(rag.pdf_storage, "b.pdf"))
+    rag.load_or_build_from_folder()
+
+    assert rag.manifest.files() == {"a.pdf"}
+    assert not any(cid in rag.lexical for cid in b_ids)
+    assert not rag.vector_store._collection.get(ids=b_ids)["ids"]
+    assert "b.pdf" not in rag.page_store.documents()
+
+
+def test_unreadable_pdf_is_skipped_without_blocking_the_others(make_rag):
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra")])
+    make_pdf(os.path.join(rag.pdf_storage, "b.pdf"), [page_text("historia")])
+    with open(os.path.join(rag.pdf_storage, "roto.pdf"), "wb") as f:
+        f.write(b"%PDF-1.4\nno es un pdf")
+    rag.load_or_build_from_folder()
+
+    assert rag.manifest.files() == {"a.pdf", "b.pdf"}
+    assert set(rag.failed_files) == {"roto.pdf"}
+    assert {result["archivo"] for result in rag.search("historia", k=5, mode="lexical")} == {"b.pdf"}
+
+    # Una vez reparado se indexa en la siguiente sincronización
+    make_pdf(os.path.join(rag.pdf_storage, "roto.pdf"), [page_text("geometria")])
+    rag.load_or_build_from_folder()
+    assert rag.manifest.files() == {"a.pdf", "b.pdf", "roto.pdf"} and rag.failed_files == {}
@@ -0,0 +1,141 @@
+"""Upload jobs: the queue, and the commit/rollback of an ingestion next to live searches."""
+
+# === SYSTEM ===
+import os
+import time
+
+import pytest
+
+from conftest import make_pdf, page_text
+from utils.jobs import IngestionJobs
+
+
+def _wait(jobs, job_id, timeout=30):
+    """waits until a job finishes and returns it"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["state"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+def _stage(jobs, name=b"a.pdf"):
+    """writes an upload to the staging folder of a new job"""
+    job_id = jobs.new_id()
+    path = jobs.staging_path(job_id, name.decode())
+    with open(path, "wb") as f:
+        f.write(b"%PDF-")
+    return job_id, path
+
+
+def test_job_reports_progress_and_cleans_its_upload(tmp_path):
+    def ingest(path, progress, collection):
+        progress({"parsed": 1})
+        return {"embedded": 3, "collection": collection}
+
+    jobs = IngestionJobs(ingest=ingest, upload_folder=str(tmp_path / "uploads"))
+    job_id, path = _stage(jobs)
+    assert jobs.submit(job_id, path, collection="proj")["state"] in ("queued", "running", "done")
+    job = _wait(jobs, job_id)
+    assert job["state"] == "done" and job["stats"] == {"embedded": 3, "collection": "proj"}
+    assert job["progress"] == {"parsed": 1} and job["collection"] == "proj"
+    assert not os.path.exists(os.path.dirname(path))
+    assert jobs.pending() == 0
+
+
+def test_failed_job_keeps_its_error(tmp_path):
+    def ingest(path, progress):
+        raise RuntimeError("pdf roto")
+
+    jobs = IngestionJobs(ingest=ingest, upload_folder=str(tmp_path / "uploads"), max_jobs=2)
+    ids = []
+    for _ in range(3):
+        job_id, path = _stage(jobs)
+        jobs.submit(job_id, path)
+        ids.append(job_id)
+        assert _wait(jobs, job_id)["error"] == "pdf roto"
+    # Solo se guardan los últimos max_jobs trabajos terminados
+    assert [job["id"] for job in jobs.list()] == ids[:0:-1]
+    assert os.listdir(tmp_path / "uploads") == []
+
+
+def _library(make_rag, **options):
+    """a RAG with one committed pdf and a second, long pdf (several embedding batches) to upload"""
+    rag = make_rag(**options)
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra"), page_text("calculo")])
+    rag.load_or_build_from_folder()
+    upload = os.path.join(os.path.dirname(rag.base_folder), "upload.pdf")
+    make_pdf(upload, [page_text(f"algebra tema{n}") for n in range(60)])
+    return rag, upload
+
+
+def _visible_files(rag):
+    """files returned by a search in every mode"""
+    return {result["archivo"] for mode in ("vector", "lexical", "hybrid", "auto")
+            for result in rag.search("algebra linea ejemplos", k=5, mode=mode)}
+
+
+@pytest.mark.parametrize("vector_index", ["exact", "hnsw"])
+def test_searches_only_see_a_pdf_once_committed(make_rag, vector_index):
+    rag, upload = _library(make_rag, vector_index=vector_index)
+    seen = []
+
+    def progress(stats):
+        if stats.get("embedded"):
+            seen.append(_visible_files(rag))
+
+    stats = rag.add_new_pdf(upload, progress=progress)
+    assert stats["embedded"] > rag.batch_size # el test solo vale si hubo búsquedas a mitad de ingesta
+    assert seen and all(files == {"a.pdf"} for files in seen)
+    assert "upload.pdf" in _visible_files(rag)
+    assert not rag._uncommitted
+
+
+def test_failed_ingestion_rolls_back(make_rag, hash_embeddings, monkeypatch):
+    rag, upload = _library(make_rag)
+    before = {mode: rag.search("algebra linea ejemplos", k=5, mode=mode) for mode in ("vector", "lexical")}
+    chunks, version = rag.vector_store._collection.count(), rag.index_version
+    calls = []
+    embed = hash_embeddings.embed_documents
+
+    def fail_on_second_batch(texts):
+        calls.append(len(texts))
+        if len(calls) == 2:
+            raise RuntimeError("modelo caído")
+        return embed(texts)
+
+    monkeypatch.setattr(hash_embeddings, "embed_documents", fail_on_second_batch)
+    with pytest.raises(RuntimeError, match="modelo caído"):
+        rag.add_new_pdf(upload)
+
+    assert rag.vector_store._collection.count() == chunks
+    assert rag.manifest.files() == {"a.pdf"} and "upload.pdf" not in rag.page_store.documents()
+    assert len(rag.lexical) == chunks and not rag._uncommitted
+    assert rag.index_version == version
+    for mode, results in before.items():
+        assert rag.search("algebra linea ejemplos", k=5, mode=mode) == results
+
+
+def test_failed_job_leaves_the_pdf_folder_as_it_was(make_rag, hash_embeddings, monkeypatch, tmp_path):
+    rag, upload = _library(make_rag)
+    replacement = tmp_path / "a.pdf"
+    make_pdf(str(replacement), [page_text("geometria")])
+    original = open(os.path.join(rag.pdf_storage, "a.pdf"), "rb").read()
+    monkeypatch.setattr(hash_embeddings, "embed_documents", lambda texts: (_ for _ in ()).throw(RuntimeError("modelo caído")))
+
+    jobs = IngestionJobs(ingest=lambda path, progress: rag.add_new_pdf(path, progress=progress),
+                         upload_folder=str(tmp_path / "uploads"))
+    for source in (upload, str(replacement)):
+        job_id = jobs.new_id()
+        path = jobs.staging_path(job_id, os.path.basename(source))
+        with open(source, "rb") as src, open(path, "wb") as dst:
+            dst.write(src.read())
+        jobs.submit(job_id, path)
+        assert _wait(jobs, job_id)["error"] == "modelo caído"
+
+    # Un pdf nuevo que falla no queda en la carpeta y uno reemplazado recupera su contenido anterior
+    assert sorted(os.listdir(rag.pdf_storage)) == ["a.pdf"]
+    assert open(os.path.join(rag.pdf_storage, "a.pdf"), "rb").read() == original
+    assert rag.manifest.files() == {"a.pdf"}
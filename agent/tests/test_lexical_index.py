@@ -0,0 +1,90 @@
+"""BM25 index, reciprocal rank fusion and the routing of auto searches."""
+
+# === SYSTEM ===
+import os
+
+from conftest import make_pdf, page_text
+from utils.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def _index(tmp_path, texts):
+    """returns a BM25 index with one chunk per text (ids c0, c1...)"""
+    index = BM25Index(str(tmp_path / "bm25.pkl"))
+    for n, text in enumerate(texts):
+        index.add(f"c{n}", text, {"n": n})
+    return index
+
+
+def test_tokenize_drops_accents_and_case():
+    assert tokenize("¿Qué es la Regresión?") == ["que", "es", "la", "regresion"]
+
+
+def test_bm25_ranks_rare_terms_and_respects_allowed(tmp_path):
+    index = _index(tmp_path, [
+        "la regresion lineal ajusta una recta",
+        "la regresion logistica clasifica",
+        "los arboles de decision dividen el espacio",
+    ])
+    hits = index.search("regresion logistica", k=3)
+    assert [cid for cid, _ in hits][:2] == ["c1", "c0"]
+    assert [cid for cid, _ in index.search("regresion", k=3, allowed={"c0", "c2"})] == ["c0"]
+    assert index.search("inexistente") == []
+
+
+def test_bm25_remove_and_reload(tmp_path):
+    index = _index(tmp_path, ["alfa beta", "beta gamma"])
+    index.remove(["c0"])
+    assert "c0" not in index and "alfa" not in index.postings
+    index.save()
+    reloaded = BM25Index(str(tmp_path / "bm25.pkl"))
+    assert len(reloaded) == 1
+    assert [cid for cid, _ in reloaded.search("beta")] == ["c1"]
+    assert reloaded.get("c1") == ("beta gamma", {"n": 1})
+
+
+def test_keyword_terms_ignore_stopwords_and_common_terms(tmp_path):
+    texts = [f"que es la red numero {n} del modelo" for n in range(40)] + ["la svm usa un kernel"] * 3
+    index = _index(tmp_path, texts)
+    assert index.keyword_terms("¿Qué es la SVM?") == ["svm"]
+    assert index.keyword_terms("qué es") == []
+    assert index.keyword_terms("modelo SVM") == [] # 'modelo' está en casi todos los chunks
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+    assert fused[0] == "b"
+    assert set(fused) == {"a", "b", "c", "d"}
+    assert fused.index("a") < fused.index("c")
+
+
+def test_auto_mode_routes_keywords_to_bm25(make_rag):
+    rag = make_rag()
+    pages = [page_text(f"tema{n}") for n in range(30)]
+    pages += ["\n".join(f"la svm {n} separa las clases con un kernel y un margen maximo." for n in range(30))] * 3
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), pages)
+    rag.load_or_build_from_folder()
+
+    assert rag.auto_mode("qué es la SVM", k=3) == "lexical"
+    assert rag.auto_mode("qué es", k=3) == "hybrid"
+    assert rag.auto_mode("¿cómo se estudia un tema con ejemplos?", k=3) == "hybrid"
+    results = rag.search("qué es la SVM", k=3, mode="auto")
+    assert results and all("svm" in result["texto"] for result in results)
+    assert rag.search_stats()["lexical"]["calls"] == 1
+
+
+def test_prefetch_skips_queries_answered_by_bm25(make_rag, monkeypatch):
+    from contextlib import contextmanager
+    from utils import agent
+
+    rag = make_rag()
+    pages = [page_text(f"tema{n}") for n in range(30)]
+    pages += ["\n".join(f"la svm {n} separa las clases con un kernel y un margen maximo." for n in range(30))] * 3
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), pages)
+    rag.load_or_build_from_folder()
+    warmed = []
+    monkeypatch.setattr(rag, "warm_query_embeddings", warmed.extend)
+    monkeypatch.setattr(agent, "use_rag", contextmanager(lambda collection: (yield rag)))
+
+    call = lambda query, **args: {"name": "search", "args": {"query": query, **args}, "id": query}
+    agent._prefetch_search_embeddings([call("qué es la SVM"), call("cómo se estudia un tema"), call("svm", mode="vector")])
+    assert warmed == ["cómo se estudia un tema", "svm"]
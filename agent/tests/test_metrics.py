@@ -0,0 +1,92 @@
+"""Metrics: the prometheus text of each metric type and the AGENT_METRICS_ENABLED switch."""
+
+# === SYSTEM ===
+import importlib.util
+
+from utils import metrics
+from utils.metrics import Counter, Histogram, Registry, server_timing
+
+
+def test_labeled_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram("agent_test_seconds", "Test spans", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value, span="rag.search", mode="hybrid")
+    histogram.observe(0.2, span="rag.rerank")
+
+    assert histogram.render() == [
+        "# HELP agent_test_seconds Test spans",
+        "# TYPE agent_test_seconds histogram",
+        # Las etiquetas salen ordenadas por nombre y el valor del borde cuenta en su bucket
+        'agent_test_seconds_bucket{mode="hybrid",span="rag.search",le="0.1"} 2',
+        'agent_test_seconds_bucket{mode="hybrid",span="rag.search",le="1.0"} 3',
+        'agent_test_seconds_bucket{mode="hybrid",span="rag.search",le="+Inf"} 4',
+        'agent_test_seconds_sum{mode="hybrid",span="rag.search"} 5.65',
+        'agent_test_seconds_count{mode="hybrid",span="rag.search"} 4',
+        'agent_test_seconds_bucket{span="rag.rerank",le="0.1"} 0',
+        'agent_test_seconds_bucket{span="rag.rerank",le="1.0"} 1',
+        'agent_test_seconds_bucket{span="rag.rerank",le="+Inf"} 1',
+        'agent_test_seconds_sum{span="rag.rerank"} 0.2',
+        'agent_test_seconds_count{span="rag.rerank"} 1',
+    ]
+
+
+def test_counter_labels_are_escaped_and_summed_per_series():
+    registry = Registry()
+    counter = registry.counter("agent_test_total", "Test events")
+    assert registry.counter("agent_test_total", "otro texto") is counter
+    counter.inc(collection='a"b\\c\nd')
+    counter.inc(2, collection='a"b\\c\nd')
+    counter.inc()
+
+    assert registry.render() == (
+        "# HELP agent_test_total Test events\n"
+        "# TYPE agent_test_total counter\n"
+        "agent_test_total 1\n"
+        'agent_test_total{collection="a\\"b\\\\c\\nd"} 3\n'
+    )
+
+
+def test_spans_feed_the_histogram_and_the_request_trace(monkeypatch):
+    histogram = Histogram("agent_span_seconds", "spans")
+    monkeypatch.setattr(metrics, "SPANS", histogram)
+    trace = []
+    token = metrics.current_trace.set(trace)
+    try:
+        with metrics.span("rag.search", mode="lexical"):
+            pass
+        metrics.observe_span("rag.search", 0.002)
+        metrics.observe_span("llm.call", 0.0105)
+    finally:
+        metrics.current_trace.reset(token)
+
+    assert [name for name, _ in trace] == ["rag.search", "rag.search", "llm.call"]
+    assert 'agent_span_seconds_count{mode="lexical",span="rag.search"} 1' in histogram.render()
+    assert server_timing([("rag.search", 0.001), ("rag.search", 0.002), ("llm.call", 0.0105)]) == \
+        "rag_search;dur=3.0, llm_call;dur=10.5"
+
+
+def test_disabled_metrics_leave_functions_untouched(monkeypatch):
+    monkeypatch.setenv("AGENT_METRICS_ENABLED", "0")
+    # Una copia del módulo importada con la variable a 0 (el original sigue activo para el resto)
+    spec = importlib.util.spec_from_file_location("metrics_disabled", metrics.__file__)
+    disabled = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(disabled)
+    assert disabled.ENABLED is False
+
+    def search():
+        return "ok"
+
+    async def answer():
+        return "ok"
+
+    assert disabled.timed("rag.search")(search) is search
+    assert disabled.timed("agent.answer")(answer) is answer
+    trace = []
+    token = disabled.current_trace.set(trace)
+    try:
+        with disabled.span("rag.search"):
+            pass
+        disabled.observe_span("rag.search", 0.5)
+    finally:
+        disabled.current_trace.reset(token)
+    assert trace == [] and len(disabled.SPANS.render()) == 2 # solo HELP y TYPE, ninguna serie
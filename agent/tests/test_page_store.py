@@ -0,0 +1,76 @@
+"""Page store: the text/offsets files, their memory maps and reads racing a close."""
+
+# === SYSTEM ===
+import os
+import threading
+
+from conftest import make_pdf, page_text
+from utils.page_store import PageStore
+
+
+def test_pages_round_trip_through_the_files(tmp_path):
+    pages = ["primera página: ñandú, 数学, €", "", "tercera"]
+    PageStore(str(tmp_path)).write("a.pdf", pages)
+    PageStore(str(tmp_path)).write("vacio.pdf", ["", ""])
+
+    # Otra instancia lee solo de disco
+    store = PageStore(str(tmp_path))
+    assert store.documents() == ["a.pdf", "vacio.pdf"]
+    assert [store.get("a.pdf", n) for n in range(3)] == pages
+    assert store.page_count("a.pdf") == 3 and store.page_count("otro.pdf") == 0
+    assert store.get("a.pdf", 3) is None and store.get("a.pdf", -1) is None and store.get("otro.pdf", 0) is None
+    assert store.get("vacio.pdf", 1) == "" # sin texto no hay mmap
+
+    # Reescribir cierra el mapa abierto y la siguiente lectura ve la versión nueva
+    store.write("a.pdf", ["nueva"])
+    assert store.page_count("a.pdf") == 1 and store.get("a.pdf", 0) == "nueva"
+    store.remove("a.pdf")
+    assert store.documents() == ["vacio.pdf"] and store.get("a.pdf", 0) is None
+    store.close()
+
+
+def test_close_waits_for_a_read_in_progress(tmp_path, monkeypatch):
+    store = PageStore(str(tmp_path))
+    store.write("a.pdf", ["uno", "dos"])
+    opened, resume = threading.Event(), threading.Event()
+    open_map = store._open
+
+    def paused_open(filename):
+        """opens the map and stops the reader before it slices it"""
+        entry = open_map(filename)
+        opened.set()
+        resume.wait(5)
+        return entry
+
+    monkeypatch.setattr(store, "_open", paused_open)
+    result = []
+    reader = threading.Thread(target=lambda: result.append(store.get("a.pdf", 1)))
+    reader.start()
+    assert opened.wait(5)
+    # La descarga de la colección llega con el mmap abierto a mitad de lectura
+    closer = threading.Thread(target=store.close)
+    closer.start()
+    closer.join(0.2)
+    assert closer.is_alive() # close espera al lock de la lectura
+    resume.set()
+    reader.join(5)
+    closer.join(5)
+    assert result == ["dos"] and store._maps == {}
+
+
+def test_missing_page_files_are_rebuilt_from_the_pdf(make_rag, hash_embeddings):
+    rag = make_rag()
+    make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra"), page_text("calculo")])
+    rag.load_or_build_from_folder()
+    expected = rag.return_by_page([0, 1])
+    rag.close()
+    for name in os.listdir(rag.page_store.folder):
+        os.remove(os.path.join(rag.page_store.folder, name))
+
+    # Los vectores siguen en la caché: solo se vuelve a leer el pdf
+    hash_embeddings.embedded = 0
+    reopened = make_rag()
+    reopened.load_or_build_from_folder()
+    assert reopened.page_store.documents() == ["a.pdf"]
+    assert reopened.return_by_page([0, 1]) == expected and "calculo linea" in expected["2"]
+    assert hash_embeddings.embedded == 0
@@ -0,0 +1,68 @@
+"""Ingestion pipeline: batches across documents, stats and progress, and errors of the embedder."""
+
+# === SYSTEM ===
+import os
+
+import pytest
+
+from conftest import HashEmbeddings, make_pdf, page_text
+from utils.ingestion import IngestionPipeline
+
+
+class RecordingStore:
+    """stands in for the langchain Chroma store and keeps every upsert"""
+
+    def __init__(self):
+        self._collection = self
+        self.batches = []
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.batches.append(list(ids))
+
+
+def _pdfs(tmp_path, pages_per_file):
+    paths = []
+    for n, pages in enumerate(pages_per_file):
+        path = str(tmp_path / f"doc{n}.pdf")
+        make_pdf(path, [page_text(f"tema{n} pagina{p}") for p in range(pages)])
+        paths.append(path)
+    return paths
+
+
+def _plan(parsed):
+    def plan(path, pages, chunks):
+        parsed.append((os.path.basename(path), len(pages), len(chunks)))
+        return [(f"{os.path.basename(path)}::{i}", chunk) for i, chunk in enumerate(chunks)]
+    return plan
+
+
+def test_batches_cross_document_boundaries(tmp_path):
+    store, parsed, seen = RecordingStore(), [], []
+    pipeline = IngestionPipeline(HashEmbeddings(), store, batch_size=4, workers=1)
+    stats = pipeline.run(_pdfs(tmp_path, [1, 2, 1]), _plan(parsed),
+                         progress=lambda stats: seen.append(dict(stats)))
+
+    chunks = sum(count for _, _, count in parsed)
+    assert [name for name, _, _ in parsed] == ["doc0.pdf", "doc1.pdf", "doc2.pdf"]
+    # Todos los batches van llenos salvo el último, aunque mezclen documentos
+    assert [len(batch) for batch in store.batches[:-1]] == [4] * (len(store.batches) - 1)
+    assert sum(len(batch) for batch in store.batches) == chunks
+    assert any(len({cid.split("::")[0] for cid in batch}) > 1 for batch in store.batches)
+
+    assert stats["files"] == 3 and stats["parsed"] == 3
+    assert stats["pages"] == 4 == sum(pages for _, pages, _ in parsed)
+    assert stats["chunks"] == stats["to_embed"] == stats["embedded"] == chunks
+    # Un aviso por pdf analizado y otro por batch escrito, con contadores que solo crecen
+    assert len(seen) == 3 + len(store.batches)
+    assert [s["embedded"] for s in seen] == sorted(s["embedded"] for s in seen)
+    assert seen[-1]["embedded"] == chunks
+
+
+@pytest.mark.parametrize("pages", [[1], [3, 3]])
+def test_embedding_error_reaches_the_caller(tmp_path, pages):
+    # Con un solo batch el fallo llega después de leer el final de la cola: no debe quedarse esperando
+    embeddings = HashEmbeddings()
+    embeddings.embed_documents = lambda texts: (_ for _ in ()).throw(RuntimeError("modelo caído"))
+    pipeline = IngestionPipeline(embeddings, RecordingStore(), batch_size=4, workers=1)
+    with pytest.raises(RuntimeError, match="modelo caído"):
+        pipeline.run(_pdfs(tmp_path, pages), _plan([]))
@@ -0,0 +1,73 @@
+"""Second retrieval stage: merging of neighbouring chunks and the latency budget of the reranker."""
+
+# === SYSTEM ===
+import os
+import time
+
+import pytest
+
+from conftest import make_pdf, page_text
+from utils.reranker import BudgetExceeded, LexicalReranker, merge_chunks
+
+DOCUMENT = " ".join(f"palabra{n:03d}" for n in range(60)) # 659 caracteres
+
+
+def _span(name, start, end, source="/pdf/libro.pdf"):
+    """a chunk of DOCUMENT with its offsets"""
+    return name, DOCUMENT[start:end], {"source": source, "page": start // 300, "page_end": (end - 1) // 300,
+                                       "start": start, "end": end}
+
+
+def _text(name, start, end, page=0):
+    """a chunk of DOCUMENT without offsets (indexes built before document-level chunks)"""
+    return name, DOCUMENT[start:end], {"source": "/pdf/libro.pdf", "page": page}
+
+
+@pytest.mark.parametrize("chunk", [_span, _text])
+def test_a_chunk_that_bridges_two_selected_ones_joins_all_three(chunk):
+    a, b, c = chunk("a", 0, 250), chunk("b", 200, 450), chunk("c", 400, 659)
+    # Sin volver a comparar, b se unía a "a" y dejaba el solape con "c" repetido
+    [(cid, text, metadata)] = merge_chunks([a, c, b])
+    assert cid == "a" and text == DOCUMENT
+    if "start" in metadata:
+        assert (metadata["start"], metadata["end"], metadata["page"], metadata["page_end"]) == (0, 659, 0, 2)
+
+
+def test_duplicated_and_contained_chunks_are_dropped():
+    a, inner, far = _span("a", 0, 300), _span("dentro", 100, 200), _span("lejos", 500, 659)
+    merged = merge_chunks([far, a, inner, a])
+    assert [(cid, text) for cid, text, _ in merged] == [("lejos", DOCUMENT[500:659]), ("a", DOCUMENT[0:300])]
+
+    # Misma posición en otro pdf: no es un duplicado
+    other = _span("otro", 0, 300, source="/pdf/otro.pdf")
+    assert [cid for cid, _, _ in merge_chunks([a, other])] == ["a", "otro"]
+    # Sin offsets, el mismo texto en otra página tampoco
+    assert [cid for cid, _, _ in merge_chunks([_text("p0", 0, 300), _text("p1", 0, 300, page=1)])] == ["p0", "p1"]
+
+
+class SlowReranker:
+    """reverses the candidates unless the budget ran out"""
+
+    def rerank(self, query, candidates, deadline=None):
+        if deadline is not None and time.perf_counter() > deadline:
+            raise BudgetExceeded()
+        return list(reversed(candidates))
+
+
+def test_budget_fallback_keeps_the_first_stage_order(make_rag):
+    plain = make_rag(folder="plain")
+    slow = make_rag(folder="slow", reranker=SlowReranker(), rerank_budget_ms=-1)
+    for rag in (plain, slow):
+        make_pdf(os.path.join(rag.pdf_storage, "a.pdf"), [page_text("algebra"), page_text("calculo")])
+        rag.load_or_build_from_folder()
+
+    assert slow.search("algebra ejemplos", k=3, mode="lexical") == plain.search("algebra ejemplos", k=3, mode="lexical")
+    assert slow.search_stats()["rerank"] == {"calls": 1, "fallbacks": 1}
+    assert "rerank" not in plain.search_stats()
+
+
+def test_lexical_reranker_raises_once_past_its_deadline():
+    candidates = [_span("a", 0, 250), _span("b", 400, 659)]
+    with pytest.raises(BudgetExceeded):
+        LexicalReranker().rerank("palabra001", candidates, deadline=time.perf_counter() - 1)
+    assert [cid for cid, _, _ in LexicalReranker().rerank("palabra050", candidates)] == ["b", "a"]
@@ -3,102 +3,466 @@
 import os
 import shutil
 import glob
+import time
+import itertools
+import threading
 
 # === DOCUMENT PROCESSING (ETL) ===
 # Logic to extract text from PDFs and split them into manageable pieces
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils.ingestion import IngestionPipeline, load_and_split
 
 # === VECTOR EMBEDDINGS ===
 # The brain that converts text into mathematical numbers (vectors)
-from langchain_huggingface import HuggingFaceEmbeddings
+from utils.embedding_engines import build_embeddings
+from utils.embedding_cache import CachedEmbeddings
 
 # === VECTOR DATABASE (STORAGE) ===
 # The database where the vectors are stored for fast searching
 from langchain_chroma import Chroma
 
+# === INCREMENTAL INGESTION ===
+# Manifest with the content hash of every indexed pdf and chunk
+from utils.manifest import IngestionManifest, file_sha256, chunk_id
+
+# === PAGE STORE ===
+# Text of every page on disk so search_by_page never parses a PDF
+from utils.page_store import PageStore
+
+# === LEXICAL SEARCH ===
+# BM25 inverted index fused with the dense results for exact-term queries
+from utils.lexical_index import BM25Index, reciprocal_rank_fusion
+
+# === EXACT VECTOR SEARCH ===
+# Brute-force NumPy search: ground truth of the HNSW index and faster for small collections
+from utils.exact_index import ExactIndex
+
+# === RE-RANKING ===
+# Optional second stage over a larger candidate set, plus merging of neighbouring chunks
+from utils.reranker import BudgetExceeded, build_reranker, merge_chunks
+
+# === QUERY CACHES ===
+# In-process LRU + TTL caches for query embeddings and search results
+from utils.cache import TTLCache
+
+# === INSTRUMENTATION ===
+# Span timing of the hot paths (exported by /metrics)
+from utils.metrics import span, timed
+
+SEARCH_MODES = ("auto", "vector", "lexical", "hybrid")
+DEFAULT_COLLECTION_NAME = "langchain" # nombre que langchain_chroma da a la colección por defecto
+LEXICAL_CHUNK_BYTES = 5 * 1024 # estimación por chunk del índice BM25 (texto, metadatos y postings), medida con tracemalloc
+VECTOR_INDEXES = ("auto", "hnsw", "exact")
+# Versiones únicas en todo el proceso: una colección descargada y recargada nunca repite una versión anterior
+_INDEX_VERSIONS = itertools.count(1)
+AUTO_LEXICAL_MAX_TERMS = 3 # en auto, las búsquedas de hasta 3 términos raros van solo a BM25
+EXACT_MAX_CHUNKS = 10000 # ~40 MB de vectores fp32 y ~4 ms por query con NumPy en un núcleo
+# Nombre de cada parámetro HNSW en la metadata de la colección -> nombre en su configuración de Chroma
+HNSW_CONFIG_NAMES = {"space": "space", "M": "max_neighbors", "construction_ef": "ef_construction", "search_ef": "ef_search"}
+
+
+def build_cached_embeddings(base_folder, model_name="BAAI/bge-m3", engine="torch", batch_size=64, multi_process=False):
+    """builds the embedding model wrapped with its on-disk cache
+
+    Args:
+        base_folder: folder where the embedding_cache folder lives
+        model_name: Hugging Face id of the embedding model or path to a local snapshot of it
+        engine: 'torch' (fp32), 'torch-int8' or 'onnx' (see utils.embedding_engines)
+        batch_size: chunks embedded per forward pass
+        multi_process: whether to use multi process
+    Returns:
+        CachedEmbeddings: the model behind the cache
+    """
+    # Hilos según la cuota de CPU del contenedor (antes fijos a 8)
+    model = build_embeddings(model_name, engine=engine, batch_size=batch_size, multi_process=multi_process)
+    # Caché en disco: los chunks y queries ya vistos no vuelven a pasar por el modelo
+    return CachedEmbeddings(
+        model,
+        cache_folder=os.path.join(base_folder, "embedding_cache", LocalRAGAgent._cache_name(model_name, engine))
+    )
+
+
 class LocalRAGAgent:
     
-    def __init__(self, pdf_path=None, base_folder="local_rag", multi_process=False):
+    def __init__(self, pdf_path=None, base_folder="local_rag", multi_process=False, ingest_workers=None,
+                 model_name="BAAI/bge-m3", embedding_engine="torch", reranker=None,
+                 rerank_candidates=20, rerank_budget_ms=200, embeddings=None, query_embedding_cache=None,
+                 chroma_client=None, collection_name=DEFAULT_COLLECTION_NAME, collection_metadata=None,
+                 vector_index="auto", exact_max_chunks=EXACT_MAX_CHUNKS, search_ef=None):
         """inicializes the class compiling the RAG and doing the configuration
         
         Args:
             pdf_path: The path to the pdf file
             base_folder: The base folder for the agent
             multi_process: Whether to use multi process
+            ingest_workers: Number of processes used to parse pdfs (defaults to the cpu count)
+            model_name: Hugging Face id of the embedding model or path to a local snapshot of it
+            embedding_engine: 'torch' (fp32), 'torch-int8' or 'onnx' (see utils.embedding_engines)
+            reranker: 'none', 'lexical' or 'cross-encoder' (see utils.reranker), None reads AGENT_RERANKER
+            rerank_candidates: minimum number of first-stage candidates passed to the reranker
+            rerank_budget_ms: time the reranker may take before search falls back to the first stage
+            embeddings: CachedEmbeddings shared with other collections (built here if None)
+            query_embedding_cache: TTLCache of query vectors shared with other collections
+            chroma_client: chromadb client shared with other collections (None opens base_folder/vector_store)
+            collection_name: name of the Chroma collection
+            collection_metadata: metadata of the Chroma collection when it is created (e.g. hnsw:M)
+            vector_index: 'hnsw' (Chroma), 'exact' (brute force with NumPy) or 'auto'
+                (exact while the collection has at most exact_max_chunks chunks)
+            exact_max_chunks: largest collection searched exactly in 'auto'
+            search_ef: ef of the HNSW queries (None keeps the one of the collection)
         Returns:
         LocalRAGAgent: class to chat
         """
         self.base_folder = base_folder
         self.db_folder = os.path.join(base_folder, "vector_store")
         self.pdf_storage = os.path.join(base_folder, "pdf_files")
-        self.model_name = "BAAI/bge-m3"
-        self.docs = [] # Inicializamos para evitar errores
+        self.model_name = model_name
+        self.embedding_engine = embedding_engine
+        self.batch_size = 64
+        self.ingest_workers = ingest_workers
         
-        # Configuración para Ryzen 7 PRO 250
-        os.environ["OMP_NUM_THREADS"] = "8"
+        self.chroma_client = chroma_client
+        self.collection_name = collection_name
+        self.collection_metadata = collection_metadata
+        if vector_index not in VECTOR_INDEXES:
+            raise ValueError(f"vector_index must be one of {VECTOR_INDEXES}, got {vector_index!r}")
+        self.vector_index = vector_index
+        self.exact_max_chunks = exact_max_chunks
+        self.search_ef = search_ef
         
-        os.makedirs(self.db_folder, exist_ok=True)
+        if chroma_client is None:
+            os.makedirs(self.db_folder, exist_ok=True)
         os.makedirs(self.pdf_storage, exist_ok=True)
 
-        # CORRECCIÓN: Quitamos 'show_progress_bar' de encode_kwargs para evitar el duplicado
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=self.model_name,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={
-                'batch_size': 64, 
-                'normalize_embeddings': True
-            },
-            show_progress=True, # LangChain lo maneja desde aquí
-            multi_process=multi_process 
-        )
+        if embeddings is None:
+            embeddings = build_cached_embeddings(base_folder, self.model_name, self.embedding_engine,
+                                                 self.batch_size, multi_process)
+        self.embeddings = embeddings
         
         self.vector_store = None
+        self.manifest = IngestionManifest(os.path.join(base_folder, "manifest.json"))
+        self.page_store = PageStore(os.path.join(base_folder, "page_store"))
+        self.lexical = BM25Index(os.path.join(base_folder, "lexical_index.pkl"))
+        self.search_latency = {} # mode -> [calls, total ms]
+        self.query_embedding_cache = query_embedding_cache if query_embedding_cache is not None else TTLCache(maxsize=2048, ttl=3600)
+        self.result_cache = TTLCache(maxsize=1024, ttl=600)
+        self.reranker = reranker if hasattr(reranker, "rerank") else build_reranker(reranker)
+        self.rerank_candidates = rerank_candidates
+        self.rerank_budget_ms = rerank_budget_ms
+        self.rerank_counts = {"calls": 0, "fallbacks": 0}
+        self.vector_index_counts = {"exact": 0, "hnsw": 0}
+        self.exact = None # ExactIndex, cargado la primera vez que se usa
+        self._exact_lock = threading.Lock()
+        # Un solo escritor a la vez; search no toma el lock y sigue sirviendo el índice anterior
+        self._write_lock = threading.RLock()
+        self._uncommitted = set() # chunks ya escritos en los índices pero aún no confirmados
+        self.failed_files = {} # filename -> error de los pdfs que la última sincronización de la carpeta no pudo indexar
+        self.index_version = next(_INDEX_VERSIONS) # cambia con cada commit: las entradas de caché de versiones anteriores no se usan
         
         if pdf_path:
             self.add_new_pdf(pdf_path)
         else:
             self.load_or_build_from_folder()
 
+    @staticmethod
+    def _cache_name(model_name, engine="torch"):
+        """name of the embedding cache folder of a model (hub id or local snapshot) and engine
+
+        Quantized engines return slightly different vectors, so they never share a cache with fp32.
+        """
+        if os.path.isdir(model_name):
+            name = "local__" + os.path.basename(os.path.normpath(model_name))
+        else:
+            name = model_name.replace("/", "__")
+        return name if engine == "torch" else f"{name}__{engine}"
+
+    def warm_up(self):
+        """pays the first-use costs before the first request: a forward pass of the model,
+        the vector store connection and the memory maps of the page store"""
+        self.embeddings.embeddings.embed_query("warm up") # el modelo directo: no ensucia la caché
+        if self.vector_store is not None:
+            self.vector_store._collection.count()
+        for filename in self.page_store.documents():
+            self.page_store.page_count(filename)
+        if self.reranker is not None:
+            self.reranker.warm_up()
+        if self.vector_store is not None and self._use_exact():
+            self._exact_index()
+
     def load_or_build_from_folder(self):
-        """loads or builds the vector store from the folder"""
-        pdf_files = glob.glob(os.path.join(self.pdf_storage, "*.pdf"))
+        """synchronizes the vector store with the folder indexing only new or changed pdfs"""
+        with self._write_lock:
+            self._sync_folder()
+
+    def _sync_folder(self):
+        """indexes the new or changed pdfs of the folder and removes the deleted ones (must hold the write lock)"""
+        pdf_files = sorted(glob.glob(os.path.join(self.pdf_storage, "*.pdf")))
         
-        if not pdf_files:
+        if not pdf_files and not self.manifest.files():
             print(f"No hay archivos PDF en {self.pdf_storage}.")
             return
 
-        if os.path.exists(os.path.join(self.db_folder, "chroma.sqlite3")):
-            print(f"Cargando base de datos existente...")
+        self._open_vector_store()
+        current = {os.path.basename(pdf): pdf for pdf in pdf_files}
+
+        # 1. Borramos los vectores de los PDFs que ya no existen
+        for filename in sorted(self.manifest.files() - set(current)):
+            self._remove_document(filename)
+
+        # 2. Indexamos solo los PDFs nuevos o modificados
+        changed = {}
+        stored_pages = set(self.page_store.documents())
+        for filename, pdf in current.items():
+            file_hash = file_sha256(pdf)
+            if (self.manifest.file_hash(filename) != file_hash
+                    or filename not in stored_pages
+                    or not self._lexically_indexed(filename)):
+                changed[pdf] = file_hash
+        self.failed_files = {}
+        if changed:
+            try:
+                self._index_pdfs(changed)
+            except Exception as e:
+                # Un pdf ilegible no puede impedir el arranque: se reintenta uno a uno y se saltan los que fallan
+                print(f"Error en la ingesta conjunta ({e}); indexando los PDFs uno a uno.")
+                for pdf, file_hash in changed.items():
+                    try:
+                        self._index_pdfs({pdf: file_hash})
+                    except Exception as e:
+                        print(f"No se pudo indexar {os.path.basename(pdf)}: {e}")
+                        self.failed_files[os.path.basename(pdf)] = str(e)
+
+        self._save_indexes()
+
+    def _lexically_indexed(self, filename):
+        """checks that every chunk of a file is in the lexical index"""
+        return all(cid in self.lexical for cid in self.manifest.chunk_ids(filename))
+
+    def _save_indexes(self):
+        """persists the manifest and the lexical index"""
+        self.manifest.save()
+        self.lexical.save()
+
+    def _open_vector_store(self):
+        """opens the persisted vector store, dropping stores without a manifest of the current version"""
+        if self.vector_store is not None:
+            return self.vector_store
+
+        if self.chroma_client is not None:
             self.vector_store = Chroma(
-                persist_directory=self.db_folder,
+                client=self.chroma_client,
+                collection_name=self.collection_name,
+                collection_metadata=self.collection_metadata,
                 embedding_function=self.embeddings
             )
-            # Cargamos el primer PDF a memoria para que return_by_page funcione
-            loader = PyPDFLoader(pdf_files[0])
-            self.docs = loader.load()
         else:
-            print(f"Creando base de datos desde cero...")
-            all_chunks = []
-            for pdf in pdf_files:
-                all_chunks.extend(self._process_pdf(pdf))
-            
-            self.vector_store = Chroma.from_documents(
-                documents=all_chunks,
-                embedding=self.embeddings,
-                persist_directory=self.db_folder
+            self.vector_store = Chroma(
+                persist_directory=self.db_folder,
+                collection_name=self.collection_name,
+                collection_metadata=self.collection_metadata,
+                embedding_function=self.embeddings
             )
+        collection = self.vector_store._collection
+        if not self.manifest.exists and (collection.count() > 0 or len(self.lexical) > 0):
+            # Sin manifiesto (o de otra versión) no sabemos qué chunks hay: reconstruimos una sola vez
+            print("Base de datos sin manifiesto, se reindexará desde cero...")
+            if collection.count() > 0:
+                collection.delete(ids=collection.get(include=[])["ids"])
+            self.lexical.remove(list(self.lexical.chunks))
+        self._apply_index_config()
+        return self.vector_store
+
+    def _apply_index_config(self):
+        """applies search_ef to the collection and warns about build parameters it was not created with"""
+        collection = self.vector_store._collection
+        current = collection.configuration.get("hnsw") or {}
+        for key, value in (self.collection_metadata or {}).items():
+            name = HNSW_CONFIG_NAMES.get(key.removeprefix("hnsw:"))
+            if name and name != "ef_search" and current.get(name) not in (None, value):
+                # M, construction_ef y space se fijan al crear la colección
+                print(f"Aviso: la colección {self.collection_name} se creó con {name}={current.get(name)}, "
+                      f"no con {value}; reindexa en una colección nueva para cambiarlo.")
+        if self.search_ef is not None and current.get("ef_search") != self.search_ef:
+            # Debe hacerse antes de la primera query: Chroma carga el índice con el ef de ese momento
+            collection.modify(configuration={"hnsw": {"ef_search": int(self.search_ef)}})
+
+    def index_config(self):
+        """returns the configuration of the vector index
+
+        Returns:
+            dict: 'vector_index' (and whether searches are exact now), 'exact_max_chunks',
+                'chunks', the memory of the exact index and the 'hnsw' parameters of the collection
+        """
+        hnsw = {}
+        if self.vector_store is not None:
+            current = self.vector_store._collection.configuration.get("hnsw") or {}
+            hnsw = {key: current.get(name) for key, name in HNSW_CONFIG_NAMES.items()}
+        return {
+            "vector_index": self.vector_index,
+            "exact": self._use_exact(),
+            "exact_max_chunks": self.exact_max_chunks,
+            "chunks": len(self.lexical),
+            "exact_index_mb": self.exact.nbytes / 2**20 if self.exact is not None else 0.0,
+            "hnsw": hnsw,
+        }
+
+    def set_index_config(self, vector_index=None, search_ef=None, exact_max_chunks=None):
+        """changes how the vectors are searched (the HNSW build parameters cannot change)
+
+        Args:
+            vector_index: 'auto', 'hnsw' or 'exact'
+            search_ef: ef of the HNSW queries, persisted in the collection (Chroma keeps the ef
+                an index was loaded with, so it applies from the next start of the service)
+            exact_max_chunks: largest collection searched exactly in 'auto'
+        """
+        if vector_index is not None:
+            if vector_index not in VECTOR_INDEXES:
+                raise ValueError(f"vector_index must be one of {VECTOR_INDEXES}, got {vector_index!r}")
+            self.vector_index = vector_index
+        if exact_max_chunks is not None:
+            self.exact_max_chunks = exact_max_chunks
+        if search_ef is not None:
+            self.search_ef = search_ef
+            if self.vector_store is not None:
+                self._apply_index_config()
+        self.result_cache.clear()
+
+    def _use_exact(self):
+        """checks whether vector searches go to the exact index (by mode and collection size)"""
+        if self.vector_index != "auto":
+            return self.vector_index == "exact"
+        return len(self.lexical) <= self.exact_max_chunks
+
+    def _exact_index(self):
+        """returns the exact index, loading the vectors from Chroma on first use"""
+        if self.exact is not None:
+            return self.exact
+        with self._exact_lock:
+            while self.exact is None:
+                version = self.index_version
+                with span("rag.exact_load"):
+                    exact = ExactIndex.from_collection(self.vector_store._collection)
+                # Si hubo un commit mientras leíamos, volvemos a leer
+                if version == self.index_version:
+                    self.exact = exact
+        return self.exact
+
+    def _update_exact(self, add_ids=(), remove_ids=(), batch_size=5000):
+        """applies a change of the vector store to the exact index when it is loaded"""
+        with self._exact_lock:
+            if self.exact is None:
+                return
+            ids, vectors = [], []
+            add_ids = list(add_ids)
+            for offset in range(0, len(add_ids), batch_size):
+                batch = self.vector_store._collection.get(ids=add_ids[offset:offset + batch_size], include=["embeddings"])
+                ids.extend(batch["ids"])
+                vectors.extend(batch["embeddings"])
+            self.exact.update(ids, vectors, remove_ids)
+
+    def _index_pdfs(self, pdfs, progress=None, isolate_parsing=False):
+        """indexes pdfs through the ingestion pipeline embedding only the chunks not already stored
+
+        The new vectors are written to Chroma while the pipeline runs but searches
+        exclude them until every pdf is embedded; only then are the old chunks
+        deleted, the new ones added to the lexical index and the pages and
+        manifest replaced, so readers switch from the previous index to the new
+        one at once. If the run fails the new vectors are removed.
+
+        Args:
+            pdfs: dict mapping the path of each pdf to the sha256 of its content
+            progress: optional function called with the pipeline stats as it advances
+            isolate_parsing: parse in a worker process even a single pdf (see IngestionPipeline)
+        Returns:
+            dict: throughput stats of the ingestion
+        """
+        pending = {} # filename -> (sha256, chunk ids, stale ids, pages, chunks missing from the lexical index)
+        written = []
+
+        def plan(path, pages, chunks):
+            filename = os.path.basename(path)
+            unique = {}
+            for chunk in chunks:
+                unique.setdefault(chunk_id(filename, chunk), chunk)
+
+            old_ids = set(self.manifest.chunk_ids(filename))
+            stale_ids = old_ids - set(unique)
+            new_ids = [cid for cid in unique if cid not in old_ids]
+            # Ocultos para search hasta el commit
+            self._uncommitted.update(new_ids)
+            written.extend(new_ids)
+            # BM25 los recibe en el commit: hasta entonces no compiten con los chunks publicados
+            lexical = [(cid, chunk.page_content, chunk.metadata) for cid, chunk in unique.items() if cid not in self.lexical]
+
+            pending[filename] = (pdfs[path], list(unique), stale_ids, pages, lexical)
+            print(f"{filename}: {len(new_ids)} chunks nuevos, {len(stale_ids)} eliminados, "
+                  f"{len(unique) - len(new_ids)} sin cambios.")
+            return [(cid, unique[cid]) for cid in new_ids]
+
+        pipeline = IngestionPipeline(
+            self.embeddings,
+            self.vector_store,
+            batch_size=self.batch_size,
+            workers=self.ingest_workers,
+            isolate_parsing=isolate_parsing
+        )
+        try:
+            stats = pipeline.run(list(pdfs), plan, progress=progress)
+        except Exception:
+            self.embeddings.flush()
+            # Deshacemos lo escrito: el índice anterior queda intacto
+            if written:
+                self.vector_store.delete(ids=written)
+                self._update_exact(remove_ids=written)
+            self._uncommitted.difference_update(written)
+            raise
+
+        # Una escritura del índice de la caché por ingesta, no una por batch
+        self.embeddings.flush()
+        # Commit: se borran los chunks viejos y se publican los nuevos
+        removed = set()
+        for filename, (file_hash, ids, stale_ids, pages, lexical) in pending.items():
+            if stale_ids:
+                self.vector_store.delete(ids=list(stale_ids))
+                self.lexical.remove(stale_ids)
+                removed.update(stale_ids)
+            for cid, text, metadata in lexical:
+                self.lexical.add(cid, text, metadata)
+            self.page_store.write(filename, pages)
+            self.manifest.record(filename, file_hash, ids)
+        self._uncommitted.difference_update(written)
+        self.index_version = next(_INDEX_VERSIONS)
+        self._update_exact(add_ids=written, remove_ids=removed)
+        self.result_cache.clear()
+        return stats
+
+    def _remove_document(self, filename):
+        """removes every vector of a pdf that is no longer in the folder"""
+        ids = self.manifest.chunk_ids(filename)
+        if ids:
+            self.vector_store.delete(ids=ids)
+            self.lexical.remove(ids)
+        self.manifest.remove(filename)
+        self.page_store.remove(filename)
+        self.index_version = next(_INDEX_VERSIONS)
+        self._update_exact(remove_ids=ids)
+        self.result_cache.clear()
+        print(f"{filename}: eliminado del índice ({len(ids)} chunks).")
 
     def _process_pdf(self, path):
         """processes the pdf file"""
-        loader = PyPDFLoader(path)
-        docs = loader.load()
-        self.docs = docs # Guardamos los documentos cargados
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-        return text_splitter.split_documents(docs)
-
-    def add_new_pdf(self, pdf_path):
-        """adds a new pdf file to the vector store with sanitized naming"""
+        _, _, chunks = load_and_split(path)
+        return chunks
+
+    def add_new_pdf(self, pdf_path, progress=None, isolate_parsing=False):
+        """adds a new pdf file to the vector store with sanitized naming
+
+        Args:
+            pdf_path: path of the pdf (copied to the pdf folder if it is not there)
+            progress: optional function called with the ingestion stats as it advances
+            isolate_parsing: parse in a worker process (for ingestion next to a live web handler)
+        Returns:
+            dict: stats of the ingestion, or None if the pdf was already indexed
+        """
         # 1. Obtener el nombre original
         original_filename = os.path.basename(pdf_path)
         
@@ -108,60 +472,342 @@ class LocalRAGAgent:
         # 3. Definir la ruta de destino con el nuevo nombre
         dest_path = os.path.join(self.pdf_storage, sanitized_filename)
         
-        # 4. Copiar el archivo (si no existe ya con ese nombre)
-        if not os.path.exists(dest_path):
-            shutil.copy(pdf_path, dest_path)
-        
-        # 5. Procesar el PDF usando la ruta del archivo ya renombrado
-        chunks = self._process_pdf(dest_path)
-        
-        if self.vector_store is None:
-            self.vector_store = Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
-                persist_directory=self.db_folder
-            )
-        else:
-            self.vector_store.add_documents(chunks)
-            
+        with self._write_lock:
+            # 4. Copiar el archivo (si no existe ya con ese nombre o si su contenido cambió)
+            file_hash = file_sha256(pdf_path)
+            copied = False
+            backup_path = dest_path + ".bak"
+            if not os.path.exists(dest_path) or file_sha256(dest_path) != file_hash:
+                if os.path.exists(dest_path):
+                    os.replace(dest_path, backup_path)
+                copied = True
+                shutil.copy(pdf_path, dest_path + ".tmp")
+                os.replace(dest_path + ".tmp", dest_path)
+
+            # 5. Procesar el PDF solo si su contenido cambió desde la última indexación
+            try:
+                self._open_vector_store()
+                stats = None
+                if (self.manifest.file_hash(sanitized_filename) != file_hash
+                        or sanitized_filename not in self.page_store.documents()
+                        or not self._lexically_indexed(sanitized_filename)):
+                    stats = self._index_pdfs({dest_path: file_hash}, progress=progress, isolate_parsing=isolate_parsing)
+                    self._save_indexes()
+            except Exception:
+                # El archivo que falló no se queda en la carpeta: /get-pdf y el próximo arranque ven el anterior
+                if copied:
+                    if os.path.exists(backup_path):
+                        os.replace(backup_path, dest_path)
+                    elif os.path.exists(dest_path):
+                        os.remove(dest_path)
+                raise
+            if copied and os.path.exists(backup_path):
+                os.remove(backup_path)
+
         print(f"Archivo indexado como: {sanitized_filename}")
+        return stats
 
-    def search(self, query, k=3):
+    @timed("rag.search")
+    def search(self, query, k=3, mode="auto", files=None):
         """searches for the query in the vector store
         
         Args:
             query: the query to search for
             k: the number of results to return
+            mode: 'vector' (dense), 'lexical' (BM25), 'hybrid' (both fused with
+                reciprocal rank fusion) or 'auto' (lexical for short keyword
+                queries with enough hits, hybrid otherwise)
+            files: optional list of pdf names; only their chunks are searched
         Returns:
-            list: list of results
+            list: list of results, at most k (neighbouring chunks of a page are merged into one)
         """
         if not self.vector_store:
             return []
-        results = self.vector_store.similarity_search(query, k=k)
-        return [{
-            "texto": doc.page_content,
-            "pagina": doc.metadata.get('page', 0) + 1,
-            "archivo": os.path.basename(doc.metadata.get('source', 'desconocido')),
-        } for doc in results]
-
-    def return_by_page(self, pages: list[int]):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {SEARCH_MODES}")
+
+        files = self.normalize_files(files)
+        allowed = None
+        if files is not None:
+            allowed = {cid for name in files for cid in self.manifest.chunk_ids(name)}
+            if not allowed:
+                return []
+
+        key = (query, k, mode, files, self.index_version)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return [dict(result) for result in cached]
+
+        start = time.perf_counter()
+        # Con reranker la primera etapa trae más candidatos de los que se devuelven
+        depth = max(k * 4, self.rerank_candidates) if self.reranker is not None else k
+        # Ingesta en curso: sus vectores ya están en Chroma pero no existen hasta el commit
+        hidden = frozenset(self._uncommitted)
+        lexical_hits = None
+        if mode == "auto":
+            mode, lexical_hits = self._auto_mode(query, k, depth, allowed)
+
+        if mode == "vector":
+            candidates = self._dense_search(self.embed_query(query), depth, files=files, allowed=allowed, hidden=hidden)
+        elif mode == "lexical":
+            if lexical_hits is None:
+                with span("rag.lexical_query"):
+                    lexical_hits = self.lexical.search(query, depth, allowed=allowed)
+            candidates = [(cid, *self.lexical.get(cid)) for cid, _ in lexical_hits]
+        else:
+            candidates = self._hybrid_search(query, depth, files=files, allowed=allowed, hidden=hidden)
+
+        if self.reranker is not None:
+            candidates = self._rerank(query, candidates, start)
+        results = [self._format(text, metadata) for _, text, metadata in merge_chunks(candidates[:k])]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        calls, total_ms = self.search_latency.get(mode, (0, 0.0))
+        self.search_latency[mode] = [calls + 1, total_ms + elapsed_ms]
+        self.result_cache.put(key, [dict(result) for result in results], cost_ms=elapsed_ms)
+        return results
+
+    @staticmethod
+    def normalize_files(files):
+        """returns the sorted tuple of sanitized pdf names of a scope (None when not restricted)"""
+        if files is None:
+            return None
+        names = set()
+        for name in files:
+            name = os.path.basename(name.split('#')[0]).replace(' ', '_')
+            names.add(name if name.lower().endswith('.pdf') else name + '.pdf')
+        return tuple(sorted(names))
+
+    @staticmethod
+    def _where(files):
+        """Chroma metadata filter restricting a query to some pdfs (None when not restricted)"""
+        if files is None:
+            return None
+        return {"filename": files[0]} if len(files) == 1 else {"filename": {"$in": list(files)}}
+
+    def embed_query(self, query):
+        """returns the embedding of a query using the in-process cache"""
+        vector = self.query_embedding_cache.get(query)
+        if vector is None:
+            start = time.perf_counter()
+            with span("rag.embed_query"):
+                vector = self.embeddings.embed_query(query)
+            self.query_embedding_cache.put(query, vector, cost_ms=(time.perf_counter() - start) * 1000)
+        return vector
+
+    def _dense_search(self, vector, k, files=None, allowed=None, hidden=frozenset()):
+        """returns the k nearest chunks of a query vector, from the exact index or from Chroma
+
+        Args:
+            vector: the query vector
+            k: number of results
+            files: pdf names the search is restricted to (None for all)
+            allowed: chunk ids of those files (None for all)
+            hidden: chunk ids written by an ingestion that has not committed yet (never returned)
+        Returns:
+            list: (chunk_id, text, metadata) sorted by similarity
+        """
+        if self._use_exact():
+            with span("rag.exact_query"):
+                hits = self._exact_index().search(vector, k, allowed=allowed, exclude=hidden)
+            self.vector_index_counts["exact"] += 1
+            # El texto y la metadata están también en el índice léxico: Chroma no se toca
+            return [(cid, *self.lexical.get(cid)) for cid, _ in hits if cid in self.lexical]
+        where, ids = self._where(files), None
+        if hidden:
+            # Solo los chunks confirmados (los del manifiesto, ya filtrados por files si los hay)
+            ids = list(allowed) if allowed is not None else [
+                cid for name in self.manifest.files() for cid in self.manifest.chunk_ids(name)
+            ]
+            where = None
+            if not ids:
+                return []
+        with span("rag.chroma_query"):
+            docs = self.vector_store.similarity_search_by_vector(vector, k=k, filter=where, ids=ids)
+        self.vector_index_counts["hnsw"] += 1
+        return [(doc.id or doc.page_content, doc.page_content, doc.metadata) for doc in docs]
+
+    def _hybrid_search(self, query, k, candidates=20, files=None, allowed=None, hidden=frozenset()):
+        """fuses the dense and lexical rankings with reciprocal rank fusion
+
+        Args:
+            query: the query
+            k: number of fused results
+            candidates: minimum depth of each ranking
+            files: pdf names the dense search is restricted to (None for all)
+            allowed: chunk ids the lexical search is restricted to (None for all)
+            hidden: chunk ids of an ingestion that has not committed yet
+        Returns:
+            list: the k best (chunk_id, text, metadata)
+        """
+        depth = max(k * 4, candidates)
+        by_id = {}
+        dense_ids = []
+        for cid, text, metadata in self._dense_search(self.embed_query(query), depth, files=files, allowed=allowed,
+                                                      hidden=hidden):
+            by_id[cid] = (text, metadata)
+            dense_ids.append(cid)
+        with span("rag.lexical_query"):
+            lexical_ids = [cid for cid, _ in self.lexical.search(query, depth, allowed=allowed)]
+
+        results = []
+        for cid in reciprocal_rank_fusion([dense_ids, lexical_ids])[:k]:
+            text, metadata = by_id[cid] if cid in by_id else self.lexical.get(cid)
+            results.append((cid, text, metadata))
+        return results
+
+    def _rerank(self, query, candidates, start):
+        """re-orders the first-stage candidates, keeping their order if the latency budget runs out
+
+        Args:
+            query: the query
+            candidates: list of (chunk_id, text, metadata) in first-stage order
+            start: time.perf_counter() at which the search started (the budget covers the whole search)
+        Returns:
+            list: the candidates re-ordered
+        """
+        self.rerank_counts["calls"] += 1
+        try:
+            with span("rag.rerank"):
+                return self.reranker.rerank(query, candidates, deadline=start + self.rerank_budget_ms / 1000)
+        except BudgetExceeded:
+            self.rerank_counts["fallbacks"] += 1
+            return candidates
+
+    def _auto_mode(self, query, k, depth, allowed):
+        """picks the mode of an auto search
+
+        Returns:
+            tuple: ("lexical", BM25 hits) for keyword queries with at least k hits, ("hybrid", None) otherwise
+        """
+        keywords = self.lexical.keyword_terms(query)
+        if not keywords or len(keywords) > AUTO_LEXICAL_MAX_TERMS:
+            return "hybrid", None
+        # Camino rápido: BM25 no necesita pasar la query por el modelo
+        with span("rag.lexical_query"):
+            hits = self.lexical.search(" ".join(keywords), depth, allowed=allowed)
+        return ("lexical", hits) if len(hits) >= k else ("hybrid", None)
+
+    def auto_mode(self, query, k=3, files=None):
+        """returns the mode ('lexical' or 'hybrid') an auto search of the query would use
+
+        Args:
+            query: the query
+            k: number of results the search asks for
+            files: optional list of pdf names the search is restricted to
+        Returns:
+            str: 'lexical' when the query is answered from BM25 alone, 'hybrid' otherwise
+        """
+        files = self.normalize_files(files)
+        allowed = None
+        if files is not None:
+            allowed = {cid for name in files for cid in self.manifest.chunk_ids(name)}
+        return self._auto_mode(query, k, k, allowed)[0]
+
+    def warm_query_embeddings(self, queries):
+        """embeds the queries not cached yet in one batched forward pass
+
+        Used when the LLM asks for several searches at once, so that the
+        searches that follow only hit the cache.
+
+        Args:
+            queries: list of queries that are about to be searched
+        """
+        missing = list(dict.fromkeys(q for q in queries if q not in self.query_embedding_cache))
+        if not missing:
+            return
+        start = time.perf_counter()
+        with span("rag.embed_query_batch"):
+            vectors = self.embeddings.embed_queries(missing)
+        cost_ms = (time.perf_counter() - start) * 1000 / len(missing)
+        for query, vector in zip(missing, vectors):
+            self.query_embedding_cache.put(query, vector, cost_ms=cost_ms)
+
+    @staticmethod
+    def _format(text, metadata):
+        """converts a chunk into the result dictionary returned by search
+        (with 'pagina_final' when the chunk continues on the next pages)"""
+        result = {
+            "texto": text,
+            "pagina": metadata.get('page', 0) + 1,
+            "archivo": os.path.basename(metadata.get('source', 'desconocido')),
+        }
+        if metadata.get('page_end', metadata.get('page', 0)) != metadata.get('page', 0):
+            result["pagina_final"] = metadata['page_end'] + 1
+        return result
+
+    def cache_stats(self):
+        """returns the counters of the query caches
+
+        Returns:
+            dict: stats of the query embedding, result and on-disk embedding caches
+        """
+        return {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+            "embedding_disk_cache": self.embeddings.stats(),
+        }
+
+    def search_stats(self):
+        """returns the number of calls and the average latency of each search mode
+
+        Returns:
+            dict: mode -> {'calls', 'avg_ms'}, 'vector_index' -> dense searches per index ('exact', 'hnsw')
+                and 'rerank' -> {'calls', 'fallbacks'} when a reranker is set
+        """
+        stats = {
+            mode: {"calls": calls, "avg_ms": total_ms / calls}
+            for mode, (calls, total_ms) in self.search_latency.items()
+        }
+        stats["vector_index"] = dict(self.vector_index_counts)
+        if self.reranker is not None:
+            stats["rerank"] = dict(self.rerank_counts)
+        return stats
+
+    def memory_bytes(self):
+        """estimated memory that close() and dropping the object release (BM25 index and exact matrix), used to unload cold collections
+
+        The vectors and HNSW graph live in the Chroma client shared by every collection and are not counted.
+        """
+        exact = self.exact.nbytes if self.exact is not None else 0
+        return len(self.lexical) * LEXICAL_CHUNK_BYTES + exact
+
+    def close(self):
+        """releases what the collection keeps in memory (page maps and caches); the object must not be used after"""
+        with self._write_lock:
+            self.page_store.close()
+            self.result_cache.clear()
+            self.exact = None
+
+    @timed("rag.return_by_page")
+    def return_by_page(self, pages: list[int], filename: str = None):
         """returns the text of each page requested
         
         Args:
             pages: list of pages to return
+            filename: pdf to read the pages from (optional when only one pdf is indexed)
         Returns:
             dict: dictionary with the text of each page
         """
+        documents = self.page_store.documents()
+        if not documents:
+            return {"error": "No hay documentos indexados."}
+
+        if filename is None:
+            if len(documents) > 1:
+                return {"error": "Hay varios documentos, indica el nombre del archivo.", "archivos": documents}
+            filename = documents[0]
+        filename = os.path.basename(filename).replace(' ', '_')
+        if not filename.lower().endswith('.pdf'):
+            filename += '.pdf'
+        if filename not in documents:
+            return {"error": f"Archivo no encontrado: {filename}", "archivos": documents}
+
         result = {}
-        if not self.docs:
-            return {"error": "No hay documentos cargados en memoria."}
-            
         for page in pages:
+            text = self.page_store.get(filename, page)
             # Validación simple para no salirnos del rango del PDF
-            if 0 <= page < len(self.docs):
-                result[str(page + 1)] = self.docs[page].page_content
-            else:
-                result[str(page + 1)] = "Página fuera de rango."
+            result[str(page + 1)] = text if text is not None else "Página fuera de rango."
         return result
 
 if __name__ == "__main__":
@@ -7,57 +7,168 @@ WITH DEBUGGING AND VISUALIZATION
 # Basic utilities for the OS and environment variables
 import os
 import json
+import time
+import asyncio
 import operator
+import threading
+import contextvars
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 
 # === TYPING & STRUCTURE ===
 # Defining the shapes of our data and state
 from typing import Literal, Annotated
 from typing_extensions import TypedDict
-from langchain_core.messages import AnyMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage # LangChain messages
+from langchain_core.messages import AnyMessage, HumanMessage, AIMessage, AIMessageChunk, SystemMessage, ToolMessage # LangChain messages
 
 # === AGENT TOOLS & RAG ===
 # Logic for the functions the agent can call and your custom PDF logic
 from langchain_core.tools import tool  # LangChain tools
-from utils.RAG import LocalRAGAgent  # custom local module
+from langchain_core.runnables import RunnableLambda, RunnableConfig # sync + async node implementations
+from utils.collection_registry import CollectionRegistry, DEFAULT_COLLECTION # named collections sharing one model
+from utils.RAG import EXACT_MAX_CHUNKS # largest collection searched exactly by default
 
 # === ZONE 4: THE BRAIN (LLM) ===
-# Connection to Google Gemini and model initialization
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chat_models import init_chat_model
+# Pluggable backend: Google Gemini or a deterministic local stand-in (AGENT_LLM_BACKEND)
+from utils.llm_backends import build_chat_model
+
+# === CONTEXT BUDGET ===
+# Compaction of old turns so the prompt of each llm_call stays bounded
+from utils.context import build_context, estimate_tokens, link_collection
+
+# === ANSWER CACHE ===
+# Final answers of fresh conversations reused for similar questions (AGENT_ANSWER_CACHE)
+from utils.answer_cache import build_answer_cache
+
+# === INSTRUMENTATION ===
+# Span timing exported by /metrics
+from utils.metrics import REGISTRY, observe_span, timed
 
 # === THE GRAPH (LANGGRAPH) ===
 # Orchestration of the agent's flow and memory
 from langgraph.graph import StateGraph, START, END # LangGraph default states
 from langgraph.prebuilt import ToolNode # LangGraph prebuilt node
-from langgraph.checkpoint.memory import MemorySaver # LangGraph memory saver
+from utils.checkpointer import build_checkpointer, clear_checkpointer # bounded sqlite or in-memory checkpointer (AGENT_CHECKPOINTER)
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-# global RAG used o the agent class
-local_RAG = LocalRAGAgent() 
+# collections of the library; the default one is built on first use or warmed up in background by the web handler
+# (loading the embedding model and opening the stores takes seconds: importing this module must not)
+memory_budget = float(os.getenv("AGENT_COLLECTIONS_MEMORY_MB", "0"))
+collections = CollectionRegistry(
+    model_name=os.getenv("AGENT_EMBEDDING_MODEL_PATH") or "BAAI/bge-m3",
+    embedding_engine=os.getenv("AGENT_EMBEDDING_ENGINE", "torch"),
+    max_loaded=int(os.getenv("AGENT_MAX_LOADED_COLLECTIONS", "8")),
+    memory_budget_mb=memory_budget if memory_budget > 0 else None,
+    rerank_candidates=int(os.getenv("AGENT_RERANK_CANDIDATES", "20")),
+    rerank_budget_ms=float(os.getenv("AGENT_RERANK_BUDGET_MS", "200")),
+    vector_index=os.getenv("AGENT_VECTOR_INDEX", "auto"),
+    exact_max_chunks=int(os.getenv("AGENT_EXACT_MAX_CHUNKS", str(EXACT_MAX_CHUNKS))),
+    search_ef=int(os.getenv("AGENT_HNSW_SEARCH_EF", "0")) or None
+)
+_local_RAG = None
+_rag_lock = threading.Lock()
+rag_status = {"state": "cold", "error": None, "build_seconds": None}
+
+def get_rag(collection=DEFAULT_COLLECTION):
+    """returns the RAG of a collection, building the default one first (concurrent callers wait for the same build)
+
+    Raises:
+        CollectionNotFound: if the collection does not exist
+    """
+    global _local_RAG
+    if _local_RAG is None:
+        with _rag_lock:
+            if _local_RAG is None:
+                rag_status.update(state="warming", error=None)
+                start = time.perf_counter()
+                try:
+                    rag = collections.get(DEFAULT_COLLECTION)
+                    rag.warm_up()
+                except Exception as e:
+                    rag_status.update(state="failed", error=str(e)) # el siguiente uso lo reintenta
+                    raise
+                seconds = time.perf_counter() - start
+                observe_span("rag.build", seconds)
+                rag_status.update(state="ready", build_seconds=seconds)
+                _local_RAG = rag
+    if collection == DEFAULT_COLLECTION:
+        return _local_RAG
+    return collections.get(collection)
+
+@contextmanager
+def use_rag(collection=DEFAULT_COLLECTION):
+    """yields the RAG of a collection keeping it loaded until the block ends (see CollectionRegistry.use)
+
+    Raises:
+        CollectionNotFound: if the collection does not exist
+    """
+    get_rag() # la colección por defecto primero: nunca se descarga
+    with collections.use(collection) as rag:
+        yield rag
+
+def _config_scope(config):
+    """returns the scope stored in the config of a run (None if the request has none)"""
+    return ((config or {}).get("configurable") or {}).get("scope")
+
+def _scope(config):
+    """returns the (collection, files) a request is restricted to, from the config of the run"""
+    scope = _config_scope(config) or {}
+    return scope.get("collection") or DEFAULT_COLLECTION, scope.get("files")
+
+def rag_is_ready():
+    """checks if the RAG is built and warm"""
+    return _local_RAG is not None
+
+def warm_up_rag_in_background(on_ready=None):
+    """builds the RAG in a daemon thread so the web handler can answer while the model loads
 
-# initialization of the api conection to the llm model
-model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash-lite", #gemini-2.5-flash-lite
-    temperature=0
+    Args:
+        on_ready: optional callback called once the RAG is warm
+    Returns:
+        threading.Thread: the warm-up thread
+    """
+    def run():
+        try:
+            get_rag()
+        except Exception as e:
+            print(f"Error al precargar el RAG: {e}")
+            return
+        if on_ready is not None:
+            on_ready()
+
+    thread = threading.Thread(target=run, name="rag-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# bounded pool where the async path runs the tools (embedding and chroma are blocking/CPU bound)
+rag_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_RAG_WORKERS", "4")),
+    thread_name_prefix="rag"
 )
 
 #tool definition 
 
 @tool
-def search(query: str, k:int = 3) -> dict:
+def search(query: str, k:int = 3, mode: Literal["auto", "vector", "lexical", "hybrid"] = "auto",
+           config: RunnableConfig = None) -> dict:
     """Searches on the RAG what chunk of text is relevant to the query and the _n tells the ranking order
     
     Args:
         query: The query to search for
         k: Number of chunks to return
+        mode: 'lexical' for exact terms (formula names, acronyms, symbols), 'vector' for meaning,
+            'hybrid' for both, 'auto' to let the system choose
     Returns:
         dict: List of relevant chunks of text
     """
-    RAGresults = local_RAG.search(query,k)
+    # La colección y los archivos vienen del request (config), el LLM no puede salirse de ellos
+    collection, files = _scope(config)
+    with use_rag(collection) as rag:
+        RAGresults = rag.search(query, k, mode, files=files)
     result = {}
     i = 0
     for RAGresult in RAGresults:
@@ -67,17 +178,30 @@ def search(query: str, k:int = 3) -> dict:
     return result
 
 @tool
-def search_by_page(pages: list[int]) -> dict:
-    """Returns the full text of specific pages from the PDF to provide a summary or detail.
+def search_by_page(pages: list[int], filename: str | None = None, config: RunnableConfig = None) -> dict:
+    """Returns the full text of specific pages from a PDF to provide a summary or detail.
     
     Args:
         pages: List of page numbers (integers) to retrieve.
+        filename: Name of the PDF the pages belong to (the 'archivo' field returned by search).
+            Only optional when the library has a single PDF.
     Returns:
         dict: A dictionary where keys are page numbers and values are the text content.
     """
-    # 1. Llamamos al método correcto de la clase (return_by_page)
-    # Importante: Asegúrate de que 'local_RAG' sea la instancia de tu clase
-    content_dict = local_RAG.return_by_page(pages)
+    collection, files = _scope(config)
+    with use_rag(collection) as rag:
+        if files is not None:
+            # Solo las páginas de los archivos a los que se limita la consulta
+            files = rag.normalize_files(files)
+            if filename is None:
+                if len(files) != 1:
+                    return {"error": "Hay varios documentos, indica el nombre del archivo.", "archivos": list(files)}
+                filename = files[0]
+            elif rag.normalize_files([filename])[0] not in files:
+                return {"error": f"Archivo fuera del alcance de la consulta: {filename}", "archivos": list(files)}
+
+        # 1. Llamamos al método correcto de la clase (return_by_page)
+        content_dict = rag.return_by_page(pages, filename)
     
     # 2. Simplemente devolvemos el diccionario. 
     # El LLM es lo suficientemente inteligente para leer este JSON.
@@ -88,20 +212,43 @@ def search_by_page(pages: list[int]) -> dict:
 # Augment the LLM with tools
 tools = [search, search_by_page]
 tools_by_name = {tool.name: tool for tool in tools}
-model_with_tools = model.bind_tools(tools)
+
+# the model is built on first use so importing this module needs no network nor API key
+model_with_tools = None
+
+def get_model_with_tools():
+    """returns the chat model of the configured backend with the tools bound"""
+    global model_with_tools
+    if model_with_tools is None:
+        model_with_tools = build_chat_model().bind_tools(tools)
+    return model_with_tools
+
+def set_chat_model(model):
+    """replaces the chat model (e.g. a ScriptedChatModel in benchmarks)"""
+    global model_with_tools
+    model_with_tools = model.bind_tools(tools)
 
 
+def _current_turn(current, update):
+    """reducer of the per-turn diagnostics: appends the entries of a node, None starts a new turn"""
+    # Solo el último turno: con operator.add crecerían sin límite en cada checkpoint del hilo
+    if update is None:
+        return []
+    return (current or []) + update
+
 # this is a custom dictionary to manage the chat history of the agent (also the state)
 class MessagesState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
     llm_calls: int
+    tool_timings: Annotated[list[dict], _current_turn] # one entry per tool_node execution of the last turn
+    context_usage: Annotated[list[dict], _current_turn] # tokens sent by each llm_call of the last turn
 
-# funtions that will be used as nodes for the agent
-def llm_call(state: dict):
-    """LLM decides whether to call a tool or not"""
-    
-    # Definimos las instrucciones de formato
-    system_prompt = '''
+def _new_turn(*messages):
+    """state input of a new turn: its messages, discarding the diagnostics of the previous one"""
+    return {"messages": list(messages), "tool_timings": None, "context_usage": None}
+
+# Definimos las instrucciones de formato
+SYSTEM_PROMPT = '''
         You are an expert research assistant. Your task is to answer questions based strictly on the provided PDF context.
 
         FORMATTING RULES:
@@ -124,28 +271,127 @@ def llm_call(state: dict):
 
         STRICT CONSTRAINTS:
         - Use the 'source' and 'page' fields from the metadata provided in the context.
+        - A search result with 'pagina_final' spans the pages 'pagina' to 'pagina_final': link the page where the cited information is.
         - The link MUST follow the pattern: filename.pdf#page=number
         - If the answer is not in the PDF context, state that you do not have enough information.
         '''
 
+# the prompt of each llm_call is built within this budget (estimated tokens)
+CONTEXT_BUDGET_TOKENS = int(os.getenv("AGENT_CONTEXT_BUDGET_TOKENS", "12000"))
+CONTEXT_KEEP_TURNS = int(os.getenv("AGENT_CONTEXT_KEEP_TURNS", "2"))
+SYSTEM_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+LLM_CALLS = REGISTRY.counter("agent_llm_calls_total", "Calls made to the LLM by the graph")
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "agent_context_tokens", "Estimated tokens sent to the LLM per call",
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+)
+TOOL_CALLS = REGISTRY.counter("agent_tool_calls_total", "Tool calls executed by the graph")
+
+# funtions that will be used as nodes for the agent
+def _prompt(state: dict):
+    """builds the messages sent to the LLM within the context budget"""
+    context = build_context(
+        state["messages"],
+        budget_tokens=CONTEXT_BUDGET_TOKENS,
+        reserved_tokens=SYSTEM_PROMPT_TOKENS,
+        keep_turns=CONTEXT_KEEP_TURNS
+    )
+    system = SYSTEM_PROMPT + "\n\n" + context["summary"] if context["summary"] else SYSTEM_PROMPT
+    return [SystemMessage(content=system)] + context["messages"], context
+
+def _llm_update(state: dict, response, context):
+    """builds the state update of an llm_call, reporting the tokens it sent"""
+    CONTEXT_TOKENS.observe(context["tokens"])
+    usage = getattr(response, "usage_metadata", None) or {}
     return {
-        "messages": [
-            model_with_tools.invoke(
-                [SystemMessage(content=system_prompt)] + state["messages"]
-            )
-        ],
-        "llm_calls": state.get('llm_calls', 0) + 1
+        "messages": [response],
+        "llm_calls": state.get('llm_calls', 0) + 1,
+        "context_usage": [{
+            "estimated_tokens": context["tokens"],
+            "input_tokens": usage.get("input_tokens"), # reported by the backend, when available
+            "messages": len(context["messages"]),
+            "compacted": context["compacted"],
+            "dropped_turns": context["dropped_turns"],
+        }],
     }
 
-def tool_node(state: dict):
-    """Performs the tool call"""
+@timed("graph.llm_call")
+def llm_call(state: dict):
+    """LLM decides whether to call a tool or not"""
+    LLM_CALLS.inc()
+    prompt, context = _prompt(state)
+    return _llm_update(state, get_model_with_tools().invoke(prompt), context)
+
+@timed("graph.llm_call")
+async def allm_call(state: dict):
+    """Async version of llm_call (the event loop is free while Gemini answers)"""
+    LLM_CALLS.inc()
+    prompt, context = _prompt(state)
+    return _llm_update(state, await get_model_with_tools().ainvoke(prompt), context)
+
+def _prefetch_search_embeddings(tool_calls, config=None):
+    """embeds the queries of all the search calls of a turn in a single forward pass"""
+    calls = [call["args"] for call in tool_calls if call["name"] == "search" and call["args"].get("mode", "auto") != "lexical"]
+    if len(calls) < 2:
+        return
+    collection, files = _scope(config)
+    with use_rag(collection) as rag:
+        # Las búsquedas auto que BM25 va a responder solo no necesitan embedding
+        queries = [
+            args["query"] for args in calls
+            if args.get("mode", "auto") != "auto" or rag.auto_mode(args["query"], args.get("k", 3), files=files) != "lexical"
+        ]
+        if len(queries) > 1:
+            rag.warm_query_embeddings(queries)
+
+def _timed_tool_call(tool_call, config=None):
+    """runs one tool call (with the scope of the request) and returns its ToolMessage and its timing"""
+    start = time.perf_counter()
+    tool = tools_by_name[tool_call["name"]]
+    observation = tool.invoke(tool_call["args"], config={"configurable": {"scope": _config_scope(config)}})
+    seconds = time.perf_counter() - start
+    observe_span("tool", seconds, tool=tool_call["name"])
+    TOOL_CALLS.inc(tool=tool_call["name"])
+    timing = {"name": tool_call["name"], "tool_call_id": tool_call["id"], "ms": seconds * 1000}
+    return ToolMessage(content=observation, tool_call_id=tool_call["id"]), timing
+
+def _tool_node_update(results, start):
+    """builds the state update keeping the order of the tool calls"""
+    return {
+        "messages": [message for message, _ in results],
+        "tool_timings": [{
+            "batch_ms": (time.perf_counter() - start) * 1000,
+            "tools": [timing for _, timing in results],
+        }],
+    }
 
-    result = []
-    for tool_call in state["messages"][-1].tool_calls:
-        tool = tools_by_name[tool_call["name"]]
-        observation = tool.invoke(tool_call["args"])
-        result.append(ToolMessage(content=observation, tool_call_id=tool_call["id"]))
-    return {"messages": result}
+def _submit(func, *args):
+    """submits a call to the RAG pool keeping the context of the caller (the trace of the request)"""
+    return rag_executor.submit(contextvars.copy_context().run, func, *args)
+
+@timed("graph.tool_node")
+def tool_node(state: dict, config: RunnableConfig):
+    """Performs the tool calls concurrently (results keep the order of the calls)"""
+    start = time.perf_counter()
+    tool_calls = state["messages"][-1].tool_calls
+    _prefetch_search_embeddings(tool_calls, config)
+    if len(tool_calls) == 1:
+        results = [_timed_tool_call(tool_calls[0], config)]
+    else:
+        results = [future.result() for future in [_submit(_timed_tool_call, call, config) for call in tool_calls]]
+    return _tool_node_update(results, start)
+
+@timed("graph.tool_node")
+async def atool_node(state: dict, config: RunnableConfig):
+    """Async version of tool_node: the tools run concurrently in the bounded RAG pool"""
+    start = time.perf_counter()
+    tool_calls = state["messages"][-1].tool_calls
+    await asyncio.wrap_future(_submit(_prefetch_search_embeddings, tool_calls, config))
+    results = await asyncio.gather(*[
+        asyncio.wrap_future(_submit(_timed_tool_call, tool_call, config)) for tool_call in tool_calls
+    ])
+    return _tool_node_update(results, start)
 
 # Conditional edge function to route to the tool node or end based upon whether the LLM made a tool call
 def should_continue(state: MessagesState) -> Literal["tool_node", END]:
@@ -172,9 +418,10 @@ class dummy_agent():
         Returns:
         dummy_agent: class to chat
         """
-        # 1. Initialize the checkpointer
-        self.memory = MemorySaver()
+        # 1. Initialize the checkpointer (bounded on disk by default, see utils/checkpointer.py)
+        self.memory = build_checkpointer()
         self.agent = self._agent_initializer()
+        self.answer_cache = build_answer_cache() # None when disabled
         # 2. Set a default thread_id (like a session ID)
         self.thread_id = user_name
         self.config = {"configurable": {"thread_id": self.thread_id}}
@@ -183,8 +430,9 @@ class dummy_agent():
         """initializes the agent generating a graph of nodes and edges"""
         agent_builder = StateGraph(MessagesState)
         
-        agent_builder.add_node("llm_call", llm_call)
-        agent_builder.add_node("tool_node", tool_node)
+        # Each node has a sync (invoke) and an async (ainvoke) implementation
+        agent_builder.add_node("llm_call", RunnableLambda(llm_call, afunc=allm_call, name="llm_call"))
+        agent_builder.add_node("tool_node", RunnableLambda(tool_node, afunc=atool_node, name="tool_node"))
 
         agent_builder.add_edge(START, "llm_call")
         agent_builder.add_conditional_edges(
@@ -207,32 +455,173 @@ class dummy_agent():
 
     def permanent_delete_all_memory(self):
         """Permanently deletes all memory"""
-        # Esto borra físicamente todos los datos guardados en el checkpointer de RAM
-        self.memory.storage.clear()
+        # Esto borra físicamente todas las conversaciones del checkpointer (RAM o disco)
+        clear_checkpointer(self.memory)
         print("Todos los registros del checkpointer han sido eliminados físicamente.")
 
-    def run_chat(self, user_input: str, user_name: str = 'default_user'):
+    def _config_for(self, user_name: str, scope: dict | None = None):
+        """Builds the config of one request without touching the shared instance
+        
+        Args:
+            user_name: The user name (its thread_id), 'default_user' uses the current session
+            scope: optional {'collection', 'files'} the searches of the request are restricted to
+        Returns:
+            dict: the config with the thread_id (and scope) of the request
+        """
+        thread_id = user_name if user_name != 'default_user' else self.thread_id
+        return {"configurable": {"thread_id": thread_id, "scope": scope}}
+
+    def _question_key(self, user_input: str, config: dict):
+        """returns the (embedding, scope, index version) of a question for the answer cache,
+        None while its collection is not loaded (the cache never waits for a build)"""
+        collection, files = _scope(config)
+        if not rag_is_ready() or (collection != DEFAULT_COLLECTION and collection not in collections.loaded()):
+            return None
+        with use_rag(collection) as rag:
+            return rag.embed_query(user_input.strip()), (collection, rag.normalize_files(files)), rag.index_version
+
+    def _cache_key(self, user_input: str, config: dict):
+        """returns the answer cache key of a question, None if it must not use the cache
+        (only the first question of a conversation: later answers depend on the history)"""
+        if self.answer_cache is None or self.agent.get_state(config).values.get("messages"):
+            return None
+        return self._question_key(user_input, config)
+
+    async def _acache_key(self, user_input: str, config: dict):
+        """async version of _cache_key (the embedding runs in the RAG pool)"""
+        if self.answer_cache is None or (await self.agent.aget_state(config)).values.get("messages"):
+            return None
+        return await asyncio.wrap_future(_submit(self._question_key, user_input, config))
+
+    @staticmethod
+    def _cached_turn(user_input: str, answer: str):
+        """state update that records a cached answer in the thread, so the conversation can go on"""
+        return _new_turn(HumanMessage(content=user_input), AIMessage(content=answer))
+
+    def _remember(self, key, user_input: str, final_state: dict, start: float):
+        """stores the final answer of a fresh conversation in the answer cache"""
+        if key is None:
+            return
+        last = final_state["messages"][-1]
+        answer = _message_text(last)
+        if getattr(last, "tool_calls", None) or not answer:
+            return
+        vector, scope, version = key
+        self.answer_cache.store(vector, user_input, answer, scope, version,
+                                llm_calls=final_state.get("llm_calls", 0),
+                                cost_ms=(time.perf_counter() - start) * 1000)
+
+    def run_chat(self, user_input: str, user_name: str = 'default_user', scope: dict | None = None):
         """Runs the agent with automatic memory via checkpointer
         
         Args:
             user_input: The user input
             user_name: The user name
+            scope: optional {'collection', 'files'} the searches are restricted to
         Returns:
             final_output: The final output of the agent
         """
+        # We invoke using a per-request config (thread_id) so concurrent users never clobber each other
+        config = self._config_for(user_name, scope)
+        start = time.perf_counter()
+        key = self._cache_key(user_input, config)
+        cached = self.answer_cache.lookup(*key) if key else None
+        if cached:
+            self.agent.update_state(config, self._cached_turn(user_input, cached["answer"]), as_node="llm_call")
+            return _answer(cached["answer"], config)
 
-        #check_user
-        if user_name != 'default_user':
-            self.thread_id = user_name
-            self.config = {"configurable": {"thread_id": self.thread_id}}
         # We only send the NEW message. 
-        # The agent uses the thread_id in self.config to find past history.
-        input_data = {"messages": [HumanMessage(content=user_input)]}
+        # The agent uses the thread_id of the config to find past history.
+        input_data = _new_turn(HumanMessage(content=user_input))
+        final_output = self.agent.invoke(input_data, config=config)
+        self._remember(key, user_input, final_output, start)
         
-        # We invoke using the config (thread_id)
-        final_output = self.agent.invoke(input_data, config=self.config)
+        return _answer(final_output["messages"][-1].content, config)
+
+    async def arun_chat(self, user_input: str, user_name: str = 'default_user', scope: dict | None = None):
+        """Async version of run_chat, many conversations can be in flight at once
+        
+        Args:
+            user_input: The user input
+            user_name: The user name
+            scope: optional {'collection', 'files'} the searches are restricted to
+        Returns:
+            final_output: The final output of the agent
+        """
+        config = self._config_for(user_name, scope)
+        start = time.perf_counter()
+        key = await self._acache_key(user_input, config)
+        cached = self.answer_cache.lookup(*key) if key else None
+        if cached:
+            await self.agent.aupdate_state(config, self._cached_turn(user_input, cached["answer"]), as_node="llm_call")
+            return _answer(cached["answer"], config)
+
+        input_data = _new_turn(HumanMessage(content=user_input))
+        final_output = await self.agent.ainvoke(input_data, config=config)
+        self._remember(key, user_input, final_output, start)
+        return _answer(final_output["messages"][-1].content, config)
+
+    async def astream_chat(self, user_input: str, user_name: str = 'default_user', scope: dict | None = None):
+        """Runs the agent streaming its progress as events
         
-        return final_output["messages"][-1].content
+        Args:
+            user_input: The user input
+            user_name: The user name
+            scope: optional {'collection', 'files'} the searches are restricted to
+        Yields:
+            dict: {'type': 'token', 'content'} for every piece of text generated by the LLM,
+                {'type': 'tool', 'status': 'start'|'done', 'name', 'args'} around each tool call
+                and a final {'type': 'done', 'content'} with the full answer
+                ('cached': True when it comes from the answer cache, as a single token)
+        """
+        config = self._config_for(user_name, scope)
+        start = time.perf_counter()
+        key = await self._acache_key(user_input, config)
+        cached = self.answer_cache.lookup(*key) if key else None
+        if cached:
+            await self.agent.aupdate_state(config, self._cached_turn(user_input, cached["answer"]), as_node="llm_call")
+            answer = _answer(cached["answer"], config)
+            yield {"type": "token", "content": answer}
+            yield {"type": "done", "content": answer, "cached": True}
+            return
+
+        input_data = _new_turn(HumanMessage(content=user_input))
+        pending_tools = []
+
+        async for mode, chunk in self.agent.astream(input_data, config=config, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                message, metadata = chunk
+                text = _message_text(message)
+                if metadata.get("langgraph_node") == "llm_call" and isinstance(message, AIMessageChunk) and text:
+                    yield {"type": "token", "content": text}
+            elif "llm_call" in chunk:
+                # The LLM decided to call tools: we tell the user what it is doing
+                pending_tools = chunk["llm_call"]["messages"][-1].tool_calls
+                for tool_call in pending_tools:
+                    yield {"type": "tool", "status": "start", "name": tool_call["name"], "args": tool_call["args"]}
+            elif "tool_node" in chunk:
+                for tool_call in pending_tools:
+                    yield {"type": "tool", "status": "done", "name": tool_call["name"], "args": tool_call["args"]}
+                pending_tools = []
+
+        state = await self.agent.aget_state(config)
+        self._remember(key, user_input, state.values, start)
+        yield {"type": "done", "content": _answer(_message_text(state.values["messages"][-1]), config)}
+
+
+def _answer(text: str, config: dict):
+    """returns an answer for the client: its citations open the pdfs of the collection of the request"""
+    collection, _ = _scope(config)
+    if collection == DEFAULT_COLLECTION or not isinstance(text, str):
+        return text
+    return link_collection(text, collection)
+
+def _message_text(message):
+    """returns the text of a message whether its content is a string or a list of parts"""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
 
 if __name__ == "__main__":
     dummy = dummy_agent()
@@ -0,0 +1,168 @@
+"""
+Semantic cache of the final answers of the agent.
+
+Students ask the same questions over and over. When a fresh conversation
+starts with a question close enough to one already answered (cosine
+similarity of their query embeddings >= threshold), the stored markdown
+answer, citations included, is returned without running the graph: no
+llm_call round trips and no retrieval.
+
+An answer is only reused for the same scope (collection and files) and the
+same index version of that collection, so re-ingesting or removing a pdf
+invalidates every answer of its collection. Entries expire after `ttl`
+seconds and at most `maxsize` are kept (least recently used are dropped).
+
+Configured with environment variables (see build_answer_cache):
+    AGENT_ANSWER_CACHE            1 (default) or 0 to disable it
+    AGENT_ANSWER_CACHE_THRESHOLD  minimum cosine similarity of a hit (0.95)
+    AGENT_ANSWER_CACHE_SIZE       maximum number of answers (1000)
+    AGENT_ANSWER_CACHE_TTL_S      seconds an answer stays valid (86400)
+"""
+
+# === SYSTEM ===
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# === VECTORS ===
+import numpy as np
+
+# === INSTRUMENTATION ===
+from utils.metrics import REGISTRY
+
+LOOKUPS = REGISTRY.counter("agent_answer_cache_total", "Lookups of the semantic answer cache by result")
+
+
+class SemanticAnswerCache:
+    """LRU cache with TTL of answers keyed by query embedding, scope and index version."""
+
+    def __init__(self, threshold=0.95, maxsize=1000, ttl=86400):
+        """inicializes the cache
+
+        Args:
+            threshold: minimum cosine similarity between two questions to reuse an answer
+            maxsize: maximum number of answers (least recently used are evicted)
+            ttl: seconds an answer stays valid (None for no expiration)
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.llm_calls_avoided = 0
+        self.saved_ms = 0.0
+        self._entries = OrderedDict() # id -> entry dict, least recently used first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _expired(self, entry, now):
+        """checks if an entry outlived its ttl"""
+        return entry["expires_at"] is not None and entry["expires_at"] <= now
+
+    def lookup(self, vector, scope, version):
+        """returns the answer of the most similar question of the scope, if similar enough
+
+        Args:
+            vector: embedding of the question
+            scope: hashable scope of the question (collection and files)
+            version: index version of the collection
+        Returns:
+            dict: the entry ('question', 'answer', 'similarity', 'llm_calls') or None
+        """
+        query = np.array(vector, dtype=np.float32) # copia: se normaliza en su sitio
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for entry_id, entry in list(self._entries.items()):
+                if entry["scope"] != scope:
+                    continue
+                # Caducadas o de otra versión del índice: ya no sirven a nadie
+                if self._expired(entry, now) or entry["version"] != version:
+                    del self._entries[entry_id]
+                    continue
+                candidates.append((entry_id, entry))
+
+            best = None
+            if candidates:
+                similarities = np.stack([entry["vector"] for _, entry in candidates]) @ query
+                index = int(np.argmax(similarities))
+                if similarities[index] >= self.threshold:
+                    best = candidates[index] + (float(similarities[index]),)
+
+            if best is None:
+                self.misses += 1
+                LOOKUPS.inc(result="miss")
+                return None
+            entry_id, entry, similarity = best
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            self.llm_calls_avoided += entry["llm_calls"]
+            self.saved_ms += entry["cost_ms"]
+            LOOKUPS.inc(result="hit")
+            return {"question": entry["question"], "answer": entry["answer"],
+                    "similarity": similarity, "llm_calls": entry["llm_calls"]}
+
+    def store(self, vector, question, answer, scope, version, llm_calls=0, cost_ms=0.0):
+        """stores the answer of a question
+
+        Args:
+            vector: embedding of the question
+            question: text of the question
+            answer: final answer of the agent (markdown)
+            scope: hashable scope of the question (collection and files)
+            version: index version of the collection when the question was answered
+            llm_calls: calls to the LLM it took (reported as avoided on every hit)
+            cost_ms: milliseconds it took (reported as saved on every hit)
+        """
+        vector = np.array(vector, dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        entry = {
+            "vector": vector, "question": question, "answer": answer, "scope": scope, "version": version,
+            "llm_calls": llm_calls, "cost_ms": cost_ms,
+            "expires_at": time.monotonic() + self.ttl if self.ttl is not None else None,
+        }
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """removes every answer (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """returns the counters of the cache
+
+        Returns:
+            dict: hits, misses, hit rate, LLM calls avoided, saved milliseconds, size and threshold
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "llm_calls_avoided": self.llm_calls_avoided,
+            "saved_ms": self.saved_ms,
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+        }
+
+
+def build_answer_cache():
+    """builds the answer cache configured by the environment (None when AGENT_ANSWER_CACHE=0)"""
+    if os.getenv("AGENT_ANSWER_CACHE", "1") == "0":
+        return None
+    ttl = float(os.getenv("AGENT_ANSWER_CACHE_TTL_S", "86400"))
+    return SemanticAnswerCache(
+        threshold=float(os.getenv("AGENT_ANSWER_CACHE_THRESHOLD", "0.95")),
+        maxsize=int(os.getenv("AGENT_ANSWER_CACHE_SIZE", "1000")),
+        ttl=ttl if ttl > 0 else None
+    )
@@ -0,0 +1,87 @@
+# === SYSTEM ===
+# Ordered dictionary for the LRU order and a lock for concurrent tool calls
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """In-process LRU cache whose entries also expire after a time to live.
+
+    Each entry remembers how long it took to compute, so the cache can report
+    how many milliseconds its hits have saved.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        """inicializes the cache
+
+        Args:
+            maxsize: maximum number of entries (least recently used are evicted)
+            ttl: seconds an entry stays valid (None for no expiration)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+        self._data = OrderedDict() # key -> (expires_at, cost_ms, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """returns the cached value of a key or None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                self.saved_ms += entry[1]
+                return entry[2]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def __contains__(self, key):
+        """checks if a valid entry exists without touching the counters or the LRU order"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[0] is None or entry[0] > time.monotonic())
+
+    def put(self, key, value, cost_ms=0.0):
+        """stores a value
+
+        Args:
+            key: the key of the value
+            value: the value to store
+            cost_ms: milliseconds it took to compute the value
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, cost_ms, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """removes every entry (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """returns the counters of the cache
+
+        Returns:
+            dict: hits, misses, hit rate, saved milliseconds and size
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_ms": self.saved_ms,
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+        }
@@ -0,0 +1,216 @@
+"""
+Conversation checkpointers of the agent.
+
+The checkpointer is chosen with the AGENT_CHECKPOINTER environment variable:
+    sqlite  BoundedSqliteSaver on local disk (default): survives restarts, keeps
+            the latest checkpoints of each thread and evicts idle threads
+    memory  LangGraph's MemorySaver: everything in RAM, lost on restart
+"""
+
+# === SYSTEM ===
+import os
+import time
+import asyncio
+import sqlite3
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# === LANGGRAPH CHECKPOINTERS ===
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+CHECKPOINTERS = ("sqlite", "memory")
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """SQLite (WAL) checkpointer whose size stays bounded under load.
+
+    - compaction: only the latest `keep_checkpoints` checkpoints (and their
+      writes) of each thread are kept, older ones are deleted on every put
+    - eviction: threads idle for more than `ttl_seconds` are deleted, and the
+      least recently used ones once there are more than `max_threads`
+    - memory cap: the page cache of SQLite is limited to `cache_size_kb` and
+      nothing is kept in Python between requests
+
+    The async methods run the sync ones in a dedicated thread, so the saver
+    works with `ainvoke`/`astream` without blocking the event loop.
+    """
+
+    def __init__(self, path, max_threads=10_000, ttl_seconds=7 * 24 * 3600, keep_checkpoints=3,
+                 cache_size_kb=8192, evict_every=100):
+        """opens (or creates) the database
+
+        Args:
+            path: path of the SQLite file
+            max_threads: maximum number of conversations kept (least recently used are deleted)
+            ttl_seconds: seconds a conversation is kept since its last message (None keeps them)
+            keep_checkpoints: checkpoints kept per thread (1 is enough to resume a conversation)
+            cache_size_kb: page cache of SQLite in KiB
+            evict_every: puts between two eviction passes
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        # auto_vacuum solo se aplica a bases nuevas: las páginas liberadas se devuelven con incremental_vacuum
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(cache_size_kb)}")
+        conn.execute("PRAGMA journal_size_limit=67108864")
+        super().__init__(conn)
+
+        self.path = path
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.keep_checkpoints = keep_checkpoints
+        self.evict_every = evict_every
+        self._puts = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+
+        with self.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS thread_access (thread_id TEXT PRIMARY KEY, last_access REAL NOT NULL)"
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS thread_access_time ON thread_access (last_access)")
+
+    # --- bounded writes ---
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_access (thread_id, last_access) VALUES (?, ?)",
+                (thread_id, time.time())
+            )
+            self._compact(cur, thread_id, checkpoint_ns)
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+        return saved
+
+    def _compact(self, cur, thread_id, checkpoint_ns):
+        """deletes the checkpoints of a thread older than the latest keep_checkpoints"""
+        cur.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_checkpoints - 1)
+        )
+        row = cur.fetchone()
+        if row is None:
+            return
+        # los ids de checkpoint son uuid6: ordenarlos es ordenarlos en el tiempo
+        for table in ("checkpoints", "writes"):
+            cur.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, row[0])
+            )
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_access WHERE thread_id = ?", (str(thread_id),))
+
+    def evict(self):
+        """deletes the threads past their TTL and the least recently used ones over max_threads
+
+        Returns:
+            int: number of threads deleted
+        """
+        with self.cursor() as cur:
+            expired = []
+            if self.ttl_seconds is not None:
+                cur.execute("SELECT thread_id FROM thread_access WHERE last_access < ?",
+                            (time.time() - self.ttl_seconds,))
+                expired = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT COUNT(*) FROM thread_access")
+            excess = cur.fetchone()[0] - len(expired) - self.max_threads
+            if excess > 0:
+                cur.execute(
+                    "SELECT thread_id FROM thread_access WHERE last_access >= ? ORDER BY last_access LIMIT ?",
+                    (time.time() - self.ttl_seconds if self.ttl_seconds is not None else 0, excess)
+                )
+                expired += [row[0] for row in cur.fetchall()]
+            for table in ("checkpoints", "writes", "thread_access"):
+                cur.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(t,) for t in expired])
+            if expired:
+                cur.execute("PRAGMA incremental_vacuum").fetchall() # devuelve una fila por página liberada
+        return len(expired)
+
+    def clear(self):
+        """deletes every conversation"""
+        with self.cursor() as cur:
+            for table in ("checkpoints", "writes", "thread_access"):
+                cur.execute(f"DELETE FROM {table}")
+            cur.execute("PRAGMA incremental_vacuum").fetchall() # devuelve una fila por página liberada
+
+    def stats(self):
+        """returns the number of threads and checkpoints and the size of the database
+
+        Returns:
+            dict: threads, checkpoints and bytes on disk (WAL included)
+        """
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT COUNT(*) FROM thread_access")
+            threads = cur.fetchone()[0]
+            cur.execute("SELECT COUNT(*) FROM checkpoints")
+            checkpoints = cur.fetchone()[0]
+        size = sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+        return {"threads": threads, "checkpoints": checkpoints, "bytes": size}
+
+    # --- async interface (the sync methods in a dedicated thread) ---
+
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def aget_tuple(self, config):
+        return await self._run(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await self._run(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await self._run(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await self._run(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await self._run(self.delete_thread, thread_id)
+
+
+def build_checkpointer(kind=None):
+    """builds the checkpointer selected by kind or AGENT_CHECKPOINTER
+
+    Returns:
+        BaseCheckpointSaver: a BoundedSqliteSaver ('sqlite') or a MemorySaver ('memory')
+    """
+    kind = kind or os.getenv("AGENT_CHECKPOINTER", "sqlite")
+    if kind == "memory":
+        return MemorySaver()
+    if kind == "sqlite":
+        ttl = float(os.getenv("AGENT_CHECKPOINT_TTL_S", str(7 * 24 * 3600)))
+        return BoundedSqliteSaver(
+            os.getenv("AGENT_CHECKPOINT_PATH", os.path.join("local_rag", "checkpoints.sqlite")),
+            max_threads=int(os.getenv("AGENT_CHECKPOINT_MAX_THREADS", "10000")),
+            ttl_seconds=ttl if ttl > 0 else None,
+            keep_checkpoints=int(os.getenv("AGENT_CHECKPOINT_KEEP", "3")),
+            cache_size_kb=int(os.getenv("AGENT_CHECKPOINT_CACHE_KB", "8192")),
+        )
+    raise ValueError(f"AGENT_CHECKPOINTER must be one of {CHECKPOINTERS}, got {kind!r}")
+
+
+def clear_checkpointer(saver):
+    """deletes every conversation of a checkpointer"""
+    if isinstance(saver, MemorySaver):
+        saver.storage.clear()
+        saver.writes.clear()
+        saver.blobs.clear()
+    else:
+        saver.clear()
@@ -0,0 +1,308 @@
+"""
+Named document collections (per user or per project).
+
+Every collection has its own pdf folder, page store, BM25 index and manifest
+under local_rag/collections/<name>/ and its own Chroma collection, while the
+embedding model, the query-embedding cache, the reranker and the Chroma
+client are shared. The 'default' collection keeps the original layout
+(local_rag/ and the 'langchain' Chroma collection).
+
+A collection may set its HNSW parameters in <folder>/collection.json; they
+apply when its Chroma collection is created, except search_ef, which is
+applied every time the collection is loaded:
+    {"hnsw": {"space": "cosine", "M": 16, "construction_ef": 100, "search_ef": 50}}
+
+Loaded collections are kept in LRU order. Over `max_loaded` collections, or
+over `memory_budget_mb` (estimated by LocalRAGAgent.memory_bytes), the least
+recently used ones are unloaded: their BM25 index, page maps and caches are
+released and they are loaded again on their next use. The default collection
+and collections in use (pinned with `use`) are never unloaded, so a caller
+never holds a LocalRAGAgent that a second instance of the same folder has
+replaced. The budget only counts what unloading releases (BM25 index and
+exact matrix): the HNSW indexes stay in the cache of the shared Chroma
+client, which the Rust bindings size by file handles and do not let us
+limit, so the memory of the vectors is not bounded by it. The budget is
+global because what the registry can bound is the sum of the loaded
+collections; max_loaded bounds how many there are.
+
+Each collection is loaded under its own lock: a slow first load (that may
+index pdfs) only blocks the requests of that collection.
+"""
+
+# === SYSTEM ===
+import os
+import re
+import json
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+# === VECTOR DATABASE (STORAGE) ===
+import chromadb
+
+# === RAG ===
+from utils.RAG import LocalRAGAgent, build_cached_embeddings, DEFAULT_COLLECTION_NAME
+from utils.cache import TTLCache
+from utils.reranker import build_reranker
+
+DEFAULT_COLLECTION = "default"
+COLLECTION_NAME_RE = re.compile(r"^[a-z0-9]([a-z0-9_-]{0,46}[a-z0-9])?$") # también vale como nombre de Chroma
+HNSW_KEYS = ("space", "M", "construction_ef", "search_ef")
+
+
+class CollectionNotFound(KeyError):
+    """The collection does not exist"""
+
+
+def validate_name(name):
+    """checks a collection name (lowercase letters, digits, '-' and '_' inside, at most 48 characters)"""
+    if not isinstance(name, str) or not COLLECTION_NAME_RE.match(name):
+        raise ValueError(f"invalid collection name {name!r}: use lowercase letters, digits, '-' and '_'")
+    return name
+
+
+class CollectionRegistry:
+    """Loads, creates and unloads the named collections of the library."""
+
+    def __init__(self, base_folder="local_rag", model_name="BAAI/bge-m3", embedding_engine="torch",
+                 reranker=None, max_loaded=8, memory_budget_mb=None, multi_process=False, **rag_options):
+        """inicializes the registry (nothing is loaded until the first get)
+
+        Args:
+            base_folder: folder of the default collection; the others live in base_folder/collections
+            model_name: embedding model shared by every collection
+            embedding_engine: engine of the embedding model (see utils.embedding_engines)
+            reranker: reranker shared by every collection (see utils.reranker), None reads AGENT_RERANKER
+            max_loaded: collections kept in memory at once (the default one included)
+            memory_budget_mb: estimated memory the loaded collections may take (None for no limit)
+            multi_process: whether the embedding model uses multi process
+            rag_options: other arguments of LocalRAGAgent (rerank_candidates, ingest_workers...)
+        """
+        self.base_folder = base_folder
+        self.collections_folder = os.path.join(base_folder, "collections")
+        self.model_name = model_name
+        self.embedding_engine = embedding_engine
+        self.reranker_name = reranker
+        self.multi_process = multi_process
+        self.max_loaded = max(1, max_loaded)
+        self.memory_budget = memory_budget_mb * 2**20 if memory_budget_mb else None
+        self.rag_options = rag_options
+        self.loads = 0
+        self.unloads = 0
+        self._shared = None
+        self._loaded = OrderedDict() # name -> LocalRAGAgent, least recently used first
+        self._pins = Counter() # name -> callers using the collection now
+        self._lock = threading.Lock()
+        self._load_locks = {} # name -> lock of its load
+        self._shared_lock = threading.Lock()
+
+    # --- layout ---
+
+    def folder(self, name):
+        """returns the folder of a collection"""
+        if name == DEFAULT_COLLECTION:
+            return self.base_folder
+        return os.path.join(self.collections_folder, validate_name(name))
+
+    def pdf_folder(self, name):
+        """returns the folder with the pdfs of a collection"""
+        return os.path.join(self.folder(name), "pdf_files")
+
+    def exists(self, name):
+        """checks if a collection exists (without loading it)"""
+        if name == DEFAULT_COLLECTION:
+            return True
+        try:
+            return os.path.isdir(self.folder(name))
+        except ValueError:
+            return False
+
+    def names(self):
+        """returns the names of every collection, the default one first"""
+        names = []
+        if os.path.isdir(self.collections_folder):
+            names = sorted(name for name in os.listdir(self.collections_folder)
+                           if COLLECTION_NAME_RE.match(name) and os.path.isdir(os.path.join(self.collections_folder, name)))
+        return [DEFAULT_COLLECTION] + [name for name in names if name != DEFAULT_COLLECTION]
+
+    def config(self, name):
+        """returns the configuration of a collection (its collection.json, {} if it has none)"""
+        path = os.path.join(self.folder(name), "collection.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def create(self, name, hnsw=None):
+        """creates an empty collection
+
+        Args:
+            name: name of the collection
+            hnsw: optional dict with the HNSW parameters of its vectors (space, M, construction_ef, search_ef)
+        Returns:
+            dict: the configuration of the collection
+        """
+        if name == DEFAULT_COLLECTION or self.exists(name):
+            raise FileExistsError(f"collection {name!r} already exists")
+        hnsw = dict(hnsw or {})
+        unknown = set(hnsw) - set(HNSW_KEYS)
+        if unknown:
+            raise ValueError(f"unknown hnsw parameters {sorted(unknown)}, use {HNSW_KEYS}")
+        folder = self.folder(name)
+        os.makedirs(os.path.join(folder, "pdf_files"))
+        config = {"hnsw": hnsw}
+        with open(os.path.join(folder, "collection.json"), "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        return config
+
+    # --- loading ---
+
+    def _shared_resources(self):
+        """builds once what every collection shares: embeddings, query cache, reranker and Chroma client"""
+        with self._shared_lock:
+            if self._shared is None:
+                self._shared = self._build_shared()
+        return self._shared
+
+    def _build_shared(self):
+        """builds the resources shared by every collection"""
+        return {
+            "embeddings": build_cached_embeddings(
+                self.base_folder, self.model_name, self.embedding_engine,
+                multi_process=self.multi_process
+            ),
+            "query_embedding_cache": TTLCache(maxsize=2048, ttl=3600),
+            "reranker": build_reranker(self.reranker_name),
+            "chroma_client": chromadb.PersistentClient(path=os.path.join(self.base_folder, "vector_store")),
+        }
+
+    def _loaded_rag(self, name, pin):
+        """returns a loaded collection marking it as recently used (and pinned), None if not loaded (must hold the lock)"""
+        rag = self._loaded.get(name)
+        if rag is not None:
+            self._loaded.move_to_end(name)
+            if pin:
+                self._pins[name] += 1
+        return rag
+
+    def get(self, name=DEFAULT_COLLECTION, pin=False):
+        """returns the RAG of a collection, loading it (and unloading cold ones) if needed
+
+        Args:
+            name: name of the collection
+            pin: keep it loaded until release(name) is called (see use)
+        Raises:
+            CollectionNotFound: if the collection does not exist
+        """
+        with self._lock:
+            rag = self._loaded_rag(name, pin)
+            if rag is not None:
+                return rag
+        if not self.exists(name):
+            raise CollectionNotFound(name)
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                rag = self._loaded_rag(name, pin)
+                if rag is not None:
+                    return rag
+            rag = self._load(name)
+            with self._lock:
+                self._loaded[name] = rag
+                if pin:
+                    self._pins[name] += 1
+                self.loads += 1
+                self._evict(keep=name)
+        return rag
+
+    def release(self, name):
+        """unpins a collection pinned by get(name, pin=True), unloading cold ones if over the limits"""
+        with self._lock:
+            self._pins[name] -= 1
+            if self._pins[name] <= 0:
+                del self._pins[name]
+            self._evict()
+
+    @contextmanager
+    def use(self, name=DEFAULT_COLLECTION):
+        """context manager that yields the RAG of a collection and keeps it loaded until the block ends"""
+        rag = self.get(name, pin=True)
+        try:
+            yield rag
+        finally:
+            self.release(name)
+
+    def _load(self, name):
+        """opens a collection and synchronizes it with its pdf folder"""
+        hnsw = self.config(name).get("hnsw", {})
+        options = dict(self.rag_options)
+        if "search_ef" in hnsw:
+            options["search_ef"] = hnsw["search_ef"]
+        return LocalRAGAgent(
+            base_folder=self.folder(name),
+            model_name=self.model_name,
+            embedding_engine=self.embedding_engine,
+            collection_name=DEFAULT_COLLECTION_NAME if name == DEFAULT_COLLECTION else f"collection_{name}",
+            collection_metadata={f"hnsw:{key}": value for key, value in hnsw.items()} or None,
+            **self._shared_resources(),
+            **options
+        )
+
+    def loaded(self):
+        """returns the names of the loaded collections, least recently used first"""
+        with self._lock:
+            return list(self._loaded)
+
+    def _evict(self, keep=None):
+        """unloads the least recently used collections over the limits, except `keep` (must hold the lock)"""
+        def over():
+            if len(self._loaded) > self.max_loaded:
+                return True
+            return self.memory_budget is not None and \
+                sum(rag.memory_bytes() for rag in self._loaded.values()) > self.memory_budget
+
+        for name in list(self._loaded):
+            if not over():
+                break
+            if name in (DEFAULT_COLLECTION, keep) or not self._unload(name):
+                continue
+
+    def _unload(self, name):
+        """unloads a collection unless it is in use or being written (must hold the lock)"""
+        rag = self._loaded[name]
+        if self._pins[name] > 0 or not rag._write_lock.acquire(blocking=False):
+            return False
+        try:
+            del self._loaded[name]
+            rag.close()
+        finally:
+            rag._write_lock.release()
+        self.unloads += 1
+        print(f"Colección {name} descargada de memoria.")
+        return True
+
+    def unload(self, name):
+        """unloads a collection now (returns False if it was not loaded, is in use or is being written)"""
+        with self._lock:
+            return name in self._loaded and name != DEFAULT_COLLECTION and self._unload(name)
+
+    def stats(self):
+        """returns the loaded collections with their size and the load/unload counters
+
+        Returns:
+            dict: 'collections' (every name), 'loaded' -> {name: files, chunks, memory_mb, index},
+                'loads' and 'unloads'
+        """
+        with self._lock:
+            loaded = {
+                name: {
+                    "files": len(rag.manifest.files()),
+                    "chunks": len(rag.lexical),
+                    "memory_mb": rag.memory_bytes() / 2**20,
+                    "index": rag.index_config(),
+                }
+                for name, rag in self._loaded.items()
+            }
+        return {"collections": self.names(), "loaded": loaded, "loads": self.loads, "unloads": self.unloads}
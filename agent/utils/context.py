@@ -0,0 +1,192 @@
+"""
+Token-budgeted context for the LLM calls of long conversations.
+
+The graph state keeps the whole conversation, but each llm_call only sends
+what `build_context` selects:
+    1. the turns older than `keep_turns` are compacted: tool outputs are
+       reduced to their citations (file and page) plus a short extract, and
+       long answers keep their beginning and their references section
+    2. while the estimate is over the budget, the oldest turns are dropped and
+       summarized in one line each (question and cited sources)
+    3. if the current turn alone is over the budget, its longest tool outputs
+       are truncated
+
+Turns are dropped whole, so every tool call keeps its ToolMessage.
+"""
+
+# === SYSTEM ===
+import re
+
+# === LANGCHAIN MESSAGES ===
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+CHARS_PER_TOKEN = 4 # estimación conservadora para texto en español/inglés
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_MAX_LINES = 30
+
+FILE_RE = re.compile(r"[\"']archivo(\d+)[\"']:\s*[\"']([^\"']+)[\"']")
+PAGE_RE = re.compile(r"[\"']pagina(\d+)[\"']:\s*(\d+)")
+LINK_RE = re.compile(r"\]\(([^)#\s]+\.pdf)#page=(\d+)\)")
+REFERENCES_MARK = "---"
+SUMMARY_HEADER = "Resumen de la conversación anterior (turnos compactados):"
+
+
+def estimate_tokens(text):
+    """estimates the tokens of a text from its length"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message):
+    """estimates the tokens of a message, its tool calls included"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(call["name"] + str(call["args"]))
+    return tokens
+
+
+def split_turns(messages):
+    """splits a conversation into turns, each one starting with a HumanMessage"""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _citations(message, calls):
+    """returns the 'file#page=N' sources a message refers to"""
+    content = str(message.content)
+    if isinstance(message, ToolMessage):
+        files = FILE_RE.findall(content)
+        if files:
+            pages = dict(PAGE_RE.findall(content))
+            return [f"{name}#page={pages.get(n, '?')}" for n, name in files]
+        call = calls.get(message.tool_call_id)
+        if call and call["name"] == "search_by_page":
+            filename = call["args"].get("filename") or "?"
+            return [f"{filename}#page={page + 1}" for page in call["args"].get("pages", [])]
+        return []
+    return [f"{name}#page={page}" for name, page in LINK_RE.findall(content)]
+
+
+def link_collection(text, collection):
+    """adds the collection to the citation links of an answer ('doc.pdf#page=5' -> 'doc.pdf?collection=c#page=5')
+
+    Args:
+        text: the answer
+        collection: name of the collection its sources belong to
+    Returns:
+        str: the answer with the links pointing to the pdfs of the collection
+    """
+    # El estado guarda los enlaces sin colección: solo cambia lo que se devuelve al cliente
+    return LINK_RE.sub(lambda m: f"]({m[1]}?collection={collection}#page={m[2]})", text)
+
+
+def _compact(message, calls, tool_chars, answer_chars):
+    """returns a shorter copy of an old message that keeps its citations"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    if isinstance(message, ToolMessage) and len(content) > tool_chars:
+        sources = ", ".join(dict.fromkeys(_citations(message, calls))) or "sin fuentes"
+        extract = content[:tool_chars].rstrip()
+        return message.model_copy(update={
+            "content": f"[Resultado anterior compactado] Fuentes: {sources}. Extracto: {extract}…"
+        })
+    if isinstance(message, AIMessage) and len(content) > answer_chars:
+        body, mark, references = content.partition(REFERENCES_MARK)
+        if len(body) > answer_chars:
+            body = body[:answer_chars].rstrip() + "…\n\n"
+            return message.model_copy(update={"content": body + mark + references})
+    return message
+
+
+def _summary_line(turn, calls):
+    """summarizes a dropped turn as its question and the sources of its answer"""
+    question = str(turn[0].content).replace("\n", " ")
+    if len(question) > 150:
+        question = question[:150] + "…"
+    sources = []
+    for message in turn[1:]:
+        sources.extend(_citations(message, calls))
+    sources = ", ".join(list(dict.fromkeys(sources))[:6])
+    return f"- Usuario: {question}" + (f" (fuentes: {sources})" if sources else "")
+
+
+def _truncate_current(turn, excess_tokens):
+    """truncates the longest tool outputs of the current turn until excess_tokens are removed"""
+    turn = list(turn)
+    order = sorted(
+        (i for i, m in enumerate(turn) if isinstance(m, ToolMessage)),
+        key=lambda i: len(str(turn[i].content)), reverse=True
+    )
+    for i in order:
+        if excess_tokens <= 0:
+            break
+        content = str(turn[i].content)
+        keep = max(200, len(content) - excess_tokens * CHARS_PER_TOKEN)
+        if keep >= len(content):
+            continue
+        excess_tokens -= (len(content) - keep) // CHARS_PER_TOKEN
+        turn[i] = turn[i].model_copy(update={"content": content[:keep] + "… [truncado por longitud]"})
+    return turn
+
+
+def build_context(messages, budget_tokens=12000, reserved_tokens=0, keep_turns=2, tool_chars=400, answer_chars=800):
+    """selects the messages sent to the LLM within a token budget
+
+    Args:
+        messages: the full conversation of the state
+        budget_tokens: estimated tokens the prompt may take
+        reserved_tokens: tokens already taken by the system prompt
+        keep_turns: most recent turns (the current one included) sent without compaction
+        tool_chars: characters kept of each compacted tool output
+        answer_chars: characters kept of each compacted answer (its references are kept whole)
+    Returns:
+        dict: 'messages' to send, 'summary' of the dropped turns (to append to the
+            system prompt, '' if none), estimated 'tokens' and the number of
+            'compacted' messages and 'dropped_turns'
+    """
+    calls = {call["id"]: call for m in messages if isinstance(m, AIMessage) for call in m.tool_calls}
+    turns = split_turns(messages)
+    current = turns[-1] if turns else []
+    previous = turns[:-1]
+
+    compacted = 0
+    cut = max(0, len(previous) - (keep_turns - 1))
+    for index in range(cut):
+        turn = [_compact(m, calls, tool_chars, answer_chars) for m in previous[index]]
+        compacted += sum(a is not b for a, b in zip(turn, previous[index]))
+        previous[index] = turn
+
+    turn_tokens = [sum(message_tokens(m) for m in turn) for turn in previous]
+    current_tokens = sum(message_tokens(m) for m in current)
+    total = reserved_tokens + sum(turn_tokens) + current_tokens
+
+    summary_lines = []
+    dropped = 0
+    while previous and total > budget_tokens:
+        if not summary_lines:
+            total += estimate_tokens(SUMMARY_HEADER) # la cabecera también ocupa presupuesto
+        summary_lines.append(_summary_line(previous.pop(0), calls))
+        line_tokens = estimate_tokens(summary_lines[-1])
+        total += line_tokens - turn_tokens.pop(0)
+        dropped += 1
+
+    summary = ""
+    if summary_lines:
+        lines = summary_lines[-SUMMARY_MAX_LINES:]
+        summary = SUMMARY_HEADER + "\n" + "\n".join(lines)
+        total = reserved_tokens + sum(turn_tokens) + current_tokens + estimate_tokens(summary)
+
+    if total > budget_tokens:
+        current = _truncate_current(current, total - budget_tokens)
+        total = reserved_tokens + sum(turn_tokens) + estimate_tokens(summary) + sum(message_tokens(m) for m in current)
+
+    return {
+        "messages": [m for turn in previous for m in turn] + current,
+        "summary": summary,
+        "tokens": total,
+        "compacted": compacted,
+        "dropped_turns": dropped,
+    }
@@ -0,0 +1,265 @@
+# === SYSTEM & FILESYSTEM ===
+# Tools for hashing texts and persisting the cache index
+import os
+import json
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+
+# === VECTORS ===
+# Memory-mapped float32 matrix with one row per cached embedding
+import numpy as np
+
+# === LANGCHAIN INTERFACE ===
+# Base class so the cache can be passed anywhere an embeddings object is expected
+from langchain_core.embeddings import Embeddings
+
+
+class _CacheFile:
+    """Vectors file and hash index of one cache folder.
+
+    It is shared by every CachedEmbeddings of the process that points to the
+    same folder, so two instances never hand out the same row.
+
+    A row is only reused once the index on disk no longer points to it: when
+    the file is full a batch of least recently used entries is evicted and the
+    index is written before their rows are overwritten, so a crash can never
+    leave a key pointing to the vector of another text.
+    """
+
+    INITIAL_ROWS = 4096
+    EVICT_FRACTION = 16 # al llenarse se libera 1/16 de las filas de una vez: una escritura del índice por lote
+
+    def __init__(self, cache_folder, max_entries):
+        self.max_entries = max_entries
+        self.vectors_path = os.path.join(cache_folder, "vectors.f32")
+        self.index_path = os.path.join(cache_folder, "index.json")
+        self.lock = threading.Lock()
+        self.slots = OrderedDict() # key -> row, ordered from least to most recently used
+        self.free = [] # filas que el índice en disco ya no referencia
+        self.next_row = 0 # primera fila nunca usada
+        self.dim = None
+        self.capacity = 0
+        self.vectors = None
+        self.dirty = 0
+
+        os.makedirs(cache_folder, exist_ok=True)
+        self._load()
+        atexit.register(self.flush)
+
+    def _load(self):
+        """loads the index and maps the vectors file"""
+        if not (os.path.exists(self.index_path) and os.path.exists(self.vectors_path)):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data["capacity"] > self.max_entries:
+            # El límite se redujo: empezamos con una caché vacía
+            return
+        self.dim = data["dim"]
+        self.capacity = data["capacity"]
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                 shape=(self.capacity, self.dim))
+        self.slots = OrderedDict((key, row) for key, row in data["slots"])
+        used = set(self.slots.values())
+        self.next_row = max(used) + 1 if used else 0
+        # Filas sin clave: escritas antes de una caída o liberadas, se pueden reutilizar
+        self.free = [row for row in range(self.next_row) if row not in used]
+
+    def _ensure_capacity(self, rows):
+        """grows the vectors file so that it can hold at least `rows` rows"""
+        if rows <= self.capacity:
+            return
+        capacity = max(self.capacity, self.INITIAL_ROWS)
+        while capacity < rows:
+            capacity *= 2
+        capacity = min(capacity, self.max_entries)
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                 shape=(capacity, self.dim))
+        self.capacity = capacity
+
+    def flush(self):
+        """writes the vectors and the index to disk"""
+        with self.lock:
+            if self.vectors is None or not self.dirty:
+                return
+            self._write()
+
+    def _write(self):
+        """writes the vectors and then the index that points to them (must hold the lock)"""
+        self.vectors.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "capacity": self.capacity,
+                "slots": list(self.slots.items()),
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = 0
+
+    def lookup(self, key):
+        """returns the cached vector of a key or None (must hold the lock)"""
+        row = self.slots.get(key)
+        if row is None:
+            return None
+        self.slots.move_to_end(key)
+        return self.vectors[row].tolist()
+
+    def store(self, key, vector):
+        """stores a vector evicting the least recently used one if needed (must hold the lock)"""
+        if key in self.slots:
+            return
+        if self.dim is None:
+            self.dim = len(vector)
+        row = self._free_row()
+        self.vectors[row] = np.asarray(vector, dtype=np.float32)
+        self.slots[key] = row
+        self.dirty += 1
+
+    def _free_row(self):
+        """returns a row that no key on disk points to, evicting a batch of entries when full (must hold the lock)"""
+        if self.free:
+            return self.free.pop()
+        if self.next_row < self.max_entries:
+            self._ensure_capacity(self.next_row + 1)
+            self.next_row += 1
+            return self.next_row - 1
+        for _ in range(max(1, self.max_entries // self.EVICT_FRACTION)):
+            if not self.slots:
+                break
+            _, row = self.slots.popitem(last=False)
+            self.free.append(row)
+        # El índice sin las claves expulsadas llega al disco antes de sobrescribir sus filas
+        self._write()
+        return self.free.pop()
+
+
+class CachedEmbeddings(Embeddings):
+    """Disk backed cache in front of an embeddings model.
+
+    Vectors live in a memory-mapped float32 file (one row per entry) and an
+    index maps the sha256 of each text to its row. When the cache is full the
+    least recently used rows are reused.
+
+    The index is written when the new entries since the last write reach
+    flush_every or 1/16 of the cache (so writing it costs O(1) per entry),
+    when the ingestion calling embed_documents ends (flush) and at exit.
+    """
+
+    _files = {} # realpath of the folder -> _CacheFile
+    _files_lock = threading.Lock()
+
+    def __init__(self, embeddings, cache_folder, max_entries=100_000, flush_every=32):
+        """inicializes the cache loading the index from disk if it exists
+
+        Args:
+            embeddings: the embeddings model that computes the misses
+            cache_folder: folder for the vectors file and its index
+            max_entries: maximum number of cached vectors
+            flush_every: minimum number of new vectors before writing the index
+        """
+        self.embeddings = embeddings
+        self.cache_folder = cache_folder
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+
+        with self._files_lock:
+            folder = os.path.realpath(cache_folder)
+            if folder not in self._files:
+                self._files[folder] = _CacheFile(cache_folder, max_entries)
+            self._file = self._files[folder]
+
+    def flush(self):
+        """writes the vectors and the index to disk"""
+        self._file.flush()
+
+    def _maybe_flush(self):
+        """writes the index once enough new vectors were added since the last write"""
+        if self._file.dirty >= max(self.flush_every, len(self._file.slots) // 16):
+            self.flush()
+
+    @staticmethod
+    def _key(namespace, text):
+        """returns the cache key of a text (queries and documents are kept apart)"""
+        return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _embed_cached(self, namespace, texts, compute):
+        """returns the vectors of the texts computing only the misses in one call
+
+        Args:
+            namespace: 'd' for documents and 'q' for queries
+            texts: texts to embed
+            compute: function that embeds a list of texts
+        Returns:
+            list: one vector per text
+        """
+        keys = [self._key(namespace, text) for text in texts]
+        result = [None] * len(texts)
+        missing = OrderedDict() # key -> positions of the texts with that key
+
+        cache = self._file
+        with cache.lock:
+            for i, key in enumerate(keys):
+                vector = cache.lookup(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    result[i] = vector
+            self.hits += len(texts) - sum(len(pos) for pos in missing.values())
+            self.misses += sum(len(pos) for pos in missing.values())
+
+        if missing:
+            # El modelo se ejecuta fuera del lock para no bloquear otras búsquedas
+            vectors = compute([texts[positions[0]] for positions in missing.values()])
+            with cache.lock:
+                for (key, positions), vector in zip(missing.items(), vectors):
+                    cache.store(key, vector)
+                    for i in positions:
+                        result[i] = list(vector)
+        return result
+
+    def embed_documents(self, texts):
+        """embeds documents using the cache"""
+        result = self._embed_cached("d", list(texts), self.embeddings.embed_documents)
+        self._maybe_flush()
+        return result
+
+    def embed_query(self, text):
+        """embeds a query using the cache"""
+        result = self._embed_cached("q", [text], lambda missing: [self.embeddings.embed_query(missing[0])])
+        self._maybe_flush()
+        return result[0]
+
+    def embed_queries(self, texts):
+        """embeds several queries with a single forward pass for the misses
+
+        The model is called through embed_documents, which for models without a
+        query instruction (like bge-m3) gives the same vectors as embed_query.
+        """
+        result = self._embed_cached("q", list(texts), self.embeddings.embed_documents)
+        self._maybe_flush()
+        return result
+
+    def stats(self):
+        """returns the hit/miss counters of the cache
+
+        Returns:
+            dict: hits, misses, hit rate and size of the cache
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._file.slots),
+            "max_entries": self.max_entries,
+        }
@@ -0,0 +1,144 @@
+"""
+Embedding engines for CPU-only inference.
+
+The engine is chosen with the AGENT_EMBEDDING_ENGINE environment variable:
+    torch       fp32 PyTorch through sentence-transformers (default)
+    torch-int8  the same model with its Linear layers dynamically quantized to int8
+    onnx        ONNX Runtime through the sentence-transformers onnx backend
+                (needs `optimum[onnxruntime]`; AGENT_EMBEDDING_ONNX_FILE selects a
+                file of the snapshot, e.g. a quantized `onnx/model_qint8_avx2.onnx`)
+
+The thread count of the engines comes from AGENT_EMBEDDING_THREADS or, by
+default, from the CPU quota of the container (cgroup v2 `cpu.max` or cgroup v1
+`cpu.cfs_quota_us`), capped by the CPUs the process may run on. Torch takes it
+through set_num_threads; ONNX Runtime ignores both that and OMP_NUM_THREADS,
+so its session is created with explicit SessionOptions.
+"""
+
+# === SYSTEM ===
+import os
+import math
+
+# === VECTOR EMBEDDINGS ===
+from langchain_huggingface import HuggingFaceEmbeddings
+
+EMBEDDING_ENGINES = ("torch", "torch-int8", "onnx")
+
+
+def cpu_quota(cgroup_root="/sys/fs/cgroup"):
+    """returns the number of CPUs this process can use (cgroup quota and affinity)
+
+    Args:
+        cgroup_root: mount point of the cgroup filesystem
+    Returns:
+        int: usable CPUs, at least 1
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError: # no disponible fuera de Linux
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open(os.path.join(cgroup_root, "cpu.max"), "r") as f:
+            limit, period = f.read().split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us"), "r") as f:
+                limit = int(f.read())
+            with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us"), "r") as f:
+                period = int(f.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def configure_threads(threads=None):
+    """sets the intra-op thread count of the embedding engines
+
+    Args:
+        threads: number of threads (defaults to AGENT_EMBEDDING_THREADS or the CPU quota)
+    Returns:
+        int: the thread count in use
+    """
+    threads = threads or int(os.getenv("AGENT_EMBEDDING_THREADS", "0")) or cpu_quota()
+    # OpenMP lo lee al cargar torch/onnxruntime; set_num_threads cubre el caso en que ya estaba cargado
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    import torch
+    torch.set_num_threads(threads)
+    return threads
+
+
+def onnx_session_options(threads):
+    """returns the ONNX Runtime session options sized by a thread count
+
+    ONNX Runtime starts one intra-op thread per host core unless told otherwise,
+    whatever the container quota is.
+
+    Args:
+        threads: intra-op threads of the session
+    Returns:
+        onnxruntime.SessionOptions: the options (sequential execution, so one inter-op thread)
+    """
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    # Ejecución secuencial: el pool inter-op no se usa y no debe sumar hilos a la cuota
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.inter_op_num_threads = 1
+    return options
+
+
+def build_embeddings(model_name, engine=None, batch_size=64, multi_process=False, threads=None):
+    """builds the embeddings model of the selected engine
+
+    Args:
+        model_name: Hugging Face id of the model or path to a local snapshot
+        engine: name of the engine (defaults to AGENT_EMBEDDING_ENGINE or 'torch')
+        batch_size: batch size of the encoder
+        multi_process: whether to encode with a pool of processes (torch only)
+        threads: intra-op threads (defaults to the CPU quota)
+    Returns:
+        HuggingFaceEmbeddings: the embeddings model (normalized vectors)
+    """
+    engine = engine or os.getenv("AGENT_EMBEDDING_ENGINE", "torch")
+    if engine not in EMBEDDING_ENGINES:
+        raise ValueError(f"AGENT_EMBEDDING_ENGINE must be one of {EMBEDDING_ENGINES}, got {engine!r}")
+    threads = configure_threads(threads)
+
+    model_kwargs = {"device": "cpu"}
+    if engine == "onnx":
+        model_kwargs["backend"] = "onnx"
+        onnx_kwargs = {"provider": "CPUExecutionProvider", "session_options": onnx_session_options(threads)}
+        if os.getenv("AGENT_EMBEDDING_ONNX_FILE"):
+            onnx_kwargs["file_name"] = os.getenv("AGENT_EMBEDDING_ONNX_FILE")
+        model_kwargs["model_kwargs"] = onnx_kwargs
+
+    model = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={
+            'batch_size': batch_size,
+            'normalize_embeddings': True
+        },
+        show_progress=True,
+        # el pool de procesos recarga el modelo original: solo tiene sentido con torch fp32
+        multi_process=multi_process and engine == "torch"
+    )
+
+    if engine == "torch-int8":
+        import torch
+        transformer = model._client[0]
+        transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+            transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    print(f"Embeddings: {model_name} con el motor {engine} ({threads} hilos)")
+    return model
@@ -0,0 +1,137 @@
+"""
+Exact (brute-force) vector search over the embeddings of a Chroma collection.
+
+The normalized vectors are kept in one float32 matrix and a query is scored
+against every row with a single matrix-vector product, so results are the
+true nearest neighbours by cosine similarity. It is the ground truth used to
+measure the recall of the HNSW index (benchmarks/ann_sweep.py) and, for small
+collections or searches restricted to a few pdfs, it is also faster than
+going through Chroma.
+
+The matrix is replaced as a whole on every change (copy on write): searches
+read a snapshot and never wait for ingestion.
+"""
+
+# === SYSTEM ===
+import threading
+
+# === VECTORS ===
+import numpy as np
+
+
+def normalize(vectors):
+    """returns the rows of a matrix scaled to unit length (float32)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class ExactIndex:
+    """Brute-force cosine search over a matrix of normalized vectors."""
+
+    def __init__(self, ids=(), vectors=None):
+        """inicializes the index
+
+        Args:
+            ids: ids of the vectors
+            vectors: matrix with one vector per id (normalized here)
+        """
+        self._lock = threading.Lock() # solo entre escritores
+        self._snapshot = self._build(list(ids), vectors)
+
+    @staticmethod
+    def _build(ids, vectors):
+        """returns the (ids, matrix, row of each id) tuple read by searches"""
+        if not ids:
+            return [], np.zeros((0, 0), dtype=np.float32), {}
+        matrix = normalize(vectors)
+        return ids, matrix, {cid: row for row, cid in enumerate(ids)}
+
+    @classmethod
+    def from_collection(cls, collection, batch_size=5000):
+        """loads every vector of a Chroma collection
+
+        Args:
+            collection: the chromadb collection
+            batch_size: vectors read per request to Chroma
+        Returns:
+            ExactIndex: the index
+        """
+        ids, vectors = [], []
+        offset = 0
+        while True:
+            batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            ids.extend(batch["ids"])
+            vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+            offset += len(batch["ids"])
+        return cls(ids, np.concatenate(vectors) if vectors else None)
+
+    def __len__(self):
+        return len(self._snapshot[0])
+
+    @property
+    def vectors(self):
+        """the normalized matrix, one row per id (do not modify it)"""
+        return self._snapshot[1]
+
+    @property
+    def nbytes(self):
+        """memory of the matrix in bytes"""
+        return self._snapshot[1].nbytes
+
+    def update(self, add_ids=(), add_vectors=None, remove_ids=()):
+        """adds and removes vectors in one swap (ids already present are replaced)
+
+        Args:
+            add_ids: ids of the new vectors
+            add_vectors: matrix with one vector per new id
+            remove_ids: ids to remove
+        """
+        add_ids = list(add_ids)
+        drop = set(remove_ids) | set(add_ids)
+        with self._lock:
+            ids, matrix, _ = self._snapshot
+            keep = [row for row, cid in enumerate(ids) if cid not in drop]
+            new_ids = [ids[row] for row in keep] + add_ids
+            parts = []
+            if keep:
+                parts.append(matrix[keep])
+            if add_ids:
+                parts.append(normalize(add_vectors))
+            self._snapshot = self._build(new_ids, np.concatenate(parts) if parts else None)
+
+    def search(self, vector, k, allowed=None, exclude=None):
+        """returns the k most similar vectors to a query
+
+        Args:
+            vector: the query vector
+            k: the number of results
+            allowed: optional set of ids the search is restricted to (only their rows are scored)
+            exclude: optional set of ids that are never returned (their rows are masked)
+        Returns:
+            list: (id, cosine similarity) sorted by similarity
+        """
+        ids, matrix, row_of = self._snapshot
+        if not ids or k <= 0:
+            return []
+        if allowed is None:
+            rows = None
+            scores = matrix @ normalize(vector)
+        else:
+            rows = np.fromiter((row_of[cid] for cid in allowed if cid in row_of), dtype=np.int64)
+            if rows.size == 0:
+                return []
+            scores = matrix[rows] @ normalize(vector)
+        if exclude:
+            masked = [row_of[cid] for cid in exclude if cid in row_of]
+            if rows is not None:
+                masked = np.flatnonzero(np.isin(rows, masked))
+            scores[masked] = -np.inf
+        k = min(k, scores.shape[0])
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        best = best[np.isfinite(scores[best])]
+        found = best if rows is None else rows[best]
+        return [(ids[row], float(score)) for row, score in zip(found, scores[best])]
@@ -0,0 +1,251 @@
+"""
+PDF text extraction and chunking for the ingestion pipeline.
+
+Pages are extracted with the backend selected by AGENT_PDF_BACKEND:
+    pypdf    pure Python, always installed
+    pymupdf  MuPDF (optional `pymupdf` package): native code, several times
+             faster on math-heavy PDFs, with text blocks sorted in reading order
+    auto     pymupdf when it is installed, pypdf otherwise (default)
+
+Extraction works on page ranges, so one long PDF is parsed by several
+processes at once (`parse_pdfs`). Chunking works on the whole document:
+pages are streamed into a `DocumentChunker` that splits their concatenated
+text in one pass, so a chunk may cross a page break. Every chunk records the name of its
+pdf ('filename'), the page where it starts ('page', 0-based as PyPDFLoader
+did), the page where it ends ('page_end') and its character offsets in the
+document text ('start', 'end').
+"""
+
+# === SYSTEM & CONCURRENCY ===
+import os
+import re
+import bisect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# === DOCUMENT PROCESSING (ETL) ===
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+PDF_BACKENDS = ("auto", "pypdf", "pymupdf")
+PAGE_SEPARATOR = "\n" # un salto de línea: el splitter no trata el cambio de página como fin de párrafo
+PARALLEL_MIN_PAGES = 32 # por debajo, arrancar procesos cuesta más de lo que ahorra
+
+HYPHEN_RE = re.compile(r"([a-záéíóúñü])-\n([a-záéíóúñü])")
+SPACES_RE = re.compile(r"[ \t]+\n")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def resolve_backend(backend=None):
+    """returns the backend to use ('pypdf' or 'pymupdf') for a name or AGENT_PDF_BACKEND"""
+    backend = backend or os.getenv("AGENT_PDF_BACKEND", "auto")
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"AGENT_PDF_BACKEND must be one of {PDF_BACKENDS}, got {backend!r}")
+    if backend == "auto":
+        try:
+            import pymupdf # noqa: F401
+        except ImportError:
+            return "pypdf"
+        return "pymupdf"
+    return backend
+
+
+def clean_text(text):
+    """joins words hyphenated at the end of a line and removes trailing spaces and extra blank lines"""
+    text = text.replace("\x00", "")
+    text = HYPHEN_RE.sub(r"\1\2", text)
+    text = SPACES_RE.sub("\n", text)
+    return BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def page_count(path, backend="pypdf"):
+    """returns the number of pages of a pdf"""
+    if backend == "pymupdf":
+        import pymupdf
+        with pymupdf.open(path) as doc:
+            return doc.page_count
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def iter_pages(path, start=0, stop=None, backend="pypdf"):
+    """yields the cleaned text of the pages [start, stop) of a pdf one at a time (the pdf is opened once)"""
+    if backend == "pymupdf":
+        import pymupdf
+        with pymupdf.open(path) as doc:
+            for number in range(start, doc.page_count if stop is None else stop):
+                # sort=True ordena los bloques de arriba abajo y de izquierda a derecha
+                yield clean_text(doc[number].get_text("text", sort=True))
+    else:
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        for number in range(start, len(reader.pages) if stop is None else stop):
+            yield clean_text(reader.pages[number].extract_text() or "")
+
+
+def extract_pages(path, start, stop, backend="pypdf"):
+    """extracts the text of the pages [start, stop) of a pdf (runs inside the worker processes)
+
+    Returns:
+        tuple: (path, start, list with the cleaned text of each page)
+    """
+    return path, start, list(iter_pages(path, start, stop, backend))
+
+
+def page_ranges(pages, workers, min_pages=4, max_pages=32):
+    """splits the pages of a pdf into ranges so every worker gets a few of them
+
+    Returns:
+        list: (start, stop) tuples covering range(pages) in order
+    """
+    size = max(min_pages, min(max_pages, -(-pages // (workers * 4))))
+    return [(start, min(start + size, pages)) for start in range(0, pages, size)]
+
+
+class DocumentChunker:
+    """Splits a document streamed page by page into chunks that may cross pages.
+
+    Pages are collected as they arrive and `finish` splits the text of the
+    whole document (pages joined by a line break) in one pass, so the chunks
+    are the same as splitting the joined text at once. Offsets are positions in
+    that text.
+    """
+
+    def __init__(self, source, chunk_size=1000, chunk_overlap=150):
+        """inicializes the chunker
+
+        Args:
+            source: path of the pdf, stored in the metadata of every chunk
+            chunk_size: maximum number of characters per chunk
+            chunk_overlap: characters shared by consecutive chunks
+        """
+        self.source = source
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.page_starts = [] # offset del documento donde empieza cada página
+        self._pages = []
+        self._length = 0
+
+    def add_page(self, text):
+        """appends the text of the next page"""
+        if self._pages:
+            self._length += len(PAGE_SEPARATOR)
+        self.page_starts.append(self._length)
+        self._pages.append(text)
+        self._length += len(text)
+
+    def finish(self):
+        """splits the document and returns its chunks (Documents)"""
+        # Un corte a mitad de documento no es equivalente: el splitter fusiona distinto
+        # el resto de un párrafo largo, así que se divide el texto entero de una vez
+        text = PAGE_SEPARATOR.join(self._pages)
+        self._pages = []
+        chunks = []
+        cursor = 0
+        for piece in self.splitter.split_text(text):
+            start = text.find(piece, cursor)
+            if start < 0: # no debería pasar: el splitter solo recorta espacios
+                start = cursor
+            cursor = start + 1
+            chunks.append(self._document(piece, start, start + len(piece)))
+        return chunks
+
+    def _document(self, text, start, end):
+        """builds the Document of a chunk with its page span and offsets"""
+        page = bisect.bisect_right(self.page_starts, start) - 1
+        page_end = bisect.bisect_right(self.page_starts, max(start, end - 1)) - 1
+        return Document(
+            page_content=text,
+            metadata={"source": self.source, "filename": os.path.basename(self.source),
+                      "page": max(page, 0), "page_end": max(page_end, 0), "start": start, "end": end}
+        )
+
+
+def load_and_split(path, chunk_size=1000, chunk_overlap=150, backend=None):
+    """parses and splits a pdf in this process, streaming its pages into the chunker
+
+    Args:
+        path: path to the pdf file
+        chunk_size: maximum number of characters per chunk
+        chunk_overlap: characters shared by consecutive chunks
+        backend: extraction backend (None reads AGENT_PDF_BACKEND)
+    Returns:
+        tuple: (path, text of each page, chunks as Documents)
+    """
+    backend = resolve_backend(backend)
+    chunker = DocumentChunker(path, chunk_size, chunk_overlap)
+    pages = []
+    for text in iter_pages(path, backend=backend):
+        pages.append(text)
+        chunker.add_page(text)
+    return path, pages, chunker.finish()
+
+
+def parse_pdfs(paths, workers=1, backend=None, isolate=False, chunk_size=1000, chunk_overlap=150):
+    """parses and splits pdfs, extracting page ranges in parallel processes
+
+    Ranges are submitted in document order and at most two per worker are in
+    flight; the pages of each pdf are fed to its chunker in order as soon as
+    they arrive, and each pdf is yielded once all its pages are in.
+
+    Args:
+        paths: list of pdf paths
+        workers: number of extraction processes (1 parses in this process)
+        backend: extraction backend (None reads AGENT_PDF_BACKEND)
+        isolate: use worker processes even for small jobs, so no pdf is parsed
+            in this process (keeps the GIL free for a web handler)
+        chunk_size: maximum number of characters per chunk
+        chunk_overlap: characters shared by consecutive chunks
+    Yields:
+        tuple: (path, text of each page, chunks as Documents), in the order of paths
+    """
+    backend = resolve_backend(backend)
+    if not paths:
+        return
+    counts = None
+    if not isolate:
+        counts = [page_count(path, backend) for path in paths]
+        if workers <= 1 or sum(counts) < PARALLEL_MIN_PAGES:
+            for path in paths:
+                yield load_and_split(path, chunk_size, chunk_overlap, backend)
+            return
+
+    # 'spawn' evita heredar los hilos de torch del proceso principal
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context) as executor:
+        if counts is None:
+            counts = list(executor.map(page_count, paths, [backend] * len(paths)))
+        tasks = [(path, start, stop) for path, count in zip(paths, counts)
+                 for start, stop in page_ranges(count, max(1, workers))]
+        tasks.reverse()
+
+        current = 0 # pdf que se está ensamblando
+        ready = {} # (path, start) -> textos de las páginas
+        pages, chunker = [], DocumentChunker(paths[0], chunk_size, chunk_overlap)
+        in_flight = set()
+        while True:
+            # Ensamblamos en orden todo lo que ya llegó del pdf actual
+            while current < len(paths):
+                path = paths[current]
+                if len(pages) < counts[current]:
+                    texts = ready.pop((path, len(pages)), None)
+                    if texts is None:
+                        break
+                    for text in texts:
+                        pages.append(text)
+                        chunker.add_page(text)
+                    continue
+                yield path, pages, chunker.finish()
+                current += 1
+                if current < len(paths):
+                    pages = []
+                    chunker = DocumentChunker(paths[current], chunk_size, chunk_overlap)
+            if current >= len(paths):
+                return
+
+            # Lo que espera a ser ensamblado también cuenta: la memoria no crece si un rango se retrasa
+            while tasks and len(in_flight) + len(ready) < max(1, workers) * 2:
+                in_flight.add(executor.submit(extract_pages, *tasks.pop(), backend))
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, start, texts = future.result()
+                ready[(path, start)] = texts
@@ -0,0 +1,139 @@
+# === SYSTEM & CONCURRENCY ===
+# A thread for embedding and a bounded queue between it and the parser
+import os
+import time
+import queue
+import threading
+
+# === DOCUMENT PROCESSING (ETL) ===
+# Page-parallel extraction and document-level chunks (see utils.extraction)
+from utils.extraction import load_and_split, parse_pdfs, resolve_backend
+
+
+class IngestionPipeline:
+    """Streaming ingestion: parse in processes, embed in batches, write in bulk.
+
+    Page ranges of the PDFs are extracted in a process pool while a single embedding
+    thread pulls chunks from a bounded queue, builds full batches across
+    documents and upserts the vectors into Chroma as soon as they are ready.
+    """
+
+    _DONE = object()
+
+    def __init__(self, embeddings, vector_store, batch_size=64, workers=None, queue_batches=4,
+                 isolate_parsing=False, backend=None):
+        """inicializes the pipeline
+
+        Args:
+            embeddings: embeddings object used for the chunks
+            vector_store: langchain Chroma store where the vectors are written
+            batch_size: number of chunks embedded per forward pass
+            workers: number of parsing processes (defaults to the cpu count)
+            queue_batches: batches that can wait in the queue before parsing pauses
+            isolate_parsing: parse in worker processes even a small pdf, so the
+                pure-python parser never holds the GIL of a process serving requests
+            backend: pdf extraction backend (None reads AGENT_PDF_BACKEND)
+        """
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.isolate_parsing = isolate_parsing
+        self.backend = resolve_backend(backend)
+        self.queue = queue.Queue(maxsize=batch_size * queue_batches)
+        self._error = None
+
+    def run(self, paths, plan, progress=None):
+        """ingests the pdfs and returns the throughput of the run
+
+        Args:
+            paths: list of pdf paths to ingest
+            plan: function (path, pages, chunks) -> list of (id, chunk) to embed,
+                called once per pdf as soon as it is parsed
+            progress: optional function called with the stats every time a pdf
+                is parsed and every time a batch is written
+        Returns:
+            dict: pages, chunks, chunks to embed, embedded chunks, seconds and rates of the run
+        """
+        stats = {"files": len(paths), "parsed": 0, "pages": 0, "chunks": 0, "to_embed": 0, "embedded": 0}
+        self._progress = progress or (lambda stats: None)
+        start = time.perf_counter()
+
+        consumer = threading.Thread(target=self._embed_worker, args=(stats,), daemon=True)
+        consumer.start()
+        try:
+            for path, pages, chunks in self._parse(paths):
+                items = plan(path, pages, chunks)
+                stats["parsed"] += 1
+                stats["pages"] += len(pages)
+                stats["chunks"] += len(chunks)
+                stats["to_embed"] += len(items)
+                self._progress(stats)
+                for item in items:
+                    self._put(item)
+        finally:
+            self._put(self._DONE)
+            consumer.join()
+        if self._error is not None:
+            raise self._error
+
+        stats["seconds"] = time.perf_counter() - start
+        seconds = max(stats["seconds"], 1e-9)
+        stats["pages_per_s"] = stats["pages"] / seconds
+        stats["chunks_per_s"] = stats["chunks"] / seconds
+        print(f"Ingesta: {stats['files']} PDFs, {stats['pages']} páginas, {stats['chunks']} chunks "
+              f"({stats['embedded']} embebidos) en {stats['seconds']:.1f}s -> "
+              f"{stats['pages_per_s']:.1f} páginas/s, {stats['chunks_per_s']:.1f} chunks/s")
+        return stats
+
+    def _parse(self, paths):
+        """yields (path, pages, chunks) for each pdf, extracting page ranges in parallel"""
+        return parse_pdfs(paths, workers=self.workers, backend=self.backend, isolate=self.isolate_parsing)
+
+    def _put(self, item):
+        """puts an item in the queue without blocking forever if the embedder died"""
+        while True:
+            if self._error is not None and item is not self._DONE:
+                raise self._error
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _embed_worker(self, stats):
+        """embeds full batches from the queue and writes them to the vector store"""
+        batch = []
+        done = False
+        try:
+            while True:
+                item = self.queue.get()
+                if item is self._DONE:
+                    done = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._write(batch, stats)
+                    batch = []
+            if batch:
+                self._write(batch, stats)
+        except Exception as e: # lo relanza run() en el hilo principal
+            self._error = e
+            # Vaciamos la cola para que el productor no se quede bloqueado (si el fallo fue en el
+            # último batch el final ya se leyó y no hay nada que esperar)
+            while not done and self.queue.get() is not self._DONE:
+                pass
+
+    def _write(self, batch, stats):
+        """embeds a batch and upserts it in bulk"""
+        ids = [cid for cid, _ in batch]
+        texts = [chunk.page_content for _, chunk in batch]
+        vectors = self.embeddings.embed_documents(texts)
+        self.vector_store._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=texts,
+            metadatas=[chunk.metadata for _, chunk in batch],
+        )
+        stats["embedded"] += len(batch)
+        self._progress(stats)
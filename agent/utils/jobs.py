@@ -0,0 +1,129 @@
+# === SYSTEM & CONCURRENCY ===
+# A worker thread and a queue of jobs, plus the upload folder on disk
+import os
+import time
+import uuid
+import queue
+import shutil
+import threading
+from collections import OrderedDict
+
+
+class IngestionJobs:
+    """Background queue of ingestion jobs.
+
+    Uploaded pdfs are queued and indexed one at a time by a single worker
+    thread, so the request that uploaded a pdf returns at once and ingestion
+    never runs on the event loop. Each job exposes its state ('queued',
+    'running', 'done' or 'failed') and the live progress of the pipeline.
+    Only the latest `max_jobs` finished jobs are kept.
+    """
+
+    def __init__(self, ingest, upload_folder, max_jobs=200):
+        """inicializes the queue (the worker starts with the first job)
+
+        Args:
+            ingest: function (path, progress, **options) -> stats that indexes a pdf,
+                calling progress(stats) as it advances
+            upload_folder: folder where uploads wait until their job runs
+            max_jobs: finished jobs kept for the status endpoint
+        """
+        self.ingest = ingest
+        self.upload_folder = upload_folder
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict() # job id -> job dict, oldest first
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        # Los trabajos viven en memoria: las subidas de un proceso anterior ya no tienen trabajo
+        shutil.rmtree(upload_folder, ignore_errors=True)
+        os.makedirs(upload_folder, exist_ok=True)
+
+    def staging_path(self, job_id, filename):
+        """returns the path where the upload of a job is written (keeps the original filename)"""
+        folder = os.path.join(self.upload_folder, job_id)
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, os.path.basename(filename))
+
+    @staticmethod
+    def new_id():
+        """returns a new job id"""
+        return uuid.uuid4().hex
+
+    def submit(self, job_id, path, **options):
+        """queues the ingestion of a pdf already written to its staging path
+
+        Args:
+            job_id: id returned by new_id (the one used for staging_path)
+            path: path of the uploaded pdf
+            options: keyword arguments passed to ingest (shown in the job), e.g. the collection
+        Returns:
+            dict: a copy of the job
+        """
+        job = {
+            "id": job_id,
+            "filename": os.path.basename(path),
+            **options,
+            "state": "queued",
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "progress": {},
+            "stats": None,
+            "error": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._trim()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name="ingestion-jobs", daemon=True)
+                self._worker.start()
+        self._queue.put((job_id, path, options))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """returns a copy of a job (None if it does not exist)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else {**job, "progress": dict(job["progress"])}
+
+    def list(self):
+        """returns a copy of every job kept, newest first"""
+        with self._lock:
+            ids = list(reversed(self._jobs))
+        return [job for job in map(self.get, ids) if job is not None]
+
+    def pending(self):
+        """returns the number of jobs queued or running"""
+        with self._lock:
+            return sum(job["state"] in ("queued", "running") for job in self._jobs.values())
+
+    def _trim(self):
+        """forgets the oldest finished jobs over max_jobs (must hold the lock)"""
+        finished = [jid for jid, job in self._jobs.items() if job["state"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _work(self):
+        """runs the queued jobs one after the other"""
+        while True:
+            job_id, path, options = self._queue.get()
+            self._update(job_id, state="running", started=time.time())
+
+            def progress(stats, job_id=job_id):
+                self._update(job_id, progress=dict(stats))
+
+            try:
+                stats = self.ingest(path, progress, **options)
+                self._update(job_id, state="done", stats=stats, finished=time.time())
+            except Exception as e:
+                print(f"Error al indexar {os.path.basename(path)}: {e}")
+                self._update(job_id, state="failed", error=str(e), finished=time.time())
+            finally:
+                shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+                with self._lock:
+                    self._trim()
@@ -0,0 +1,192 @@
+# === SYSTEM & FILESYSTEM ===
+# Tools for tokenizing and persisting the index atomically
+import os
+import re
+import math
+import heapq
+import pickle
+import threading
+import unicodedata
+from collections import Counter
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Palabras vacías (ya sin tildes, como las deja tokenize): no hacen de una pregunta una búsqueda por términos
+STOPWORDS = frozenset("""
+a al algo ante como con cual cuales cuando de del desde donde el ella ellas ello ellos en entre era es esa
+ese eso esta estan este esto explica explicame hay la las le les lo los mas me mi muy no o para pero por
+porque que quien se ser si sin sobre son su sus te tiene tu un una uno unos y ya
+about an and are as at be by can do does explain for from how in is it of on or the this to
+was what when where which who why with
+""".split())
+KEYWORD_MAX_DF = 0.1 # un término es "raro" si aparece en como mucho el 10% de los chunks
+
+
+def tokenize(text):
+    """splits a text into lowercase tokens without accents
+
+    Args:
+        text: the text to tokenize
+    Returns:
+        list: list of tokens
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text)
+
+
+class BM25Index:
+    """Persistent inverted index with BM25 scoring over the chunks of the vector store.
+
+    It uses the same chunk ids as Chroma so lexical and dense results can be
+    fused, and keeps the text and metadata of each chunk so lexical results
+    can be returned without touching the vector store.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        """loads the index from disk if it exists
+
+        Args:
+            path: path to the pickle file of the index
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings = {} # term -> {chunk_id: term frequency}
+        self.chunks = {} # chunk_id -> (length, text, metadata)
+        self.total_length = 0
+        self._lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("version") == self.VERSION:
+                self.postings = data["postings"]
+                self.chunks = data["chunks"]
+                self.total_length = data["total_length"]
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.chunks
+
+    def add(self, chunk_id, text, metadata):
+        """indexes a chunk (replacing it if it already exists)
+
+        Args:
+            chunk_id: id of the chunk in the vector store
+            text: text of the chunk
+            metadata: metadata of the chunk
+        """
+        with self._lock:
+            if chunk_id in self.chunks:
+                self.remove([chunk_id])
+            terms = Counter(tokenize(text))
+            length = sum(terms.values())
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+            self.chunks[chunk_id] = (length, text, dict(metadata))
+            self.total_length += length
+
+    def remove(self, chunk_ids):
+        """removes chunks from the index"""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                entry = self.chunks.pop(chunk_id, None)
+                if entry is None:
+                    continue
+                self.total_length -= entry[0]
+                for term in set(tokenize(entry[1])):
+                    postings = self.postings.get(term)
+                    if postings is None:
+                        continue
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def get(self, chunk_id):
+        """returns (text, metadata) of a chunk"""
+        _, text, metadata = self.chunks[chunk_id]
+        return text, metadata
+
+    def keyword_terms(self, query, max_df=KEYWORD_MAX_DF):
+        """returns the terms that make a query a keyword query
+
+        Stopwords are dropped and every remaining term must be rare in the
+        index (in at most max_df of the chunks): acronyms, formula names or
+        symbols, not common words.
+
+        Args:
+            query: the query to check
+            max_df: largest fraction of the chunks a keyword may appear in
+        Returns:
+            list: the keywords of the query, empty when it is not a keyword query
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term not in STOPWORDS]
+        with self._lock:
+            limit = max_df * len(self.chunks)
+            if not terms or any(len(self.postings.get(term, ())) > limit for term in terms):
+                return []
+        return terms
+
+    def search(self, query, k=3, allowed=None):
+        """returns the k best chunks for the query
+
+        Args:
+            query: the query to search for
+            k: the number of results to return
+            allowed: optional set of chunk ids the results are restricted to
+        Returns:
+            list: list of (chunk_id, score) sorted by score
+        """
+        with self._lock:
+            n = len(self.chunks)
+            if not n:
+                return []
+            avg_length = self.total_length / n
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for chunk_id, tf in postings.items():
+                    if allowed is not None and chunk_id not in allowed:
+                        continue
+                    length = self.chunks[chunk_id][0]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self):
+        """writes the index to disk (write + rename so it is never half written)"""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({
+                    "version": self.VERSION,
+                    "postings": self.postings,
+                    "chunks": self.chunks,
+                    "total_length": self.total_length,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """fuses several rankings of ids with reciprocal rank fusion
+
+    Args:
+        rankings: list of lists of ids, each sorted from best to worst
+        k: smoothing constant of the fusion
+    Returns:
+        list: ids sorted by fused score
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,146 @@
+"""
+LLM backends of the agent.
+
+The backend is chosen with the AGENT_LLM_BACKEND environment variable:
+    gemini  Google Gemini through langchain-google-genai (default, needs GOOGLE_API_KEY)
+    fake    ScriptedChatModel, a deterministic local stand-in that needs no network
+"""
+
+# === SYSTEM ===
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+
+# === LANGCHAIN CHAT MODEL INTERFACE ===
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# === CONTEXT ===
+# The same patterns build_context uses to read the sources of a search result
+from utils.context import FILE_RE, PAGE_RE
+
+LLM_BACKENDS = ("gemini", "fake")
+
+
+def build_chat_model(backend=None):
+    """builds the chat model of the selected backend
+
+    Args:
+        backend: name of the backend (defaults to AGENT_LLM_BACKEND or 'gemini')
+    Returns:
+        BaseChatModel: the chat model (tools are bound by the caller)
+    """
+    backend = backend or os.getenv("AGENT_LLM_BACKEND", "gemini")
+    if backend == "gemini":
+        # Import diferido: el backend fake no necesita el SDK de Google
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=os.getenv("AGENT_LLM_MODEL", "gemini-2.5-flash-lite"),
+            temperature=0
+        )
+    if backend == "fake":
+        return ScriptedChatModel(
+            latency_ms=float(os.getenv("AGENT_FAKE_LLM_LATENCY_MS", "0")),
+            tool_rounds=int(os.getenv("AGENT_FAKE_LLM_TOOL_ROUNDS", "1")),
+        )
+    raise ValueError(f"AGENT_LLM_BACKEND must be one of {LLM_BACKENDS}, got {backend!r}")
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic chat model used to benchmark the agent without Gemini.
+
+    For every user message it first calls the `search` tool with the message
+    as query (`tool_rounds` times), then answers with a markdown reply that
+    cites the files and pages returned by the tool, in the same citation
+    format the system prompt asks Gemini for. Every call waits `latency_ms`,
+    and streaming yields the answer word by word.
+    """
+
+    latency_ms: float = 0.0
+    tool_rounds: int = 1
+    search_k: int = 3
+
+    @property
+    def _llm_type(self):
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        """the script always calls `search`, so the tools are not needed"""
+        return self
+
+    # --- script ---
+
+    def _reply(self, messages):
+        """returns the scripted message for a conversation"""
+        turn = []
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                question = message.content
+                break
+            turn.append(message)
+        else:
+            question = ""
+
+        rounds_done = sum(1 for m in turn if isinstance(m, AIMessage) and m.tool_calls)
+        if rounds_done < self.tool_rounds:
+            call_id = hashlib.sha256(f"{len(messages)}\x00{question}".encode("utf-8")).hexdigest()[:12]
+            return AIMessage(content="", tool_calls=[{
+                "name": "search",
+                "args": {"query": question, "k": self.search_k},
+                "id": f"call_{call_id}",
+            }])
+
+        citations = []
+        for message in turn:
+            if isinstance(message, ToolMessage):
+                content = str(message.content)
+                files = FILE_RE.findall(content)
+                pages = dict(PAGE_RE.findall(content))
+                citations += [(name, pages.get(n, "1")) for n, name in files]
+        citations = list(dict.fromkeys(citations))
+
+        if not citations:
+            return AIMessage(content="No tengo suficiente información en los documentos para responder.")
+        body = " ".join(f"[[{i}]]({name}#page={page})" for i, (name, page) in enumerate(citations, 1))
+        references = "\n".join(f"* [[{i}] {name}, page {page}]({name}#page={page})"
+                               for i, (name, page) in enumerate(citations, 1))
+        return AIMessage(content=f"Respuesta basada en los documentos {body}.\n\n---\n**Referencias:**\n{references}")
+
+    @staticmethod
+    def _chunks(message):
+        """splits a scripted message into streaming chunks"""
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i,
+            } for i, call in enumerate(message.tool_calls)]))
+            return
+        for word in re.findall(r"\S+\s*", message.content):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    # --- BaseChatModel interface ---
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        for chunk in self._chunks(self._reply(messages)):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency_ms / 1000)
+        for chunk in self._chunks(self._reply(messages)):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
@@ -0,0 +1,97 @@
+# === SYSTEM & FILESYSTEM ===
+# Tools for hashing files and persisting the manifest atomically
+import os
+import json
+import hashlib
+
+
+def file_sha256(path, block_size=1 << 20):
+    """returns the sha256 of a file reading it in blocks
+
+    Args:
+        path: path to the file
+        block_size: number of bytes read per iteration
+    Returns:
+        str: hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(filename, chunk):
+    """returns a stable id for a chunk based on its file, page and text
+
+    Args:
+        filename: name of the pdf the chunk belongs to
+        chunk: langchain Document produced by the splitter
+    Returns:
+        str: id used for the chunk inside the vector store
+    """
+    page = chunk.metadata.get("page", 0)
+    digest = hashlib.sha256(f"{page}\x00{chunk.page_content}".encode("utf-8")).hexdigest()
+    return f"{filename}::{digest[:32]}"
+
+
+class IngestionManifest:
+    """Keeps track of what is indexed in the vector store.
+
+    Every pdf is stored by filename with the hash of its content and the ids of
+    its chunks, so a restart only has to index the files that changed.
+    """
+
+    VERSION = 3 # 2: chunks de documento completo que cruzan páginas (utils.extraction), 3: metadato filename
+
+    def __init__(self, path):
+        """loads the manifest from disk if it exists
+
+        Args:
+            path: path to the json file of the manifest
+        """
+        self.path = path
+        self.exists = os.path.exists(path)
+        self.entries = {}
+        if self.exists:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.entries = data.get("files", {})
+            else:
+                # Otro formato de chunks: el índice se trata como si no tuviera manifiesto
+                self.exists = False
+
+    def files(self):
+        """returns the set of indexed filenames"""
+        return set(self.entries)
+
+    def file_hash(self, filename):
+        """returns the content hash recorded for a file (or None)"""
+        return self.entries.get(filename, {}).get("sha256")
+
+    def chunk_ids(self, filename):
+        """returns the chunk ids recorded for a file"""
+        return list(self.entries.get(filename, {}).get("chunks", []))
+
+    def record(self, filename, sha256, chunk_ids):
+        """records the state of an indexed file
+
+        Args:
+            filename: name of the pdf
+            sha256: hash of the pdf content
+            chunk_ids: ids of the chunks stored in the vector store
+        """
+        self.entries[filename] = {"sha256": sha256, "chunks": list(chunk_ids)}
+
+    def remove(self, filename):
+        """forgets a file"""
+        self.entries.pop(filename, None)
+
+    def save(self):
+        """writes the manifest to disk (write + rename so it is never half written)"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "files": self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
@@ -0,0 +1,253 @@
+"""
+Lightweight instrumentation of the agent hot paths.
+
+Spans are aggregated into Prometheus histograms and rendered by the /metrics
+endpoint. Set AGENT_METRICS_ENABLED=0 to disable them: the `timed` decorator
+then returns the original function untouched and `span` does nothing.
+"""
+
+# === SYSTEM ===
+import os
+import time
+import bisect
+import inspect
+import functools
+import threading
+import contextvars
+
+ENABLED = os.getenv("AGENT_METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Buckets in seconds, from 1 ms to 60 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# spans of the current request: list of (name, seconds), read by the trace header
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def _label_string(labels):
+    """renders a tuple of (name, value) pairs as a prometheus label set"""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    """Prometheus histogram with labels"""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {} # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """records a value"""
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """returns the prometheus text lines of the histogram"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_label_string(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_string(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_label_string(key)} {total}")
+                lines.append(f"{self.name}_count{_label_string(key)} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter with labels"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """increments the counter"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        """returns the prometheus text lines of the counter"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_label_string(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Prometheus gauge with labels"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        """sets the value of the gauge"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = value
+
+    def render(self):
+        """returns the prometheus text lines of the gauge"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_label_string(key)} {value}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        """returns the histogram with that name, creating it on first use"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def counter(self, name, help_text):
+        """returns the counter with that name, creating it on first use"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text)
+            return self._metrics[name]
+
+    def gauge(self, name, help_text):
+        """returns the gauge with that name, creating it on first use"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, help_text)
+            return self._metrics[name]
+
+    def render(self):
+        """returns every metric in the prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+SPANS = REGISTRY.histogram("agent_span_seconds", "Duration of the instrumented spans of the agent")
+
+
+def observe_span(name, seconds, **labels):
+    """records a span measured by the caller (also in the trace of the current request)"""
+    if not ENABLED:
+        return
+    SPANS.observe(seconds, span=name, **labels)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.append((name, seconds))
+
+
+class span:
+    """context manager that times a block of code
+
+    Example:
+        with span("rag.chroma_query"):
+            ...
+    """
+
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        if ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if ENABLED:
+            observe_span(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def timed(name):
+    """decorator that records every call of a sync or async function as a span"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe_span(name, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe_span(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def process_start_time():
+    """returns the wall clock time at which this process started
+
+    Read from /proc on Linux so the time spent importing modules counts too,
+    falls back to the import time of this module elsewhere.
+    """
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # el nombre del proceso puede tener espacios: los campos empiezan tras ')'
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _IMPORT_TIME
+
+
+_IMPORT_TIME = time.time()
+
+
+def server_timing(trace):
+    """renders the spans of a request as a Server-Timing header value"""
+    totals = {}
+    for name, seconds in trace:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name.replace('.', '_')};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
@@ -0,0 +1,126 @@
+# === SYSTEM & FILESYSTEM ===
+# Tools for the page files and their memory maps
+import os
+import mmap
+import struct
+import threading
+
+
+class PageStore:
+    """Persistent text of every page of every indexed pdf.
+
+    Each document is stored as two files: `<name>.txt` with the utf-8 text of
+    all its pages one after the other and `<name>.idx` with the byte offset
+    where each page starts (little endian uint64, one more entry than pages).
+    Reads memory-map the text so a page lookup is a slice of the file.
+    """
+
+    _OFFSET = struct.Struct("<Q")
+
+    def __init__(self, folder):
+        """inicializes the store
+
+        Args:
+            folder: folder where the page files are kept
+        """
+        self.folder = folder
+        self._maps = {} # filename -> (offsets, mmap)
+        self._lock = threading.RLock() # reentrante: get lee la página sin soltarlo
+        os.makedirs(folder, exist_ok=True)
+
+    def _paths(self, filename):
+        """returns the text and index paths of a document"""
+        base = os.path.join(self.folder, os.path.basename(filename))
+        return base + ".txt", base + ".idx"
+
+    def write(self, filename, pages):
+        """stores the pages of a document replacing any previous version
+
+        Args:
+            filename: name of the pdf
+            pages: iterable with the text of each page in order
+        """
+        text_path, index_path = self._paths(filename)
+        offsets = [0]
+        with open(text_path + ".tmp", "wb") as f:
+            for page in pages:
+                data = page.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        with open(index_path + ".tmp", "wb") as f:
+            f.write(b"".join(self._OFFSET.pack(offset) for offset in offsets))
+
+        with self._lock:
+            self._close(filename)
+            os.replace(text_path + ".tmp", text_path)
+            os.replace(index_path + ".tmp", index_path)
+
+    def remove(self, filename):
+        """deletes the pages of a document"""
+        with self._lock:
+            self._close(filename)
+            for path in self._paths(filename):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def documents(self):
+        """returns the sorted list of stored filenames"""
+        return sorted(name[:-4] for name in os.listdir(self.folder) if name.endswith(".idx"))
+
+    def page_count(self, filename):
+        """returns the number of pages of a document (0 if it is not stored)"""
+        entry = self._open(filename)
+        return len(entry[0]) - 1 if entry else 0
+
+    def get(self, filename, page):
+        """returns the text of a page
+
+        Args:
+            filename: name of the pdf
+            page: page number starting at 0
+        Returns:
+            str: text of the page or None if the document or the page do not exist
+        """
+        # Leemos con el lock: un close concurrente (descarga de la colección) no cierra el mmap a mitad
+        with self._lock:
+            entry = self._open(filename)
+            if entry is None:
+                return None
+            offsets, text = entry
+            if not 0 <= page < len(offsets) - 1:
+                return None
+            if text is None: # documento sin texto (mmap no admite ficheros vacíos)
+                return ""
+            data = text[offsets[page]:offsets[page + 1]]
+        return data.decode("utf-8")
+
+    def _open(self, filename):
+        """returns (offsets, mmap) of a document opening it on first use"""
+        filename = os.path.basename(filename)
+        with self._lock:
+            if filename in self._maps:
+                return self._maps[filename]
+            text_path, index_path = self._paths(filename)
+            if not os.path.exists(index_path):
+                return None
+            with open(index_path, "rb") as f:
+                data = f.read()
+            offsets = [value for (value,) in self._OFFSET.iter_unpack(data)]
+            text = None
+            if offsets[-1] > 0:
+                with open(text_path, "rb") as f:
+                    text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[filename] = (offsets, text)
+            return self._maps[filename]
+
+    def close(self):
+        """closes every memory map (they are reopened on the next read)"""
+        with self._lock:
+            for filename in list(self._maps):
+                self._close(filename)
+
+    def _close(self, filename):
+        """closes the memory map of a document (must hold the lock)"""
+        entry = self._maps.pop(os.path.basename(filename), None)
+        if entry and entry[1] is not None:
+            entry[1].close()
@@ -0,0 +1,208 @@
+"""
+Second retrieval stage: re-ranking and merging of the first-stage candidates.
+
+The reranker is chosen with AGENT_RERANKER:
+    none           first-stage order (default)
+    lexical        query-term coverage over the candidates, no model needed
+    cross-encoder  a local sentence-transformers CrossEncoder (AGENT_RERANKER_MODEL)
+
+Candidates are (chunk_id, text, metadata) tuples. Rerankers score them in
+batches and give up when the latency budget runs out, so the caller can fall
+back to the first-stage order.
+"""
+
+# === SYSTEM ===
+import os
+import math
+import time
+
+# === LEXICAL SCORING ===
+from utils.lexical_index import tokenize
+
+RERANKERS = ("none", "lexical", "cross-encoder")
+DEFAULT_CROSS_ENCODER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1" # multilingüe y pequeño para CPU
+
+
+class BudgetExceeded(Exception):
+    """The reranker ran out of its latency budget"""
+
+
+class LexicalReranker:
+    """Scores candidates by how much of the query they cover.
+
+    Query terms are weighted by their rarity among the candidates, and
+    candidates that contain the query terms next to each other get a bonus.
+    The first-stage rank breaks ties.
+    """
+
+    def rerank(self, query, candidates, deadline=None):
+        """returns the candidates sorted by score
+
+        Args:
+            query: the query
+            candidates: list of (chunk_id, text, metadata) in first-stage order
+            deadline: time.perf_counter() value after which BudgetExceeded is raised
+        Returns:
+            list: the candidates re-ordered
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return list(candidates)
+        tokenized = [tokenize(text) for _, text, _ in candidates]
+        if deadline is not None and time.perf_counter() > deadline:
+            raise BudgetExceeded()
+
+        n = len(candidates)
+        sets = [set(tokens) for tokens in tokenized]
+        weights = {term: math.log(1 + n / (1 + sum(term in s for s in sets))) for term in terms}
+        total = sum(weights.values())
+        bigrams = set(zip(terms, terms[1:]))
+
+        scores = []
+        for rank, (tokens, token_set) in enumerate(zip(tokenized, sets)):
+            coverage = sum(weights[term] for term in terms if term in token_set) / total
+            adjacency = len(bigrams & set(zip(tokens, tokens[1:]))) / len(bigrams) if bigrams else 0.0
+            scores.append(coverage + 0.5 * adjacency + 1.0 / (60 + rank))
+        order = sorted(range(n), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order]
+
+    def warm_up(self):
+        """nothing to load"""
+
+
+class CrossEncoderReranker:
+    """Scores (query, chunk) pairs with a local cross-encoder model."""
+
+    def __init__(self, model_name=DEFAULT_CROSS_ENCODER, batch_size=8):
+        """loads the model
+
+        Args:
+            model_name: Hugging Face id or local path of the cross-encoder
+            batch_size: pairs scored per forward pass (the budget is checked between batches)
+        """
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def rerank(self, query, candidates, deadline=None):
+        """returns the candidates sorted by cross-encoder score (see LexicalReranker.rerank)"""
+        scores = []
+        for offset in range(0, len(candidates), self.batch_size):
+            if deadline is not None and time.perf_counter() > deadline:
+                raise BudgetExceeded()
+            batch = candidates[offset:offset + self.batch_size]
+            scores.extend(float(s) for s in self.model.predict([(query, text) for _, text, _ in batch]))
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order]
+
+    def warm_up(self):
+        """one forward pass so the first query does not pay for it"""
+        self.model.predict([("warm up", "warm up")])
+
+
+def build_reranker(name=None):
+    """builds the reranker selected by name or AGENT_RERANKER (None for 'none')"""
+    name = name or os.getenv("AGENT_RERANKER", "none")
+    if name == "none":
+        return None
+    if name == "lexical":
+        return LexicalReranker()
+    if name == "cross-encoder":
+        return CrossEncoderReranker(os.getenv("AGENT_RERANKER_MODEL", DEFAULT_CROSS_ENCODER))
+    raise ValueError(f"AGENT_RERANKER must be one of {RERANKERS}, got {name!r}")
+
+
+def _overlap(left, right, max_overlap, min_overlap):
+    """returns the length of the longest suffix of left that is a prefix of right"""
+    for size in range(min(max_overlap, len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_spans(a, b):
+    """joins two (text, metadata) chunks of a document by their offsets
+
+    Returns:
+        tuple: (text, metadata) of the union, or None if the chunks do not overlap
+    """
+    (left, left_meta), (right, right_meta) = sorted((a, b), key=lambda chunk: chunk[1]["start"])
+    if right_meta["start"] > left_meta["end"]:
+        return None
+    text = left + right[left_meta["end"] - right_meta["start"]:] if right_meta["end"] > left_meta["end"] else left
+    metadata = {
+        **left_meta,
+        "page": min(left_meta.get("page", 0), right_meta.get("page", 0)),
+        "page_end": max(left_meta.get("page_end", 0), right_meta.get("page_end", 0)),
+        "end": max(left_meta["end"], right_meta["end"]),
+    }
+    return text, metadata
+
+
+def _join(kept, new, max_overlap, min_overlap):
+    """joins a chunk into a better ranked one if they are neighbours or one contains the other
+
+    Args:
+        kept: (text, metadata) of the better ranked chunk, whose metadata is kept
+        new: (text, metadata) of the other chunk
+    Returns:
+        tuple: (text, metadata) of the union, or None if the chunks are not neighbours
+    """
+    (other_text, other_metadata), (text, metadata) = kept, new
+    if "start" in metadata and "start" in other_metadata:
+        if other_metadata.get("source") != metadata.get("source"):
+            return None
+        return _merge_spans(new, kept)
+    if (other_metadata.get("source"), other_metadata.get("page")) != (metadata.get("source"), metadata.get("page")):
+        return None
+    if text in other_text:
+        return other_text, other_metadata
+    if other_text in text:
+        return text, other_metadata
+    size = _overlap(other_text, text, max_overlap, min_overlap)
+    if size:
+        return other_text + text[size:], other_metadata
+    size = _overlap(text, other_text, max_overlap, min_overlap)
+    if size:
+        return text + other_text[size:], other_metadata
+    return None
+
+
+def merge_chunks(candidates, max_overlap=200, min_overlap=20):
+    """merges neighbouring chunks and drops duplicated ones
+
+    The splitter repeats up to 150 characters between consecutive chunks: when
+    two selected chunks of the same document overlap they are joined into one
+    text without the repeated part, and chunks contained in another selected
+    chunk are dropped. Chunks with character offsets ('start'/'end', see
+    utils.extraction) are merged by position, even across pages; older chunks
+    without them are merged by text overlap within a page. The merged chunk
+    keeps the position of the best ranked of the two, and is compared again
+    with the others, so a chunk that bridges two selected ones joins all three.
+
+    Args:
+        candidates: list of (chunk_id, text, metadata), best first
+        max_overlap: longest overlap looked for
+        min_overlap: shortest overlap considered a neighbour (avoids joining on a shared word)
+    Returns:
+        list: the merged candidates, best first
+    """
+    merged = []
+    for cid, text, metadata in candidates:
+        merged.append((cid, text, metadata))
+        i = len(merged) - 1
+        # Cada unión puede alcanzar otra entrada (A-C y luego B): se repite hasta que no cambie
+        while True:
+            for j in range(len(merged)):
+                if j == i:
+                    continue
+                kept, other = min(i, j), max(i, j)
+                joined = _join(merged[kept][1:], merged[other][1:], max_overlap, min_overlap)
+                if joined is not None:
+                    merged[kept] = (merged[kept][0], *joined)
+                    del merged[other]
+                    i = kept
+                    break
+            else:
+                break
+    return merged
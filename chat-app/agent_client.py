@@ -0,0 +1,194 @@
+# === utilities ===
+import time # for the circuit breaker clock
+import threading # the client is shared by every request thread
+import logging # for logging
+import requests # for http requests
+from requests.adapters import HTTPAdapter # for the connection pool
+from urllib3.util.retry import Retry # for retries with backoff
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised without calling the agent while the circuit is open
+    (a ConnectionError, so callers handle it like an unreachable agent)
+    """
+
+
+def error_detail(error):
+    """
+    Message of an HTTPError of the agent: the 'detail' of its JSON body (FastAPI), or the status line
+    """
+    response = error.response
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    detail = body.get('detail') if isinstance(body, dict) else None
+    if isinstance(detail, list):
+        # 422: one entry per invalid field
+        detail = '; '.join(f"{'.'.join(map(str, item.get('loc', [])))}: {item.get('msg', '')}" for item in detail)
+    return detail or f"{response.status_code} {response.reason or ''}".strip()
+
+
+class CircuitBreaker:
+    """
+    Fails fast when the agent is down
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail immediately for `reset_timeout` seconds. Then a single trial call is
+    let through (half-open): if it succeeds the circuit closes again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        'closed', 'open' or 'half-open'
+        """
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call must not reach the agent
+        """
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial_in_flight):
+                raise CircuitOpenError('Agent circuit is open')
+            if state == 'half-open':
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning(f"Agent circuit opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class AgentClient:
+    """
+    Pooled HTTP client of the agent service
+
+    - one requests.Session with keep-alive connections shared by every thread
+    - a (connect, read) timeout per route
+    - retries with exponential backoff (read errors and 5xx only for idempotent GETs)
+    - a circuit breaker around every call
+    """
+
+    def __init__(self, base_url, pool_size=32, timeouts=None, retries=2, backoff=0.3,
+                 failure_threshold=5, reset_timeout=30):
+        """
+        Args:
+            base_url: url of the agent, e.g. http://agent-container:8000
+            pool_size: keep-alive connections kept open to the agent
+            timeouts: dict route -> (connect, read) seconds for 'search', 'stream' and 'pdf'
+            retries: retries on connection errors, and for idempotent calls also on read errors and 502/503/504
+            backoff: backoff factor of the retries (0.3, 0.6, 1.2... seconds)
+            failure_threshold: consecutive failures that open the circuit
+            reset_timeout: seconds the circuit stays open before a trial call
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeouts = {'search': (5, 120), 'stream': (5, 120), 'pdf': (5, 30)}
+        self.timeouts.update(timeouts or {})
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            # POST /search is not idempotent: it is only retried when the connection failed (nothing was sent)
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method, path, route, **kwargs):
+        """
+        Sends a request through the circuit breaker
+        Connection errors, timeouts and 5xx answers count as failures
+        """
+        self.breaker.before_call()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeouts[route], **kwargs)
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def search(self, text, user_id, collection=None):
+        """
+        Sends a message to the agent and returns its answer (the JSON of /search)
+        The searches run on the given collection (the default one when None)
+        """
+        response = self._request('POST', '/search', 'search', json=self._query(text, user_id, collection))
+        response.raise_for_status()
+        return response.json()
+
+    def stream(self, text, user_id, collection=None):
+        """
+        Sends a message to /search/stream and returns the streamed response (use it as a context manager)
+        The read timeout applies between chunks, not to the whole answer
+        """
+        response = self._request('POST', '/search/stream', 'stream',
+                                 json=self._query(text, user_id, collection), stream=True)
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            # The short error body is read (its detail is shown to the user) and the connection goes back to the pool now
+            response.content
+            response.close()
+            raise
+        return response
+
+    def get_pdf(self, filename, headers=None, stream=False, collection=None):
+        """
+        Requests a PDF from the agent (retried on connection errors)
+        Citations of a non-default collection carry it, so the PDF is looked up there
+        """
+        params = {'file_name': filename}
+        if collection:
+            params['collection'] = collection
+        return self._request('GET', '/get-pdf', 'pdf', params=params, headers=headers, stream=stream)
+
+    @staticmethod
+    def _query(text, user_id, collection):
+        """
+        Body of /search and /search/stream (the agent uses its default collection when none is given)
+        """
+        query = {'text': text, 'User_id': user_id}
+        if collection:
+            query['collection'] = collection
+        return query
@@ -1,5 +1,5 @@
 # === web handler ===
-from flask import Flask, render_template, request, jsonify # for web requests
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g # for web requests
 from flask_cors import CORS # for cross-origin resource sharing
 
 # === utilities ===
@@ -9,8 +9,16 @@ from dotenv import load_dotenv # for environment variables
 
 # === system ===
 import os # for environment variables
-import io # for file handling
+import json # for the streamed events
+import codecs # for decoding the streamed bytes
 import logging # for logging
+from urllib.parse import urlencode # for the collection of the pdf links
+
+# === agent client ===
+from agent_client import AgentClient, error_detail # pooled keep-alive client with timeouts, retries and a circuit breaker
+
+# === sessions ===
+from sessions import SessionStore, new_session_id, is_valid_session_id # per-browser bounded histories
 
 
 # Configure logging
@@ -23,7 +31,28 @@ load_dotenv()
 # Agent Service Configuration
 AGENT_SERVICE_HOST = os.getenv('AGENT_SERVICE_HOST')
 AGENT_SERVICE_PORT = os.getenv('AGENT_SERVICE_PORT')
-AGENT_SERVICE_URL = f"http://{AGENT_SERVICE_HOST}:{AGENT_SERVICE_PORT}/search" # Agent Service URL
+AGENT_BASE_URL = f"http://{AGENT_SERVICE_HOST}:{AGENT_SERVICE_PORT}" # Agent Service URL
+
+def _timeout(name, default):
+    """
+    Reads a (connect, read) timeout from the environment, e.g. AGENT_TIMEOUT_SEARCH=5,120
+    """
+    connect, read = os.getenv(name, default).split(',')
+    return (float(connect), float(read))
+
+# Shared by every request thread: connections to the agent are reused (keep-alive)
+agent_client = AgentClient(
+    AGENT_BASE_URL,
+    pool_size=int(os.getenv('AGENT_POOL_SIZE', '32')),
+    timeouts={
+        'search': _timeout('AGENT_TIMEOUT_SEARCH', '5,120'),
+        'stream': _timeout('AGENT_TIMEOUT_STREAM', '5,120'),
+        'pdf': _timeout('AGENT_TIMEOUT_PDF', '5,30'),
+    },
+    retries=int(os.getenv('AGENT_RETRIES', '2')),
+    failure_threshold=int(os.getenv('AGENT_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('AGENT_BREAKER_RESET_S', '30'))
+)
 
 # Initialize Flask application
 app = Flask(__name__)
@@ -31,8 +60,42 @@ app = Flask(__name__)
 # Enable CORS (Cross-Origin Resource Sharing)
 CORS(app)
 
-# Store chat messages in memory (resets when container restarts)
-chat_history = [] # non production ready
+# Session cookie: identifies the browser, its history and its agent thread
+SESSION_COOKIE = 'chat_session'
+SESSION_TTL_SECONDS = int(os.getenv('CHAT_SESSION_TTL_S', str(24 * 3600)))
+
+# Store chat messages in memory per session (resets when container restarts)
+sessions = SessionStore(
+    max_sessions=int(os.getenv('CHAT_MAX_SESSIONS', '10000')),
+    max_messages=int(os.getenv('CHAT_MAX_MESSAGES', '200')),
+    ttl_seconds=SESSION_TTL_SECONDS
+)
+
+
+@app.before_request
+def load_session():
+    """
+    Reads the session id from the cookie, or creates a new one for new browsers
+    """
+    session_id = request.cookies.get(SESSION_COOKIE)
+    g.new_session = not is_valid_session_id(session_id)
+    g.session_id = new_session_id() if g.new_session else session_id
+
+
+@app.after_request
+def save_session(response):
+    """
+    Sends the cookie when the session id is new (first visit or cleared chat)
+    """
+    if g.get('new_session'):
+        response.set_cookie(
+            SESSION_COOKIE, g.session_id,
+            max_age=SESSION_TTL_SECONDS,
+            httponly=True,
+            samesite='Lax',
+            secure=os.getenv('SESSION_COOKIE_SECURE', '0') == '1'
+        )
+    return response
 
 
 @app.route('/')
@@ -70,20 +133,15 @@ def send_message():
         'timestamp': timestamp
     }
 
-    # Inside another container on the same network:
-    payload = {
-        "text": user_message,
-        "User_id": 'user' # no user id for now
-    }
-
     try:
-        # communicate with agent service
-        response = requests.post(AGENT_SERVICE_URL, json=payload)
-        response.raise_for_status()
-        
-        agent_data = response.json()
+        # communicate with agent service (each browser session has its own agent thread)
+        agent_data = agent_client.search(user_message, g.session_id, collection=data.get('collection'))
         # check if the response has a message field and saves the message
         bot_response_text = agent_data.get('message', 'Something is wrong with the agent')
+    except requests.exceptions.HTTPError as e:
+        # The agent answered with an error (unknown collection, invalid request...): show its reason
+        logger.error(f"Agent returned error {e.response.status_code}: {error_detail(e)}")
+        bot_response_text = f"System Error: {error_detail(e)}"
     except requests.exceptions.RequestException as e:
         logger.error(f"Connection to Agent Failed: {e}")
         bot_response_text = "System Error: Agent is unreachable."
@@ -94,9 +152,8 @@ def send_message():
         'timestamp': timestamp
     }
     
-    # Add both messages to our chat history
-    chat_history.append(user_msg)
-    chat_history.append(bot_msg)
+    # Add both messages to the history of this session
+    sessions.append(g.session_id, user_msg, bot_msg)
     
     # Return the bot's response as JSON
     return jsonify({
@@ -105,81 +162,197 @@ def send_message():
     })
 
 
+@app.route('/api/stream', methods=['POST'])
+def stream_message():
+    """
+    Streaming version of /api/send
+    Forwards the server-sent events of the agent to the browser chunk by chunk
+    (no buffering) and saves the final answer in the history when it arrives
+    """
+    data = request.get_json()
+    user_message = data.get('message', '')
+    
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    timestamp = datetime.now().strftime('%H:%M:%S')
+    session_id = g.session_id # the generator runs after the request context is gone
+    collection = data.get('collection')
+
+    def generate():
+        buffer = ''
+        decoder = codecs.getincrementaldecoder('utf-8')() # a character can be split between chunks
+        bot_response_text = None
+        try:
+            # the read timeout of the stream applies between chunks, not to the whole answer
+            with agent_client.stream(user_message, session_id, collection=collection) as response:
+                for chunk in response.iter_content(chunk_size=None):
+                    yield chunk
+                    # We also parse the events to keep the final answer for the history
+                    buffer += decoder.decode(chunk)
+                    while '\n\n' in buffer:
+                        event, buffer = buffer.split('\n\n', 1)
+                        if event.startswith('data: '):
+                            event = json.loads(event[len('data: '):])
+                            if event.get('type') in ('done', 'error'):
+                                bot_response_text = event.get('content', '')
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"Agent returned error {e.response.status_code}: {error_detail(e)}")
+            bot_response_text = f"System Error: {error_detail(e)}"
+            yield f"data: {json.dumps({'type': 'error', 'content': bot_response_text})}\n\n"
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Connection to Agent Failed: {e}")
+            bot_response_text = "System Error: Agent is unreachable."
+            yield f"data: {json.dumps({'type': 'error', 'content': bot_response_text})}\n\n"
+
+        sessions.append(
+            session_id,
+            {'type': 'user', 'content': user_message, 'timestamp': timestamp},
+            {
+                'type': 'bot',
+                'content': bot_response_text or 'Something is wrong with the agent',
+                'timestamp': timestamp
+            }
+        )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     """
-    API endpoint to retrieve all previous chat messages
-    Useful when the page reloads or a new user joins
+    API endpoint to retrieve the chat messages of this session, one page at a time
+    Useful when the page reloads
+
+    Query parameters:
+        limit: messages per page (default 50, at most 200)
+        before: index where the page ends (the 'next_before' of the previous page),
+            omitted for the latest messages
     """
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        before = request.args.get('before')
+        before = int(before) if before is not None else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit and before must be integers'}), 400
+
+    messages, total, start = sessions.page(g.session_id, limit=limit, before=before)
     return jsonify({
         'success': True,
-        'messages': chat_history
+        'messages': messages,
+        'total': total,
+        'next_before': start if start > 0 else None # None when there are no older messages
     })
 
 
 @app.route('/api/clear', methods=['POST'])
 def clear_history():
     """
-    API endpoint to clear all chat history
-    Demonstrates how to modify global state in Flask
+    API endpoint to clear the chat history of this session
+    A new session id is issued, so the agent also starts a fresh conversation
     """
-    global chat_history
-    chat_history = []
+    sessions.clear(g.session_id)
+    g.session_id = new_session_id()
+    g.new_session = True
     return jsonify({
         'success': True,
         'message': 'Chat history cleared'
     })
 
-@app.route('/api/get-pdf/<filename>')
-def get_pdf_from_agent(filename):
+# Headers of the browser forwarded to the agent and of the agent forwarded back
+PDF_REQUEST_HEADERS = ('Range', 'If-Range', 'If-None-Match')
+PDF_RESPONSE_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges',
+                        'ETag', 'Last-Modified', 'Cache-Control', 'Content-Disposition')
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+def _pdf_name(filename):
     """
-    Tries to fetch a PDF from the agent service and save it locally in static/
+    Cleans a pdf name coming from a citation link ('doc.pdf#page=5' -> 'doc.pdf')
     """
-    # 1. clean the extension to avoid duplicates like .pdf.pdf
-    filename = filename.split('#')[0]
+    filename = os.path.basename(filename.split('#')[0])
     if not filename.lower().endswith('.pdf'):
         filename += '.pdf'
-    
-    # 2. configure the pdf service route
-    AGENT_PDF_URL = f"http://{AGENT_SERVICE_HOST}:{AGENT_SERVICE_PORT}/get-pdf"
-    
+    return filename
+
+
+@app.route('/api/pdf/<path:filename>')
+def stream_pdf(filename):
+    """
+    Streams a PDF from the agent to the browser chunk by chunk (never held in memory)
+    Range requests (206) and ETag revalidation (304) are passed through, so the
+    viewer only downloads the pages it shows and a repeated open costs a 304
+    The ?collection= of a citation link is forwarded (the default collection without it)
+    """
+    filename = _pdf_name(filename)
+    collection = request.args.get('collection')
+    headers = {name: request.headers[name] for name in PDF_REQUEST_HEADERS if name in request.headers}
+
+    try:
+        upstream = agent_client.get_pdf(filename, headers=headers, stream=True, collection=collection)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Connection to Agent Failed: {e}")
+        return jsonify({'success': False, 'error': 'Agent is unreachable'}), 503
+
+    if upstream.status_code not in (200, 206, 304):
+        upstream.close()
+        logger.error(f"Agent returned error {upstream.status_code} for file {filename}")
+        return jsonify({'success': False, 'error': 'PDF not found on agent'}), upstream.status_code
+
+    headers = {name: upstream.headers[name] for name in PDF_RESPONSE_HEADERS if name in upstream.headers}
+    if upstream.status_code == 304:
+        # No body to relay: the connection goes back to the pool now
+        upstream.close()
+        return Response(status=304, headers=headers)
+
+    def generate():
+        with upstream:
+            for chunk in upstream.iter_content(chunk_size=PDF_CHUNK_SIZE):
+                yield chunk
+
+    response = Response(
+        stream_with_context(generate()),
+        status=upstream.status_code,
+        headers=headers,
+        direct_passthrough=True
+    )
+    # If the browser goes away before the body is read, generate() never runs: close it here too
+    response.call_on_close(upstream.close)
+    return response
+
+
+@app.route('/api/get-pdf/<filename>')
+def get_pdf_from_agent(filename):
+    """
+    Kept for old clients: checks that the agent has the PDF and returns the
+    /api/pdf/ route that streams it (nothing is downloaded to static/ anymore)
+    """
+    filename = _pdf_name(filename)
+    collection = request.args.get('collection')
     try:
-        logger.info(f"Requesting {filename} from agent container at {AGENT_PDF_URL}...")
-        
-        # 3. request to the pdf service
-        response = requests.get(AGENT_PDF_URL, params={'file_name': filename}, timeout=10)
-        
-        if response.status_code == 200:
-            # 4. prepare the path and folder
-            # os.path.join ensures the path is valid in Linux (Docker)
-            static_folder = os.path.join(app.root_path, 'static')
-            target_path = os.path.join(static_folder, filename)
-            
-            # 5. create the folder if it doesn't exist
-            # This avoids the "No such file or directory" error
-            os.makedirs(static_folder, exist_ok=True)
-            
-            # 6. write the file
-            # 'wb' is for writing bytes (Binary)
-            with open(target_path, 'wb') as f:
-                f.write(response.content)
-            
-            logger.info(f"Success! {filename} saved to {target_path}")
-            return jsonify({'success': True, 'path': f'/static/{filename}'})
-        
-        else:
-            logger.error(f"Agent returned error {response.status_code} for file {filename}")
-            return jsonify({'success': False, 'error': 'PDF not found on agent'}), 404
-            
-    except Exception as e:
-        # catch connection or write permissions errors
-        logger.error(f"Critical Error: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        # A 1-byte range is enough to know if the file exists
+        with agent_client.get_pdf(filename, headers={'Range': 'bytes=0-0'}, stream=True, collection=collection) as response:
+            found = response.status_code in (200, 206)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Connection to Agent Failed: {e}")
+        return jsonify({'success': False, 'error': 'Agent is unreachable'}), 503
+
+    if not found:
+        logger.error(f"Agent returned error {response.status_code} for file {filename}")
+        return jsonify({'success': False, 'error': 'PDF not found on agent'}), 404
+    path = f'/api/pdf/{filename}'
+    if collection:
+        path += '?' + urlencode({'collection': collection})
+    return jsonify({'success': True, 'path': path})
 
 
 if __name__ == '__main__':
-    # Run the Flask development server
+    # Run the Flask development server (the container runs gunicorn, see gunicorn.conf.py)
     # host='0.0.0.0' makes it accessible from outside the container
     # port=5000 is the standard Flask port
-    # debug=True enables hot reloading and better error messages
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # FLASK_DEBUG=1 enables hot reloading and better error messages
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG', '0') == '1')
\ No newline at end of file
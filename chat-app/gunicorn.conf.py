@@ -0,0 +1,22 @@
+# Gunicorn settings of the Flask app (read from the environment)
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# gthread: each worker serves many requests at once with threads, which suits a proxy
+# that spends its time waiting on the agent (streamed answers keep a thread busy)
+worker_class = 'gthread'
+# The chat histories live in the memory of each process: keep 1 worker unless
+# the load balancer pins every session to the same worker
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+# Requests to the agent have their own timeouts (agent_client.py); this one only
+# restarts a worker that stops answering the arbiter
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '180'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
@@ -0,0 +1,97 @@
+# === system ===
+import re # for validating session ids
+import time # for the idle time of each session
+import secrets # for unguessable session ids
+import threading # the store is shared by every request thread
+from collections import OrderedDict, deque # LRU order of the sessions and bounded histories
+
+
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def new_session_id():
+    """
+    Returns a new random session id (also used as the agent's thread id)
+    """
+    return secrets.token_urlsafe(24)
+
+
+def is_valid_session_id(session_id):
+    """
+    Checks that a session id coming from a cookie has the expected shape
+    """
+    return bool(session_id) and SESSION_ID_RE.match(session_id) is not None
+
+
+class SessionStore:
+    """
+    In-memory chat histories, one per browser session
+
+    Bounded in every dimension so it never grows with the traffic:
+    - each session keeps its last `max_messages` messages
+    - at most `max_sessions` sessions are kept (least recently used are dropped)
+    - sessions idle for more than `ttl_seconds` are dropped
+    """
+
+    def __init__(self, max_sessions=10000, max_messages=200, ttl_seconds=24 * 3600):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict() # session id -> (last access, deque of messages)
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        """
+        Drops expired sessions and the least recently used ones over the limit (must hold the lock)
+        """
+        now = time.monotonic()
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - last_access > self.ttl_seconds:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def append(self, session_id, *messages):
+        """
+        Adds messages to the history of a session
+        """
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[1] if entry else deque(maxlen=self.max_messages)
+            history.extend(messages)
+            self._sessions[session_id] = (time.monotonic(), history)
+            self._evict()
+
+    def page(self, session_id, limit=50, before=None):
+        """
+        Returns a page of the history of a session, oldest message first
+
+        Args:
+            session_id: the session
+            limit: maximum number of messages
+            before: index (in the current history) where the page ends, None for the latest messages
+        Returns:
+            tuple: (messages, total number of messages, index where the page starts)
+        """
+        with self._lock:
+            self._evict()
+            # Reading is activity too: the session moves to the end of the LRU order and its TTL restarts
+            entry = self._sessions.pop(session_id, None)
+            history = list(entry[1]) if entry else []
+            if entry:
+                self._sessions[session_id] = (time.monotonic(), entry[1])
+        total = len(history)
+        end = total if before is None else max(0, min(before, total))
+        start = max(0, end - limit)
+        return history[start:end], total, start
+
+    def clear(self, session_id):
+        """
+        Removes the history of a session
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
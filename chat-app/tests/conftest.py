@@ -0,0 +1,81 @@
+"""
+Shared fixtures of the chat-app tests.
+
+The agent is never contacted: `fake_agent` replaces the socket level of
+urllib3, so the pool, the retries of AgentClient and the circuit breaker run
+as in production against scripted answers.
+"""
+
+# === SYSTEM ===
+import io
+import os
+import sys
+import json
+from http import HTTPStatus
+
+# === TESTING ===
+import pytest
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.response import HTTPResponse
+
+# Los tests importan los módulos como lo hace gunicorn (app, agent_client, sessions)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AGENT_SERVICE_HOST', 'agent.test')
+os.environ.setdefault('AGENT_SERVICE_PORT', '8000')
+
+
+class FakeAgent:
+    """
+    Scripted answers of the agent, one per request that reaches the network
+
+    Each answer is an exception instance (raised as the socket error) or a
+    (status, body, headers) tuple; body may be a dict (sent as JSON) or bytes.
+    """
+
+    def __init__(self):
+        self.answers = []
+        self.requests = [] # (method, url, headers)
+        self.responses = []
+
+    def reply(self, *answers):
+        self.answers.extend(answers)
+
+    def _make_request(self, pool, conn, method, url, headers=None, preload_content=True,
+                      decode_content=True, response_conn=None, **kwargs):
+        self.requests.append((method, url, dict(headers or {})))
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        status, body, *extra = answer
+        response_headers = dict(extra[0]) if extra else {}
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            response_headers = {'Content-Type': 'application/json', **response_headers}
+        response = HTTPResponse(
+            body=io.BytesIO(body), headers={'Content-Length': str(len(body)), **response_headers},
+            status=status, reason=HTTPStatus(status).phrase, preload_content=preload_content, decode_content=decode_content,
+            request_method=method, request_url=url, pool=pool, connection=response_conn
+        )
+        self.responses.append(response)
+        return response
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    agent = FakeAgent()
+    monkeypatch.setattr(HTTPConnectionPool, '_make_request',
+                        lambda pool, conn, method, url, **kwargs: agent._make_request(pool, conn, method, url, **kwargs))
+    return agent
+
+
+class FakeClock:
+    """monotonic clock moved by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
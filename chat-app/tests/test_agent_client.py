@@ -0,0 +1,98 @@
+"""AgentClient: circuit breaker, retry policy and the errors the chat shows."""
+
+# === SYSTEM ===
+import pytest
+import requests
+from urllib3.exceptions import NewConnectionError, ReadTimeoutError
+
+from conftest import FakeClock
+import agent_client
+from agent_client import AgentClient, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(agent_client, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def client():
+    return AgentClient('http://agent.test:8000', retries=2, backoff=0, failure_threshold=2, reset_timeout=30)
+
+
+def test_breaker_opens_and_lets_one_trial_through_when_half_open(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.sleep(30)
+    assert breaker.state == 'half-open'
+    breaker.before_call() # la llamada de prueba
+    with pytest.raises(CircuitOpenError): # solo una a la vez
+        breaker.before_call()
+    # Si la prueba falla vuelve a abrirse otros reset_timeout segundos
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.sleep(29)
+    assert breaker.state == 'open'
+    clock.sleep(1)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+    breaker.before_call()
+    breaker.before_call()
+
+
+def test_read_errors_are_retried_only_for_gets(client, fake_agent, clock):
+    fake_agent.reply(ReadTimeoutError(None, '/get-pdf', 'read timed out'), (200, b'%PDF-'))
+    assert client.get_pdf('a.pdf').content == b'%PDF-'
+    assert [method for method, _, _ in fake_agent.requests] == ['GET', 'GET']
+
+    fake_agent.reply(ReadTimeoutError(None, '/search', 'read timed out'))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.search('hola', 'user')
+    assert [method for method, _, _ in fake_agent.requests[2:]] == ['POST']
+
+
+def test_connection_errors_are_retried_for_every_method(client, fake_agent, clock):
+    fake_agent.reply(NewConnectionError(None, 'connection refused'), (200, {'message': 'hola'}))
+    assert client.search('hola', 'user') == {'message': 'hola'}
+    assert len(fake_agent.requests) == 2
+
+
+def test_5xx_is_retried_for_gets_and_opens_the_circuit(client, fake_agent, clock):
+    fake_agent.reply((503, b''), (503, b''), (503, b''))
+    assert client.get_pdf('a.pdf').status_code == 503
+    assert len(fake_agent.requests) == 3 # la primera y dos reintentos
+    assert client.breaker.failures == 1
+
+    fake_agent.reply((500, {'detail': 'boom'}))
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.search('hola', 'user')
+    assert len(fake_agent.requests) == 4 # POST sin reintento
+    # Dos fallos seguidos abren el circuito: la siguiente llamada no llega al agente
+    with pytest.raises(CircuitOpenError):
+        client.search('hola', 'user')
+    assert len(fake_agent.requests) == 4
+
+    clock.sleep(30)
+    fake_agent.reply((200, {'message': 'ok'}))
+    assert client.search('hola', 'user') == {'message': 'ok'}
+    assert client.breaker.state == 'closed'
+
+
+def test_4xx_does_not_count_as_a_failure(client, fake_agent, clock):
+    fake_agent.reply(*[(404, {'detail': "collection 'x' not found"})] * 3)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.HTTPError) as error:
+            client.search('hola', 'user', collection='x')
+        assert agent_client.error_detail(error.value) == "collection 'x' not found"
+    assert client.breaker.state == 'closed'
@@ -0,0 +1,43 @@
+"""Flask routes: errors of the agent shown in the chat."""
+
+# === SYSTEM ===
+import json
+
+import pytest
+from urllib3.exceptions import NewConnectionError
+
+import app as chat_app
+from agent_client import AgentClient
+
+
+@pytest.fixture
+def client(monkeypatch, fake_agent):
+    # Un cliente por test: el circuito de uno no se abre por los fallos de otro
+    monkeypatch.setattr(chat_app, 'agent_client', AgentClient(chat_app.AGENT_BASE_URL, backoff=0))
+    return chat_app.app.test_client()
+
+
+@pytest.mark.parametrize('status, body, expected', [
+    (404, {'detail': "collection 'x' not found"}, "System Error: collection 'x' not found"),
+    (422, {'detail': [{'loc': ['body', 'text'], 'msg': 'Field required'}]}, 'System Error: body.text: Field required'),
+    (500, b'Internal Server Error', 'System Error: 500 Internal Server Error'),
+])
+def test_send_shows_the_reason_of_an_agent_error(client, fake_agent, status, body, expected):
+    fake_agent.reply((status, body))
+    response = client.post('/api/send', json={'message': 'hola', 'collection': 'x'})
+    assert response.get_json()['response']['content'] == expected
+    assert client.get('/api/history').get_json()['messages'][-1]['content'] == expected
+
+
+def test_send_reports_an_unreachable_agent(client, fake_agent):
+    fake_agent.reply(*[NewConnectionError(None, 'connection refused')] * 3)
+    response = client.post('/api/send', json={'message': 'hola'})
+    assert response.get_json()['response']['content'] == 'System Error: Agent is unreachable.'
+
+
+def test_stream_shows_the_reason_of_an_agent_error(client, fake_agent):
+    fake_agent.reply((404, {'detail': "collection 'x' not found"}))
+    body = client.post('/api/stream', json={'message': 'hola', 'collection': 'x'}).get_data(as_text=True)
+    events = [json.loads(line[len('data: '):]) for line in body.split('\n\n') if line.startswith('data: ')]
+    assert events == [{'type': 'error', 'content': "System Error: collection 'x' not found"}]
+    assert all(response.closed for response in fake_agent.responses)
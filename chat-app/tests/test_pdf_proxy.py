@@ -0,0 +1,54 @@
+"""/api/pdf: headers forwarded both ways and the upstream response always closed."""
+
+# === SYSTEM ===
+import pytest
+
+import app as chat_app
+from agent_client import AgentClient
+
+PDF = b'%PDF-1.4 ' + bytes(range(256)) * 1024 # varios bloques de PDF_CHUNK_SIZE
+
+
+@pytest.fixture
+def client(monkeypatch, fake_agent):
+    monkeypatch.setattr(chat_app, 'agent_client', AgentClient(chat_app.AGENT_BASE_URL, backoff=0))
+    return chat_app.app.test_client()
+
+
+def test_range_is_forwarded_and_206_relayed(client, fake_agent):
+    fake_agent.reply((206, PDF[10:20], {'Content-Range': f'bytes 10-19/{len(PDF)}', 'ETag': '"v1"',
+                                        'Content-Type': 'application/pdf', 'X-Interno': 'no'}))
+    response = client.get('/api/pdf/libro.pdf?collection=proj',
+                          headers={'Range': 'bytes=10-19', 'If-Range': '"v1"', 'Cookie': 'chat_session=x'})
+    assert response.status_code == 206 and response.data == PDF[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(PDF)}' and response.headers['ETag'] == '"v1"'
+    assert 'X-Interno' not in response.headers
+
+    method, url, headers = fake_agent.requests[-1]
+    assert method == 'GET' and url == '/get-pdf?file_name=libro.pdf&collection=proj'
+    assert headers['Range'] == 'bytes=10-19' and headers['If-Range'] == '"v1"'
+    assert 'Cookie' not in headers
+    assert fake_agent.responses[-1].closed
+
+
+def test_if_none_match_is_forwarded_and_304_relayed(client, fake_agent):
+    fake_agent.reply((304, b'', {'ETag': '"v1"'}))
+    response = client.get('/api/pdf/libro.pdf#page=2', headers={'If-None-Match': '"v1"'})
+    assert response.status_code == 304 and response.headers['ETag'] == '"v1"'
+    assert fake_agent.requests[-1][2]['If-None-Match'] == '"v1"'
+    assert fake_agent.responses[-1].closed
+
+
+def test_agent_errors_close_the_upstream(client, fake_agent):
+    fake_agent.reply((404, {'error': 'Archivo no encontrado'}))
+    assert client.get('/api/pdf/otro.pdf').status_code == 404
+    assert fake_agent.responses[-1].closed
+
+
+def test_upstream_is_closed_when_the_browser_leaves_early(client, fake_agent):
+    fake_agent.reply((200, PDF, {'Content-Type': 'application/pdf'}))
+    response = client.get('/api/pdf/libro.pdf', buffered=False)
+    assert response.status_code == 200
+    assert not fake_agent.responses[-1].closed # stream_with_context ya leyó el primer bloque
+    response.close() # el navegador se va sin leer el cuerpo
+    assert fake_agent.responses[-1].closed
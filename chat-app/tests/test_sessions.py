@@ -0,0 +1,57 @@
+"""SessionStore: LRU and TTL bounds, pagination, and reads that keep a session alive."""
+
+# === SYSTEM ===
+import pytest
+
+from conftest import FakeClock
+import sessions
+from sessions import SessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sessions, 'time', clock)
+    return clock
+
+
+def _messages(n):
+    return [{'type': 'user', 'content': f'm{i}'} for i in range(n)]
+
+
+def test_least_recently_used_session_is_dropped(clock):
+    store = SessionStore(max_sessions=2)
+    store.append('a', *_messages(1))
+    store.append('b', *_messages(1))
+    store.page('a') # leer también cuenta como uso
+    store.append('c', *_messages(1))
+    assert len(store) == 2
+    assert store.page('b') == ([], 0, 0)
+    assert store.page('a')[1] == 1 and store.page('c')[1] == 1
+
+
+def test_idle_sessions_expire_but_reads_keep_them_alive(clock):
+    store = SessionStore(ttl_seconds=60)
+    store.append('leida', *_messages(1))
+    store.append('olvidada', *_messages(1))
+    for _ in range(3):
+        clock.sleep(40)
+        assert store.page('leida')[1] == 1
+    assert store.page('olvidada') == ([], 0, 0)
+    assert len(store) == 1
+
+
+def test_pages_walk_back_with_before(clock):
+    store = SessionStore(max_messages=120)
+    store.append('s', *_messages(130)) # solo se guardan los últimos max_messages
+    messages, total, start = store.page('s', limit=50)
+    assert total == 120 and start == 70
+    assert [m['content'] for m in messages] == [f'm{i}' for i in range(80, 130)]
+
+    seen = messages
+    while start > 0:
+        messages, _, start = store.page('s', limit=50, before=start)
+        seen = messages + seen
+    assert [m['content'] for m in seen] == [f'm{i}' for i in range(10, 130)]
+    assert store.page('s', limit=50, before=500)[2] == 70 # before se recorta al historial
+    assert store.page('s', limit=5, before=0) == ([], 120, 0)